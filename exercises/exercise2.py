@@ -1,17 +1,25 @@
+import math
 import pandas as pd
 import re
 import sqlalchemy as sql
 import urllib.request as req
 
-from io import StringIO
+CSV_URL = 'https://download-data.deutschebahn.com/static/datasets/haltestellen/D_Bahnhof_2020_alle.CSV'
+VALID_VERKEHR = ['FV', 'RV', 'nur DPN']
+IFOPT_PATTERN = re.compile(r'^[A-Za-z]{2}:\d+:\d+(:\d+)?$')
+
+EARTH_RADIUS_KM = 6371.0088
+# The k nearest stations are searched within a radius doubled from this one until k stations are found
+NEAREST_START_RADIUS_KM = 2.0
 
 
 def retrieve_csv_data(url):
+    # The response is parsed while it is streamed, so the file is never held in memory as bytes and as string
     try:
-        response = req.urlopen(url)
-        if response.getcode() == 200:
-            print('CSV fetched correctly.')
-            return response.read().decode('utf-8')
+        with req.urlopen(url) as response:
+            if response.getcode() == 200:
+                print('CSV fetched correctly.')
+                return pd.read_csv(response, sep=';', decimal=',', encoding='utf-8')
     except Exception as e:
         print(f'CSV could not be reached: {e}')
         return None
@@ -20,20 +28,10 @@ def retrieve_csv_data(url):
 def alter_csv_data(untidy_df):
     untidy_df.drop(columns='Status')
 
-    def is_valid_verkehr(value):
-        return value in ['FV', 'RV', 'nur DPN']
-
-    def is_valid_coord(value):
-        return -90 <= value <= 90
-
-    def is_valid_ifopt(value):
-        ifopt_pattern = r'^[A-Za-z]{2}:\d+:\d+(:\d+)?$'
-        bool(re.match(ifopt_pattern, str(value)))
-
-    valid_verkehr = untidy_df.Verkehr.apply(is_valid_verkehr)
-    valid_laenge = untidy_df.Laenge.apply(is_valid_coord)
-    valid_breite = untidy_df.Breite.apply(is_valid_coord)
-    valid_ifopt = untidy_df.IFOPT.apply(is_valid_ifopt)
+    valid_verkehr = untidy_df.Verkehr.isin(VALID_VERKEHR)
+    valid_laenge = untidy_df.Laenge.between(-90, 90)
+    valid_breite = untidy_df.Breite.between(-90, 90)
+    valid_ifopt = untidy_df.IFOPT.astype(str).str.match(IFOPT_PATTERN)
 
     valid_rows = valid_verkehr & valid_laenge & valid_breite & valid_ifopt
     tidy_df = untidy_df[valid_rows].dropna()
@@ -49,20 +47,115 @@ def create_sqlite_db(sql_data, db_name, table_name):
             'IFOPT': sql.Text
         }
         sql_data.to_sql(table_name, engine, index=False, dtype=data_types, if_exists='replace')
+        create_spatial_index(engine, table_name)
     except Exception as e:
         print(f'SQLite database could not be created: {e}')
 
 
-# Fetching csv data from url
-csv_url = 'https://download-data.deutschebahn.com/static/datasets/haltestellen/D_Bahnhof_2020_alle.CSV'
-csv_data = retrieve_csv_data(csv_url)
+def spatial_index_name(table_name):
+    return f'{table_name}_rtree'
 
-# Alter data in the database
-df = pd.read_csv(StringIO(csv_data), sep=';', decimal=',')
-altered_df = alter_csv_data(df)
 
-# Write data to SQLite database
-if csv_data:
-    create_sqlite_db(sql_data=altered_df, db_name='trainstops.sqlite', table_name='trainstops')
-else:
-    print('No csv_data available, could not create database')
+def create_spatial_index(engine, table_name):
+    """
+    Builds an R*Tree over the coordinates of the stations, whose ids are the rowids of the table. The table is replaced
+    on every run, so the index is built again as well.
+    :param engine: SQLite database engine.
+    :param table_name: The table holding the Laenge and Breite of the stations.
+    """
+    index_name = spatial_index_name(table_name)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f'DROP TABLE IF EXISTS "{index_name}"')
+        cursor.execute(f'CREATE VIRTUAL TABLE "{index_name}" USING rtree(id, min_laenge, max_laenge, min_breite, '
+                       f'max_breite)')
+        cursor.execute(f'INSERT INTO "{index_name}" SELECT rowid, Laenge, Laenge, Breite, Breite FROM "{table_name}"')
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def haversine_km(laenge, breite, other_laenge, other_breite):
+    delta_laenge, delta_breite = math.radians(other_laenge - laenge), math.radians(other_breite - breite)
+    a = math.sin(delta_breite / 2) ** 2 \
+        + math.cos(math.radians(breite)) * math.cos(math.radians(other_breite)) * math.sin(delta_laenge / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(laenge, breite, radius_km):
+    """
+    :return: Tuple of the smallest and largest Laenge and Breite of all points within the radius around the point. The
+    Laengen are not wrapped around the antimeridian, all stations lie in Germany.
+    """
+    delta_breite = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_breite, max_breite = breite - delta_breite, breite + delta_breite
+    if min_breite <= -90 or max_breite >= 90:
+        # The circle covers a pole, so it covers all Laengen
+        return -180.0, 180.0, max(min_breite, -90.0), min(max_breite, 90.0)
+    delta_laenge = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM)
+                                              / math.cos(math.radians(breite)))))
+    return laenge - delta_laenge, laenge + delta_laenge, min_breite, max_breite
+
+
+def find_stations_within(connection, laenge, breite, radius_km, table_name='trainstops'):
+    """
+    Looks up the stations in the bounding box of the radius in the R*Tree and keeps the ones within the radius, so only
+    the stations near the point are read.
+    :param connection: Connection to the SQLite database, e.g. engine.raw_connection().
+    :param laenge: Laenge of the point.
+    :param breite: Breite of the point.
+    :param radius_km: Radius around the point in kilometres.
+    :param table_name: The table holding the stations, see create_spatial_index.
+    :return: List of tuples of the distance in kilometres and the station as dictionary, sorted by distance.
+    """
+    min_laenge, max_laenge, min_breite, max_breite = bounding_box(laenge, breite, radius_km)
+    cursor = connection.cursor()
+    cursor.execute(
+        f'SELECT t.* FROM "{spatial_index_name(table_name)}" AS r JOIN "{table_name}" AS t ON t.rowid = r.id '
+        f'WHERE r.max_laenge >= ? AND r.min_laenge <= ? AND r.max_breite >= ? AND r.min_breite <= ?',
+        (min_laenge, max_laenge, min_breite, max_breite)
+    )
+    columns = [column[0] for column in cursor.description]
+    stations = []
+    for row in cursor.fetchall():
+        station = dict(zip(columns, row))
+        distance_km = haversine_km(laenge, breite, station['Laenge'], station['Breite'])
+        if distance_km <= radius_km:
+            stations.append((distance_km, station))
+    return sorted(stations, key=lambda item: item[0])
+
+
+def find_nearest_stations(connection, laenge, breite, k=1, table_name='trainstops'):
+    """
+    :param connection: Connection to the SQLite database, e.g. engine.raw_connection().
+    :param laenge: Laenge of the point.
+    :param breite: Breite of the point.
+    :param k: Number of stations.
+    :param table_name: The table holding the stations, see create_spatial_index.
+    :return: List of tuples of the distance in kilometres and the station as dictionary of the k nearest stations,
+    sorted by distance. Fewer if the table holds fewer stations.
+    """
+    radius_km = NEAREST_START_RADIUS_KM
+    while True:
+        stations = find_stations_within(connection, laenge, breite, radius_km, table_name)
+        # Every station outside of the radius is further away than the ones found within it
+        if len(stations) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+            return stations[:k]
+        radius_km *= 2
+
+
+def main(csv_url=CSV_URL, db_name='trainstops.sqlite'):
+    # Fetching csv data from url
+    df = retrieve_csv_data(csv_url)
+
+    # Write data to SQLite database
+    if df is not None:
+        altered_df = alter_csv_data(df)
+        create_sqlite_db(sql_data=altered_df, db_name=db_name, table_name='trainstops')
+    else:
+        print('No csv_data available, could not create database')
+
+
+if __name__ == '__main__':
+    main()
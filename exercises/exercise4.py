@@ -1,9 +1,27 @@
+import argparse
+import csv
+import numpy as np
+import os
 import pandas as pd
+import re
+import tempfile
+import time
 import zipfile
 
 from sqlalchemy import create_engine, Integer, Float, String, Text
 from urllib.request import urlretrieve
 
+# Digits as accepted by int() and float(), optionally grouped by single underscores
+DIGIT_PART = r'\d(?:_?\d)*'
+DECIMAL_PART = rf'(?:{DIGIT_PART}(?:\.(?:{DIGIT_PART})?)?|\.{DIGIT_PART})(?:[eE][+-]?{DIGIT_PART})?'
+INTEGER_PATTERN = re.compile(rf'\s*[+-]?{DIGIT_PART}\s*')
+FLOAT_PATTERN = re.compile(rf'\s*[+-]?(?:{DECIMAL_PART}|inf(?:inity)?|nan)\s*', re.IGNORECASE)
+SCAN_BLOCK_SIZE = 1 << 20
+
+COLUMNS = ["Geraet", "Hersteller", "Model", "Monat", "Temperatur in °C (DWD)", "Batterietemperatur in °C",
+           "Geraet aktiv"]
+NEW_COLUMN_NAMES = {"Temperatur in °C (DWD)": "Temperatur", "Batterietemperatur in °C": "Batterietemperatur"}
+
 
 def convert_to_fahrenheit(temp_str):
     """
@@ -34,6 +52,206 @@ def validate_geraet(geraet):
         return None
 
 
+def map_distinct_values(column, convert):
+    """
+    Converts every distinct value of the column only once, the results are mapped back onto the rows via the
+    factorized codes.
+    :param column: The column which is to be converted.
+    :param convert: Function converting a column of strings as array operations.
+    :return: The converted column, NaN where the column is missing values.
+    """
+    codes, uniques = pd.factorize(column)
+    converted = convert(pd.Series(uniques, dtype=object)).reindex(codes)
+    converted.index = column.index
+    return converted
+
+
+def convert_column_to_fahrenheit(temp_strs):
+    """
+    Converts a column of temperature strings from Celsius to Fahrenheit, with the same results as
+    convert_to_fahrenheit, but as array operations.
+    :param temp_strs: Column of temperature strings in Celsius.
+    :return: Column of temperatures in Fahrenheit, NaN where the conversion failed.
+    """
+    temp_strs = temp_strs.str.replace(',', '.', regex=False)
+    is_float = temp_strs.str.fullmatch(FLOAT_PATTERN).fillna(False).astype(bool)
+    temp_floats = temp_strs.where(is_float, '0').astype(float)
+    return (temp_floats * 9 / 5 + 32).where(is_float)
+
+
+def validate_geraet_column(geraete):
+    """
+    Validates the 'Geraet' column, with the same results as validate_geraet, but as array operations.
+    :param geraete: 'Geraet' column of strings.
+    :return: Validated 'Geraet' column, NaN where the validation failed.
+    """
+    is_integer = geraete.str.fullmatch(INTEGER_PATTERN).fillna(False).astype(bool)
+    geraete = geraete.where(is_integer, '0').astype(np.int64)
+    return geraete.where(geraete > 0)
+
+
+def read_headers(file_path):
+    """
+    :param file_path: Path of the csv-file. Every line ends with a delimiter.
+    :return: The column names of the csv-file.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.readline().strip().split(';')[:-1]
+
+
+def read_data_by_line(file_path):
+    """
+    Reads the csv-file line by line. Fields beyond the named columns are collected in the '...' column.
+    :param file_path: Path of the csv-file.
+    :return: DataFrame of strings.
+    """
+    data = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        headers = f.readline().strip().split(';')[:-1]
+        for line in f:
+            row = line.strip().split(';')
+            row_dict = {header: value for header, value in zip(headers, row[:-1])}
+            row_dict['...'] = row[-1].split(';')
+            data.append(row_dict)
+    return pd.DataFrame(data)
+
+
+def has_short_lines(file_path, num_headers):
+    """
+    The last field of every line is not part of the named columns. Lines with less delimiters than named columns
+    therefore lack values of named columns, which the C reader fills with empty strings instead of NaN.
+    The file is scanned in blocks of SCAN_BLOCK_SIZE bytes, so it is never held in memory as a whole.
+    :param file_path: Path of the csv-file.
+    :param num_headers: Number of the named columns.
+    :return: Whether a non-empty data line has less delimiters than named columns.
+    """
+    with open(file_path, 'rb') as f:
+        f.readline()
+        # Delimiters, length and last byte of the line which is continued in the next block
+        delimiters, line_length, last_byte = 0, 0, ord('\n')
+        while block := f.read(SCAN_BLOCK_SIZE):
+            data = np.frombuffer(block, dtype=np.uint8)
+            line_ends = np.flatnonzero(data == ord('\n'))
+            delimiter_positions = np.flatnonzero(data == ord(';'))
+            if len(line_ends):
+                line_delimiters = np.diff(np.searchsorted(delimiter_positions, line_ends), prepend=0)
+                line_delimiters[0] += delimiters
+                line_lengths = np.diff(line_ends, prepend=-1) - 1
+                line_lengths[0] += line_length
+                # A carriage return before the line end is not part of the line
+                line_lengths -= (np.append(last_byte, data)[line_ends] == ord('\r')) & (line_lengths > 0)
+                if np.any((line_delimiters < num_headers) & (line_lengths > 0)):
+                    return True
+                delimiters = len(delimiter_positions) - np.searchsorted(delimiter_positions, line_ends[-1])
+                line_length = len(data) - line_ends[-1] - 1
+            else:
+                delimiters += len(delimiter_positions)
+                line_length += len(data)
+            last_byte = data[-1]
+    # The last line may lack its line end
+    line_length -= line_length > 0 and last_byte == ord('\r')
+    return bool(delimiters < num_headers and line_length > 0)
+
+
+def read_data(file_path, columns=None):
+    """
+    Reads the named columns of the csv-file with the C reader, skipping the trailing unnamed fields of every line.
+    Files with lines lacking values of named columns are read line by line instead, to keep their missing values.
+    :param file_path: Path of the csv-file.
+    :param columns: The named columns which are read, all if None.
+    :return: DataFrame of strings.
+    """
+    headers = read_headers(file_path)
+    if has_short_lines(file_path, len(headers)):
+        return read_data_by_line(file_path)
+    columns = columns or headers
+    df = pd.read_csv(file_path, sep=';', header=None, skiprows=1, usecols=[headers.index(col) for col in columns],
+                     dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE, encoding='utf-8')
+    df.columns = [headers[position] for position in df.columns]
+    return df
+
+
+def transform_data_by_cell(df):
+    """
+    Selects the relevant columns, converts the temperatures and removes rows with invalid 'Geraet' values, by
+    calling the conversion and validation functions for every cell.
+    :param df: DataFrame of strings, as read from the csv-file.
+    :return: The transformed DataFrame.
+    """
+    df = df[COLUMNS].rename(columns=NEW_COLUMN_NAMES)
+    df["Temperatur"] = df["Temperatur"].apply(convert_to_fahrenheit)
+    df["Batterietemperatur"] = df["Batterietemperatur"].apply(convert_to_fahrenheit)
+    df["Geraet"] = df["Geraet"].apply(validate_geraet)
+    return df.dropna(subset=["Geraet"])
+
+
+def transform_data(df):
+    """
+    Selects the relevant columns, converts the temperatures and removes rows with invalid 'Geraet' values, with
+    the same results as transform_data_by_cell, but as array operations.
+    :param df: DataFrame of strings, as read from the csv-file.
+    :return: The transformed DataFrame.
+    """
+    df = df[COLUMNS].rename(columns=NEW_COLUMN_NAMES)
+    df["Temperatur"] = map_distinct_values(df["Temperatur"], convert_column_to_fahrenheit)
+    df["Batterietemperatur"] = map_distinct_values(df["Batterietemperatur"], convert_column_to_fahrenheit)
+    df["Geraet"] = map_distinct_values(df["Geraet"], validate_geraet_column)
+    return df.dropna(subset=["Geraet"])
+
+
+def generate_data(file_path, num_rows, seed=0):
+    """
+    Generates a csv-file in the format of the data.csv, including invalid 'Geraet' values, invalid temperatures and
+    trailing unnamed fields.
+    :param file_path: Path of the generated csv-file.
+    :param num_rows: Number of generated lines.
+    :param seed: Seed of the random number generator.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Geraet": rng.choice(['1', '17', '23', '-4', '0', 'x', ''], num_rows, p=[.3, .3, .3, .025, .025, .025, .025]),
+        "Hersteller": rng.choice(['Apple', 'Samsung', 'Google'], num_rows),
+        "Model": rng.choice(['iPhone 13', 'Galaxy S21', 'Pixel 6'], num_rows),
+        "Monat": rng.integers(1, 13, num_rows).astype(str),
+        "Temperatur in °C (DWD)": np.char.replace(np.round(rng.normal(12, 8, num_rows), 2).astype(str), '.', ','),
+        "Latitude (WGS84)": np.char.replace(np.round(rng.uniform(47, 55, num_rows), 6).astype(str), '.', ','),
+        "Longitude (WGS84)": np.char.replace(np.round(rng.uniform(6, 15, num_rows), 6).astype(str), '.', ','),
+        "Verschleierung (m)": rng.integers(0, 1000, num_rows).astype(str),
+        "Aufenthaltsdauer im Freien (ms)": rng.integers(0, 10 ** 6, num_rows).astype(str),
+        "Batterietemperatur in °C": rng.choice(['21,5', '30,25', '-', '38,0', '25'], num_rows),
+        "Geraet aktiv": rng.choice(['Ja', 'Nein'], num_rows),
+    })
+    lines = df.apply(';'.join, axis=1, raw=True) + pd.Series(rng.choice([';', ';;', ';;;;'], num_rows))
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(';'.join(df.columns) + ';\n')
+        f.write('\n'.join(lines) + '\n')
+
+
+def benchmark(num_rows, repeat=3):
+    """
+    Compares reading and transforming a generated csv-file line by line and cell by cell with the array operations.
+    :param num_rows: Number of generated lines.
+    :param repeat: Number of timed runs. The fastest one is reported.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'data.csv')
+        generate_data(file_path, num_rows)
+        results, timings = [], []
+        for read, transform in ((read_data_by_line, transform_data_by_cell),
+                                (lambda path: read_data(path, COLUMNS), transform_data)):
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                df = transform(read(file_path))
+                seconds.append(time.perf_counter() - start)
+            results.append(df)
+            timings.append(min(seconds))
+
+    assert results[0].equals(results[1]), 'The array operations do not match the cell by cell transformation'
+    print(f"Line by line and cell by cell: {timings[0]:.3f} s, array operations: {timings[1]:.3f} s, "
+          f"speedup {timings[0] / timings[1]:.1f}x for {num_rows:,} rows")
+
+
 def main():
     """
     Main function to process the data.
@@ -47,6 +265,13 @@ def main():
     6. Remove rows with invalid 'Geraet' values.
     7. Save the DataFrame to a SQLite database.
     """
+    parser = argparse.ArgumentParser(description='Process the mowesta dataset.')
+    parser.add_argument('--benchmark', type=int, metavar='ROWS', default=None,
+                        help='Benchmark the processing on a generated dataset of this many rows instead.')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
 
     # Download the dataset
     file_path = 'mowesta-dataset.zip'
@@ -57,30 +282,11 @@ def main():
         zip_ref.extractall()
 
     # Read the data into a pandas DataFrame
-    data = []
-    with open('data.csv', 'r', encoding='utf-8') as f:
-        headers = f.readline().strip().split(';')[:-1]
-        for line in f:
-            row = line.strip().split(';')
-            row_dict = {header: value for header, value in zip(headers, row[:-1])}
-            row_dict['...'] = row[-1].split(';')
-            data.append(row_dict)
-
-    df = pd.DataFrame(data)
-
-    # Rename and select relevant columns
-    df = df[["Geraet", "Hersteller", "Model", "Monat", "Temperatur in °C (DWD)", "Batterietemperatur in °C",
-             "Geraet aktiv"]]
-    df = df.rename(
-        columns={"Temperatur in °C (DWD)": "Temperatur", "Batterietemperatur in °C": "Batterietemperatur"})
-
-    # Apply the conversion and validation functions
-    df["Temperatur"] = df["Temperatur"].apply(convert_to_fahrenheit)
-    df["Batterietemperatur"] = df["Batterietemperatur"].apply(convert_to_fahrenheit)
-    df["Geraet"] = df["Geraet"].apply(validate_geraet)
+    df = read_data('data.csv', COLUMNS)
 
-    # Remove rows with invalid 'Geraet' values
-    df = df.dropna(subset=["Geraet"])
+    # Rename and select relevant columns, apply the conversion and validation functions and remove rows with invalid
+    # 'Geraet' values
+    df = transform_data(df)
 
     # Define the data types for the SQLite database
     dtype = {'Geraet': Integer, 'Hersteller': String, 'Model': String, 'Monat': Integer, 'Temperatur': Float,
@@ -0,0 +1,159 @@
+import contextlib
+import os
+import pandas as pd
+import random
+import sqlalchemy as sql
+import tempfile
+import threading
+import unittest
+
+from exercise2 import create_spatial_index, find_nearest_stations, find_stations_within, haversine_km, main
+from exercise4 import COLUMNS, has_short_lines, read_data, read_data_by_line, transform_data, transform_data_by_cell
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+
+@contextlib.contextmanager
+def serve_file(path, body):
+    """
+    Serves the body under the path on a local HTTP server, every other path is not found.
+    :param path: The path of the served file, e.g. '/stops.csv'.
+    :param body: The served file as bytes.
+    :return: Context manager yielding the URL of the server.
+    """
+    class FileRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != path:
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class TestTrainStopDownload(unittest.TestCase):
+    def test_streamed_download_keeps_only_valid_stations(self):
+        mock_csv = (
+            'EVA_NR;IFOPT;NAME;Verkehr;Laenge;Breite;Status\n'
+            '8000096;de:08111:6115;Stuttgart Hbf;FV;9,181636;48,784081;neu\n'
+            '8000105;de:06412:10:1;Frankfurt Hbf;RV;8,663785;50,107149;neu\n'
+            '8000106;de:07111:1;Koblenz;nur DPN;7,588245;50,350780;neu\n'
+            '8000107;de:08212:90;Karlsruhe;Bus;8,402181;48,993512;neu\n'
+            '8000108;de:08221:1;Heidelberg;FV;108,675442;49,403576;neu\n'
+            '8000109;08111:6115;Mannheim;FV;8,469530;49,479352;neu\n'
+            '8000110;;Ulm;RV;9,982224;48,399433;neu\n'
+        ).encode('utf-8')
+
+        with tempfile.TemporaryDirectory() as directory, serve_file('/stops.csv', mock_csv) as url:
+            # The exercise writes the database into the parent of the working directory
+            working_directory = os.path.join(directory, 'exercises')
+            os.makedirs(working_directory)
+            previous_directory = os.getcwd()
+            os.chdir(working_directory)
+            try:
+                main(f'{url}/stops.csv', 'trainstops.sqlite')
+                main(f'{url}/missing.csv', 'missing.sqlite')
+            finally:
+                os.chdir(previous_directory)
+
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'trainstops.sqlite')}")
+            result = pd.read_sql_table('trainstops', engine)
+            with engine.connect() as connection:
+                indexed_stations = connection.exec_driver_sql('SELECT count(*) FROM trainstops_rtree').scalar()
+            engine.dispose()
+            missing_database_exists = os.path.exists(os.path.join(directory, 'missing.sqlite'))
+
+        # Assert that only stations with a valid Verkehr, coordinates and IFOPT are kept and indexed, while a failed
+        # download creates no database
+        self.assertEqual(['Stuttgart Hbf', 'Frankfurt Hbf', 'Koblenz'], result['NAME'].tolist())
+        self.assertEqual([9.181636, 8.663785, 7.588245], result['Laenge'].tolist())
+        self.assertEqual(3, indexed_stations)
+        self.assertEqual(False, missing_database_exists)
+
+
+class TestTrainStopIndex(unittest.TestCase):
+    def test_index_lookups_match_a_scan_of_all_stations(self):
+        rng = random.Random(0)
+        mock_data = pd.DataFrame({
+            'IFOPT': [f'de:08111:{i}' for i in range(500)],
+            'Laenge': [rng.uniform(6.0, 15.0) for _ in range(500)],
+            'Breite': [rng.uniform(47.3, 55.0) for _ in range(500)]
+        })
+        # Points inside the stations, at their border, far outside of them and on a station itself
+        points = [(9.18, 48.78), (6.0, 55.0), (-3.7, 40.4), (mock_data['Laenge'][7], mock_data['Breite'][7])]
+
+        with tempfile.TemporaryDirectory() as directory:
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'trainstops.sqlite')}")
+            mock_data.to_sql('trainstops', engine, index=False)
+            create_spatial_index(engine, 'trainstops')
+            connection = engine.raw_connection()
+            try:
+                for laenge, breite in points:
+                    expected_result = sorted(
+                        (haversine_km(laenge, breite, station.Laenge, station.Breite), station.IFOPT)
+                        for station in mock_data.itertuples()
+                    )
+
+                    # Assert that the R*Tree finds exactly the stations a scan of all stations finds
+                    for radius_km in (0.5, 25.0, 150.0):
+                        result = find_stations_within(connection, laenge, breite, radius_km)
+                        self.assertEqual([item for item in expected_result if item[0] <= radius_km],
+                                         [(distance_km, station['IFOPT']) for distance_km, station in result])
+                    for k in (1, 5, 50, 600):
+                        result = find_nearest_stations(connection, laenge, breite, k)
+                        self.assertEqual(expected_result[:k],
+                                         [(distance_km, station['IFOPT']) for distance_km, station in result])
+            finally:
+                connection.close()
+                engine.dispose()
+
+
+
+class TestMeasurementTransformation(unittest.TestCase):
+    def test_array_operations_match_the_cell_by_cell_transformation(self):
+        header = ('Geraet;Hersteller;Model;Monat;Temperatur in °C (DWD);Latitude (WGS84);Longitude (WGS84);'
+                  'Verschleierung (m);Aufenthaltsdauer im Freien (ms);Batterietemperatur in °C;Geraet aktiv;')
+        lines = [
+            '1;Apple;iPhone 13;1;12,5;48,1;9,2;10;100;21,5;Ja;',
+            '+7;Samsung;Galaxy S21;2;-3;48,1;9,2;10;100;+4,25;Nein;;',
+            '-4;Google;Pixel 6;3;1e3;48,1;9,2;10;100;2,5E-1;Ja;;;;',
+            '0;Apple;iPhone 13;4;abc;48,1;9,2;10;100;-;Nein;',
+            'x;Apple;iPhone 13;5;1_000;48,1;9,2;10;100;1,2,3;Ja;',
+            ';Google;Pixel 6;6;inf;48,1;9,2;10;100;;Ja;',
+            '1_0;Google;Pixel 6;7;-1,5e-2;48,1;9,2;10;100;.5;Ja;',
+            '23;Samsung;Galaxy S21;8;+,5;48,1;9,2;10;100;5.;Nein;',
+            '17;Samsung;Galaxy S21;9; 12 ;48,1;9,2;10;100;1e;Ja;'
+        ]
+        # The last line lacks the value of 'Geraet aktiv', so the file is read line by line
+        short_line = '5;Apple;iPhone 13;10;20;48,1;9,2;10;100;25;'
+
+        with tempfile.TemporaryDirectory() as directory:
+            for file_lines, is_short in ((lines, False), (lines + [short_line], True)):
+                file_path = os.path.join(directory, 'data.csv')
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write('\n'.join([header] + file_lines) + '\n')
+
+                # Assert that lines lacking values are found, also across the blocks in which the file is scanned
+                for block_size in (1, 7, 1 << 20):
+                    with mock.patch('exercise4.SCAN_BLOCK_SIZE', block_size):
+                        self.assertEqual(is_short, has_short_lines(file_path, 11))
+
+                # Assert that the array operations keep and convert exactly the rows the per-cell functions do
+                expected_result = transform_data_by_cell(read_data_by_line(file_path))
+                result = transform_data(read_data(file_path, COLUMNS))
+                self.assertEqual(6 if is_short else 5, len(result))
+                self.assertEqual(True, result.reset_index(drop=True).equals(expected_result.reset_index(drop=True)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,211 @@
+import argparse
 import numpy as np
 import os
-import pandas as pd
 import re
 import seaborn as sns
 import sqlalchemy as sql
+import sqlite3
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from matplotlib import pyplot as plt
+from plot_cache import is_plot_current, locked_plot_manifest, plot_fingerprint, read_plot_manifest, remove_stale_plots
+from query_cache import normalize_query, read_sql_cached
+from table_statistics import find_stale_tables
+
+PLOTS_DIRECTORY = '../data/plots/'
+DATABASE_PATH = '../data/data.sqlite'
+
+# Queries only projecting and sorting the columns of one table, which can be answered from a shared scan of the table
+SIMPLE_QUERY_PATTERN = re.compile(
+    r'SELECT (?P<columns>[\w, ]+) FROM (?P<table>\w+)(?: ORDER BY (?P<order_by>[\w, ]+))?', re.IGNORECASE
+)
+ORDER_BY_TERM_PATTERN = re.compile(r'(?P<column>\w+)(?: (?P<direction>ASC|DESC))?', re.IGNORECASE)
+
+# Columns of area names, which are shortened to labels once the data is read
+AREA_NAME_COLUMNS = ('area_name', 'borough', 'area')
+
+# Fetching data for each analysis from the respective tables
+# The crime queries read the summary of london_crime_by_lsoa per borough, category and month built at ingest time
+QUERY_DICT = {
+    'life_satisfaction_query': "SELECT area_name, average_age, life_satisfaction_score "
+                               "FROM london_borough_profiles ORDER BY average_age, life_satisfaction_score",
+    'bame_population_query': "SELECT area_name, pctg_population_bame "
+                             "FROM london_borough_profiles ORDER BY pctg_population_bame",
+    'crime_query': "SELECT A.borough, A.major_category, SUM(A.value) AS total_count "
+                   "FROM london_crime_summary as A "
+                   "INNER JOIN london_borough_profiles as B ON A.borough = B.area_name "
+                   "GROUP BY borough, major_category",
+    'crime_amount_query': "SELECT A.borough, SUM(A.value) AS total_count FROM london_crime_summary as A "
+                          "INNER JOIN london_borough_profiles as B ON A.borough = B.area_name "
+                          "GROUP BY A.borough ORDER BY total_count",
+    'house_price_query': "SELECT A.area, A.date, A.mean_house_price FROM housing_in_london_monthly as A "
+                         "INNER JOIN london_borough_profiles as B ON A.area = LOWER(B.area_name)",
+    'gross_annual_pay_query': "SELECT area_name, gross_annual_pay FROM london_borough_profiles "
+                              "ORDER BY gross_annual_pay",
+    'health_query': "SELECT area_name, male_life_expectancy, female_life_expectancy, population_density, "
+                    "prop_population_over_65 FROM london_borough_profiles",
+    'education_query': "SELECT area_name, prop_working_age_no_qualif, prop_working_age_degree, "
+                       "achvmt_5_or_more_gcse, gross_annual_pay, employment_rate "
+                       "FROM london_borough_profiles ORDER BY prop_working_age_no_qualif",
+    'transport_env_query': "SELECT area_name, number_of_cars, avg_public_transport_accessibility, "
+                           "pctg_area_greenspace FROM london_borough_profiles ORDER BY number_of_cars",
+    'political_analysis_query': "SELECT area_name, prop_seats_conservatives_2014_elect, "
+                                "prop_seats_labour_2014_elect, prop_seats_lib_dems_2014_elect "
+                                "FROM london_borough_profiles ORDER BY prop_seats_conservatives_2014_elect, "
+                                "prop_seats_labour_2014_elect, prop_seats_lib_dems_2014_elect",
+    'political_turnout_query': "SELECT area_name, turnout_2014_local_elect FROM london_borough_profiles "
+                               "ORDER BY turnout_2014_local_elect DESC",
+    'wellbeing_scores_query': "SELECT area_name, life_satisfaction_score, happiness_score, anxiety_score, "
+                              "worthwhileness_score FROM london_borough_profiles"
+}
+
+# Registry of all plot jobs, mapping the job name to its render function and the names of the data frames it needs
+PLOT_JOBS = {}
 
 
 def read_sql(engine, query):
     """
+    The results are cached on disk and only queried again once the database changed.
     :param engine: SQLite database engine.
     :param query: SQL query.
     :return: Pandas DataFrame.
     """
-    return pd.read_sql_query(query, engine)
+    return read_sql_cached(engine, query)
+
+
+def parse_simple_query(query):
+    """
+    :param query: SQL query.
+    :return: Tuple of the table, the selected columns and the ORDER BY terms as tuples of the column and whether it is
+    sorted ascending. None if the query does more than projecting and sorting the columns of one table, or if it sorts
+    in mixed directions.
+    """
+    match = SIMPLE_QUERY_PATTERN.fullmatch(normalize_query(query))
+    if not match:
+        return None
+    columns = [column.strip() for column in match['columns'].split(',')]
+    order_by = []
+    for term in match['order_by'].split(',') if match['order_by'] else []:
+        term_match = ORDER_BY_TERM_PATTERN.fullmatch(term.strip())
+        if not term_match:
+            return None
+        order_by.append((term_match['column'], (term_match['direction'] or 'ASC').upper() == 'ASC'))
+    if len({ascending for _, ascending in order_by}) > 1:
+        return None
+    return match['table'], columns, order_by
+
+
+def plan_queries(keys):
+    """
+    Groups the queries by their base table. Simple queries sharing a base table are answered from one scan of it.
+    :param keys: Keys of the queries in QUERY_DICT.
+    :return: Tuple of a dictionary mapping every shared table to the parsed queries answered from its scan, by key,
+    and the list of the keys of all other queries.
+    """
+    parsed_queries = {key: parse_simple_query(QUERY_DICT[key]) for key in keys}
+    tables = [parsed_query[0] for parsed_query in parsed_queries.values() if parsed_query]
+    shared_scans, independent_keys = {}, []
+    for key, parsed_query in parsed_queries.items():
+        if parsed_query and tables.count(parsed_query[0]) > 1:
+            shared_scans.setdefault(parsed_query[0], {})[key] = parsed_query
+        else:
+            independent_keys.append(key)
+    return shared_scans, independent_keys
+
+
+def shorten_area_name_columns(df):
+    """
+    :param df: Data frame read from the database.
+    :return: The data frame with all columns of area names shortened to labels.
+    """
+    for column in AREA_NAME_COLUMNS:
+        if column in df.columns:
+            df[column] = shorten_area_names(df[column])
+    return df
+
+
+def read_shared_scan(engine, table, parsed_queries):
+    """
+    Reads all columns needed by the queries in one scan of the table. Every query is then answered by a projected,
+    sorted view of the scan. Like in SQLite, ties keep the order of the scan and NULL values sort first.
+    :param engine: SQLite database engine.
+    :param table: The table which is scanned.
+    :param parsed_queries: Dictionary of the queries answered from the scan, as returned by parse_simple_query.
+    :return: Dictionary of the result of every query.
+    """
+    columns = list(dict.fromkeys(column for _, query_columns, _ in parsed_queries.values() for column in query_columns))
+    scan = shorten_area_name_columns(read_sql(engine, f'SELECT {", ".join(columns)} FROM {table}'))
+    results = {}
+    for key, (_, query_columns, order_by) in parsed_queries.items():
+        view = scan[query_columns]
+        if any(column in AREA_NAME_COLUMNS for column, _ in order_by):
+            # The scan only holds the shortened labels, which do not sort like the area names
+            results[key] = shorten_area_name_columns(read_sql(engine, QUERY_DICT[key]))
+            continue
+        if order_by:
+            ascending = order_by[0][1]
+            try:
+                view = view.sort_values([column for column, _ in order_by], ascending=ascending, kind='mergesort',
+                                        na_position='first' if ascending else 'last')
+            except TypeError:
+                # Columns mixing numbers and text are sorted by SQLite
+                results[key] = shorten_area_name_columns(read_sql(engine, QUERY_DICT[key]))
+                continue
+        results[key] = view.reset_index(drop=True)
+    return results
+
+
+def read_data_frames(engine, keys, max_workers=None):
+    """
+    Answers the queries with one scan per shared base table, see plan_queries. The scans and the other queries run
+    concurrently, on the connections pooled by the engine.
+    :param engine: SQLite database engine.
+    :param keys: Keys of the queries in QUERY_DICT.
+    :param max_workers: Number of concurrent queries. Defaults to the number of CPUs.
+    :return: Dictionary of the result of every query, with the area names shortened to labels, by key.
+    """
+    shared_scans, independent_keys = plan_queries(keys)
+    data_frames = {}
+    with ThreadPoolExecutor(max_workers or os.cpu_count()) as executor:
+        scan_futures = [executor.submit(read_shared_scan, engine, table, parsed_queries)
+                        for table, parsed_queries in shared_scans.items()]
+        query_futures = {key: executor.submit(read_sql, engine, QUERY_DICT[key]) for key in independent_keys}
+        for future in scan_futures:
+            data_frames.update(future.result())
+        for key, future in query_futures.items():
+            data_frames[key] = shorten_area_name_columns(future.result())
+    return data_frames
+
+
+def read_named_data_frames(engine, data_frame_names, max_workers=None):
+    """
+    :param engine: SQLite database engine.
+    :param data_frame_names: Names of the data frames, as keys of QUERY_DICT without '_query'.
+    :param max_workers: Number of concurrent queries. Defaults to the number of CPUs.
+    :return: Dictionary of the data frames by name, see read_data_frames.
+    """
+    keys = [key for key in QUERY_DICT if re.sub(r'_query$', '', key) in data_frame_names]
+    return {re.sub(r'_query$', '', key): df for key, df in read_data_frames(engine, keys, max_workers).items()}
+
+
+def create_read_only_engine(database_path=DATABASE_PATH, pool_size=None):
+    """
+    :param database_path: The path of the SQLite database.
+    :param pool_size: Number of pooled connections. Defaults to the number of CPUs.
+    :return: SQLite database engine pooling read-only connections, which can be shared between threads.
+    """
+    return sql.create_engine(
+        f'sqlite:///{database_path}', poolclass=sql.pool.QueuePool, pool_size=pool_size or os.cpu_count(),
+        creator=lambda: sqlite3.connect(f'file:{database_path}?mode=ro', uri=True, check_same_thread=False)
+    )
+
+
+def plot_path(title):
+    """
+    :param title: Title of the plot.
+    :return: The path under which the plot is saved.
+    """
+    return os.path.join(PLOTS_DIRECTORY, title.replace(' ', '_') + '.png')
 
 
 def plot_data(title, xlabel=None, ylabel=None):
@@ -22,12 +213,14 @@ def plot_data(title, xlabel=None, ylabel=None):
     :param title: Title of the plot.
     :param xlabel: Label of the x-axis.
     :param ylabel: Label of the y-axis.
+    :return: The path under which the plot is saved.
     """
     plt.title(title)
     plt.xlabel(xlabel)
     plt.ylabel(ylabel)
     plt.tight_layout()
-    plt.savefig(os.path.join('../data/plots/', title.replace(' ', '_') + '.png'))
+    plt.savefig(plot_path(title))
+    return plot_path(title)
 
 
 def plot_radar(num_boroughs, ax, data, title, alpha, color):
@@ -43,69 +236,45 @@ def plot_radar(num_boroughs, ax, data, title, alpha, color):
     ax.fill(angles, data, alpha=alpha, color=color)
 
 
-def main():
-    # Specify the SQLite database engine.
-    engine = sql.create_engine('sqlite:///../data/data.sqlite')
-    data_directory = '../data/plots/'
-    if not os.path.exists(data_directory):
-        os.makedirs(data_directory)
-
-    # Fetching data for each analysis from the respective tables
-    query_dict = {
-        'life_satisfaction_query': "SELECT area_name, average_age, life_satisfaction_score "
-                                   "FROM london_borough_profiles ORDER BY average_age, life_satisfaction_score",
-        'bame_population_query': "SELECT area_name, pctg_population_bame "
-                                 "FROM london_borough_profiles ORDER BY pctg_population_bame",
-        'crime_query': "SELECT A.borough, A.major_category, SUM(A.value) AS total_count "
-                       "FROM london_crime_by_lsoa as A "
-                       "INNER JOIN london_borough_profiles as B ON A.borough = B.area_name "
-                       "GROUP BY borough, major_category",
-        'crime_amount_query': "SELECT A.borough, SUM(A.value) AS total_count FROM london_crime_by_lsoa as A "
-                              "INNER JOIN london_borough_profiles as B ON A.borough = B.area_name "
-                              "GROUP BY A.borough ORDER BY total_count",
-        'house_price_query': "SELECT A.area, A.date, A.mean_house_price FROM housing_in_london_monthly as A "
-                             "INNER JOIN london_borough_profiles as B ON A.area = LOWER(B.area_name)",
-        'gross_annual_pay_query': "SELECT area_name, gross_annual_pay FROM london_borough_profiles "
-                                  "ORDER BY gross_annual_pay",
-        'health_query': "SELECT area_name, male_life_expectancy, female_life_expectancy, population_density, "
-                        "prop_population_over_65 FROM london_borough_profiles",
-        'education_query': "SELECT area_name, prop_working_age_no_qualif, prop_working_age_degree, "
-                           "achvmt_5_or_more_gcse, gross_annual_pay, employment_rate "
-                           "FROM london_borough_profiles ORDER BY prop_working_age_no_qualif",
-        'transport_env_query': "SELECT area_name, number_of_cars, avg_public_transport_accessibility, "
-                               "pctg_area_greenspace FROM london_borough_profiles ORDER BY number_of_cars",
-        'political_analysis_query': "SELECT area_name, prop_seats_conservatives_2014_elect, "
-                                    "prop_seats_labour_2014_elect, prop_seats_lib_dems_2014_elect "
-                                    "FROM london_borough_profiles ORDER BY prop_seats_conservatives_2014_elect, "
-                                    "prop_seats_labour_2014_elect, prop_seats_lib_dems_2014_elect",
-        'political_turnout_query': "SELECT area_name, turnout_2014_local_elect FROM london_borough_profiles "
-                                   "ORDER BY turnout_2014_local_elect DESC",
-        'wellbeing_scores_query': "SELECT area_name, life_satisfaction_score, happiness_score, anxiety_score, "
-                                  "worthwhileness_score FROM london_borough_profiles"
-    }
+def shorten_area_names(area_names):
+    """
+    :param area_names: Column of area names.
+    :return: The area names, cut off after twelve characters to keep the axis labels readable.
+    """
+    return [area[:12] + '..' if len(area) > 12 else area for area in area_names]
 
-    # Read the data from the SQLite database into Pandas DataFrames
-    data_frames = {re.sub(r'_query$', '', key): read_sql(engine, query_dict[key]) for key in query_dict}
 
-    # Plotting the data
+def plot_job(*data_frame_names):
+    """
+    Registers the decorated function as plot job. The function is called with the data frames it needs in the given
+    order, renders exactly one figure and returns the path under which the figure is saved.
+    :param data_frame_names: Names of the data frames needed by the plot job, as keys of QUERY_DICT without '_query'.
+    :return: Decorator registering the plot job.
+    """
+    def register(render):
+        PLOT_JOBS[render.__name__.removeprefix('plot_')] = (render, data_frame_names)
+        return render
+    return register
 
-    # Life Satisfaction and Demographic Analysis
 
+# Life Satisfaction and Demographic Analysis
+
+@plot_job('life_satisfaction')
+def plot_life_satisfaction_vs_average_age(life_satisfaction):
     # Plotting the life satisfaction score vs average age
-    sns.set_style('whitegrid')
-    data_frames['life_satisfaction']['area_name'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                                     data_frames['life_satisfaction']['area_name']]
     plt.figure(figsize=(10, 8))
-    sns.scatterplot(data=data_frames['life_satisfaction'], x='average_age', y='life_satisfaction_score', s=100)
-    for i, area in enumerate(data_frames['life_satisfaction']['area_name']):
-        plt.text(data_frames['life_satisfaction']['average_age'][i] + 0.1,
-                 data_frames['life_satisfaction']['life_satisfaction_score'][i] + 0.0025, area)
+    sns.scatterplot(data=life_satisfaction, x='average_age', y='life_satisfaction_score', s=100)
+    for i, area in enumerate(life_satisfaction['area_name']):
+        plt.text(life_satisfaction['average_age'][i] + 0.1,
+                 life_satisfaction['life_satisfaction_score'][i] + 0.0025, area)
     plt.grid(True)
-    plot_data('Life Satisfaction Score vs Average Age', 'Average Age', 'Life Satisfaction Score [#]')
+    return plot_data('Life Satisfaction Score vs Average Age', 'Average Age', 'Life Satisfaction Score [#]')
 
+
+@plot_job('life_satisfaction')
+def plot_average_age_and_life_satisfaction(life_satisfaction):
     # Plotting the average age and life satisfaction vs area
-    sns.set_style('whitegrid')
-    sub_frame = data_frames['life_satisfaction']
+    sub_frame = life_satisfaction
     sub_frame.set_index('area_name', inplace=True)
     fig, ax1 = plt.subplots(figsize=(15, 12))
     color = 'tab:green'
@@ -129,200 +298,333 @@ def main():
     title = 'Average Age and Life Satisfaction Score per Borough'
     plt.title(title)
     plt.tight_layout()
-    plt.savefig(os.path.join('../data/plots/', title.replace(' ', '_') + '.png'))
+    plt.savefig(plot_path(title))
+    return plot_path(title)
 
+
+@plot_job('bame_population')
+def plot_bame_population(bame_population):
     # Plotting the BAME population percentage
-    sns.set_style('whitegrid')
-    data_frames['bame_population']['area_name'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                                   data_frames['bame_population']['area_name']]
     plt.figure(figsize=(14, 12))
     plt.xticks(rotation=45)
-    sns.barplot(data=data_frames['bame_population'], x='area_name', y='pctg_population_bame')
-    plot_data('Percentage of Population from BAME Groups per Borough', 'Borough',
-              'Percentage of BAME groups [%]')
+    sns.barplot(data=bame_population, x='area_name', y='pctg_population_bame')
+    return plot_data('Percentage of Population from BAME Groups per Borough', 'Borough',
+                     'Percentage of BAME groups [%]')
 
-    # Crime Analysis
 
+# Crime Analysis
+
+@plot_job('crime', 'crime_amount')
+def plot_crime_amount(crime, crime_amount):
     # Plotting the crime rate per borough
-    sns.set_style('whitegrid')
-    data_frames['crime']['borough'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                       data_frames['crime']['borough']]
-    data_frames['crime_amount']['borough'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                              data_frames['crime_amount']['borough']]
-    sub_frame = data_frames['crime'].groupby(['borough', 'major_category'])['total_count'].sum().unstack()
-    sub_frame = sub_frame.reindex(data_frames['crime_amount']['borough'].tolist())
+    sub_frame = crime.groupby(['borough', 'major_category'])['total_count'].sum().unstack()
+    sub_frame = sub_frame.reindex(crime_amount['borough'].tolist())
     sub_frame.plot(kind='bar', stacked=True, figsize=(13, 13))
     plt.xticks(rotation=45)
     plt.legend(title='Major Crime Category', loc='upper left')
-    plot_data('Crime Amount per Borough', 'Borough', 'Counted Crimes')
+    return plot_data('Crime Amount per Borough', 'Borough', 'Counted Crimes')
 
-    # Housing and Economic Analysis
 
-    # Plotting the house price per month for the ten most expensive and cheapest boroughs
-    sns.set_style('whitegrid')
-    data_frames['house_price']['area'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                          data_frames['house_price']['area']]
-    sub_frame = data_frames['house_price']
-    cheapest_boroughs = sub_frame[sub_frame['date'] == '2014/01/01'].sort_values(
-        by='mean_house_price', ascending=True).head(10)['area'].tolist()
-    expensive_boroughs = sub_frame[sub_frame['date'] == '2014/01/01'].sort_values(
-        by='mean_house_price', ascending=False).head(10)['area'].tolist()
-    sub_frame_cheap = sub_frame[sub_frame['area'].isin(cheapest_boroughs)]
-    sub_frame_expensive = sub_frame[sub_frame['area'].isin(expensive_boroughs)]
-    plt.figure(figsize=(12, 10))
-    sns.lineplot(data=sub_frame_cheap, x='date', y='mean_house_price', hue='area')
-    plt.xticks(rotation=45)
-    plt.legend(loc='upper left')
-    plot_data('Monthly Mean House Price for the ten Cheapest Boroughs', 'Date', 'Mean House Price [£]')
+# Housing and Economic Analysis
+
+def plot_house_price(house_price, ascending, title):
+    """
+    Plots the house price per month for the ten cheapest or most expensive boroughs in January 2014.
+    :param house_price: Data frame of the house_price_query.
+    :param ascending: True for the cheapest boroughs, False for the most expensive ones.
+    :param title: Title of the plot.
+    :return: The path under which the plot is saved.
+    """
+    sub_frame = house_price
+    boroughs = sub_frame[sub_frame['date'] == '2014/01/01'].sort_values(
+        by='mean_house_price', ascending=ascending).head(10)['area'].tolist()
+    sub_frame = sub_frame[sub_frame['area'].isin(boroughs)]
     plt.figure(figsize=(12, 10))
-    sns.lineplot(data=sub_frame_expensive, x='date', y='mean_house_price', hue='area')
+    sns.lineplot(data=sub_frame, x='date', y='mean_house_price', hue='area')
     plt.xticks(rotation=45)
     plt.legend(loc='upper left')
-    plot_data('Monthly Mean House Price for the ten most Expensive Boroughs', 'Date', 'Mean House Price [£]')
+    return plot_data(title, 'Date', 'Mean House Price [£]')
+
 
+@plot_job('house_price')
+def plot_house_price_cheapest(house_price):
+    # Plotting the house price per month for the ten cheapest boroughs
+    return plot_house_price(house_price, True, 'Monthly Mean House Price for the ten Cheapest Boroughs')
+
+
+@plot_job('house_price')
+def plot_house_price_most_expensive(house_price):
+    # Plotting the house price per month for the ten most expensive boroughs
+    return plot_house_price(house_price, False, 'Monthly Mean House Price for the ten most Expensive Boroughs')
+
+
+@plot_job('gross_annual_pay')
+def plot_gross_annual_pay(gross_annual_pay):
     # Plotting the gross annual pay per borough
-    sns.set_style('whitegrid')
-    data_frames['gross_annual_pay']['area_name'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                                    data_frames['gross_annual_pay']['area_name']]
     plt.figure(figsize=(12, 12))
-    sns.barplot(data=data_frames['gross_annual_pay'], x='area_name', y='gross_annual_pay')
+    sns.barplot(data=gross_annual_pay, x='area_name', y='gross_annual_pay')
     plt.xticks(rotation=45)
     plt.ylim(22500, 45000)
-    plot_data('Gross Annual Pay per Borough', 'Borough', 'Gross Annual Pay [£]')
+    return plot_data('Gross Annual Pay per Borough', 'Borough', 'Gross Annual Pay [£]')
 
-    # Health Indicators and Demographics
 
-    # Life expectancy vs population density or proportion of population over 65
-    sns.set_style('whitegrid')
-    data_frames['health']['area_name'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                          data_frames['health']['area_name']]
-    sns.pairplot(data=data_frames['health'], x_vars=['male_life_expectancy'],
-                 y_vars=['population_density', 'prop_population_over_65'], height=7, aspect=1.5,
-                 plot_kws={'s': 100})
-    plt.subplots_adjust(hspace=0.1)
-    # title = 'Male Life Expectancy vs Population Density or Proportion of Population over 65'
-    plt.savefig(os.path.join('../data/plots/', 'Male Life Expectancy vs Population Density or Proportion of '
-                                               'Population over 65'.replace(' ', '_') + '.png'))
-    sns.pairplot(data=data_frames['health'], x_vars=['female_life_expectancy'],
+# Health Indicators and Demographics
+
+def plot_life_expectancy(health, life_expectancy, title):
+    """
+    Plots the life expectancy vs population density or proportion of population over 65.
+    :param health: Data frame of the health_query.
+    :param life_expectancy: Column of the life expectancy on the x-axis.
+    :param title: Title of the plot, which is only used for the file name.
+    :return: The path under which the plot is saved.
+    """
+    sns.pairplot(data=health, x_vars=[life_expectancy],
                  y_vars=['population_density', 'prop_population_over_65'], height=7, aspect=1.5,
                  plot_kws={'s': 100})
     plt.subplots_adjust(hspace=0.1)
-    # title = 'Female Life Expectancy vs Population Density or Proportion of Population over 65'
-    plt.savefig(os.path.join('../data/plots/', 'Female Life Expectancy vs Population Density or Proportion of '
-                                               'Population over 65'.replace(' ', '_') + '.png'))
+    plt.savefig(plot_path(title))
+    return plot_path(title)
+
+
+@plot_job('health')
+def plot_male_life_expectancy(health):
+    return plot_life_expectancy(health, 'male_life_expectancy',
+                                'Male Life Expectancy vs Population Density or Proportion of Population over 65')
+
 
-    # Education and Socio-Economic Factors
+@plot_job('health')
+def plot_female_life_expectancy(health):
+    return plot_life_expectancy(health, 'female_life_expectancy',
+                                'Female Life Expectancy vs Population Density or Proportion of Population over 65')
 
+
+# Education and Socio-Economic Factors
+
+@plot_job('education')
+def plot_education_attainment(education):
     # Proportion of working age population with no qualifications vs proportion of working age population with a degree
-    sns.set_style('whitegrid')
-    data_frames['education']['area_name'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                             data_frames['education']['area_name']]
-    sub_frame = data_frames['education'][['area_name', 'prop_working_age_no_qualif', 'prop_working_age_degree']]
+    sub_frame = education[['area_name', 'prop_working_age_no_qualif', 'prop_working_age_degree']]
     sub_frame.set_index('area_name', inplace=True)
     sub_frame.plot(kind='bar', stacked=True, figsize=(12, 12))
     plt.xticks(rotation=45)
-    plot_data('Proportion of Working Age Population with No Qualifications vs Population with a Degree per Borough',
-              'Borough', 'Education Attainment Levels [%]')
+    return plot_data('Proportion of Working Age Population with No Qualifications vs Population with a Degree per '
+                     'Borough', 'Borough', 'Education Attainment Levels [%]')
+
 
+@plot_job('education')
+def plot_education_correlation(education):
     # Correlation between GCSE results, income estimates and employment rates
-    sns.set_style('whitegrid')
     plt.figure(figsize=(10, 8))
     sns.heatmap(
-        data_frames['education'][['achvmt_5_or_more_gcse', 'gross_annual_pay', 'employment_rate']].corr(),
+        education[['achvmt_5_or_more_gcse', 'gross_annual_pay', 'employment_rate']].corr(),
         annot=True, cmap='Spectral', vmin=-1, vmax=1, center=0, linewidths=.5
     )
     plt.yticks(rotation=90)
-    plot_data('Correlation between GCSE Results, Income Estimates [£] and Employment Rates [%]')
+    return plot_data('Correlation between GCSE Results, Income Estimates [£] and Employment Rates [%]')
 
-    # Transport and Environmental Analysis
 
-    # Distribution of number of cars per household
+# Transport and Environmental Analysis
 
+@plot_job('transport_env')
+def plot_number_of_cars(transport_env):
+    # Distribution of number of cars per household
     # Remove London from the data because it is a summary of all boroughs
-    sns.set_style('whitegrid')
-    data_frames['transport_env']['area_name'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                                 data_frames['transport_env']['area_name']]
-    transport_df = data_frames['transport_env'][data_frames['transport_env']['area_name'] != 'London']
+    transport_df = transport_env[transport_env['area_name'] != 'London']
     plt.figure(figsize=(12, 12))
     sns.barplot(data=transport_df, x='area_name', y='number_of_cars')
     plt.xticks(rotation=45)
     plt.grid(True)
-    plot_data('Distribution of Number of Cars per Borough', 'Borough', 'Number of Cars [#]')
+    return plot_data('Distribution of Number of Cars per Borough', 'Borough', 'Number of Cars [#]')
+
 
+@plot_job('transport_env')
+def plot_transport_accessibility_vs_greenspace(transport_env):
     # Public transport accessibility vs proportion of area that is greenspace
-    sns.set_style('whitegrid')
     plt.figure(figsize=(10, 8))
-    sns.scatterplot(data=data_frames['transport_env'], x='avg_public_transport_accessibility', y='pctg_area_greenspace',
-                    s=100)
-    for i, area in enumerate(data_frames['transport_env']['area_name']):
-        plt.text(data_frames['transport_env']['avg_public_transport_accessibility'][i] + 0.05,
-                 data_frames['transport_env']['pctg_area_greenspace'][i] + 0.25, area)
+    sns.scatterplot(data=transport_env, x='avg_public_transport_accessibility', y='pctg_area_greenspace', s=100)
+    for i, area in enumerate(transport_env['area_name']):
+        plt.text(transport_env['avg_public_transport_accessibility'][i] + 0.05,
+                 transport_env['pctg_area_greenspace'][i] + 0.25, area)
     plt.grid(True)
-    plot_data('Average Public Transport Accessibility vs Proportion of Area that is Greenspace',
-              'Average Public Transport Accessibility [#]', 'Proportion of Area that is Greenspace [%]')
+    return plot_data('Average Public Transport Accessibility vs Proportion of Area that is Greenspace',
+                     'Average Public Transport Accessibility [#]', 'Proportion of Area that is Greenspace [%]')
+
 
-    # Political Analysis
+# Political Analysis
 
+@plot_job('political_analysis')
+def plot_political_seats(political_analysis):
     # Plotting the proportion of seats won by each party in 2014 local elections
-    sns.set_style('whitegrid')
-    data_frames['political_analysis']['area_name'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                                      data_frames['political_analysis']['area_name']]
-    sub_frame = data_frames['political_analysis'][
+    sub_frame = political_analysis[
         ['area_name', 'prop_seats_conservatives_2014_elect', 'prop_seats_labour_2014_elect',
          'prop_seats_lib_dems_2014_elect']]
     sub_frame.set_index('area_name', inplace=True)
     sub_frame.plot(kind='bar', stacked=True, figsize=(12, 12))
     plt.xticks(rotation=45)
     plt.legend(loc='upper right')
-    plot_data('Proportion of Seats Won by each Party in 2014 Local Elections per Borough', 'Borough',
-              'Proportion of Seats [%]')
+    return plot_data('Proportion of Seats Won by each Party in 2014 Local Elections per Borough', 'Borough',
+                     'Proportion of Seats [%]')
+
 
+@plot_job('political_turnout')
+def plot_political_turnout(political_turnout):
     # Comparative analysis of turnout in 2014 local elections
-    sns.set_style('whitegrid')
-    data_frames['political_turnout']['area_name'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                                     data_frames['political_turnout']['area_name']]
     plt.figure(figsize=(12, 8))
-    sns.barplot(data=data_frames['political_turnout'], x='turnout_2014_local_elect', y='area_name')
+    sns.barplot(data=political_turnout, x='turnout_2014_local_elect', y='area_name')
     plt.xlim(20, 50)
-    plot_data('Comparative Analysis of Turnout in 2014 Local Elections per Borough', 'Turnout [%]', 'Borough')
+    return plot_data('Comparative Analysis of Turnout in 2014 Local Elections per Borough', 'Turnout [%]', 'Borough')
 
-    # Wellbeing Analysis
 
-    # Plotting the wellbeing scores per borough
-    sns.set_style('whitegrid')
-    data_frames['wellbeing_scores']['area_name'] = [area[:12] + '..' if len(area) > 12 else area for area in
-                                                    data_frames['wellbeing_scores']['area_name']]
-    sub_frame = data_frames['wellbeing_scores'][['area_name', 'life_satisfaction_score', 'happiness_score',
-                                                 'anxiety_score', 'worthwhileness_score']]
+# Wellbeing Analysis
+
+def plot_wellbeing(wellbeing_scores, scores, ylim, title):
+    """
+    Plots the given wellbeing scores per borough as radar chart.
+    :param wellbeing_scores: Data frame of the wellbeing_scores_query.
+    :param scores: List of tuples of the score column, its label and the index of its color in the palette.
+    :param ylim: Limits of the radial axis.
+    :param title: Title of the plot.
+    :return: The path under which the plot is saved.
+    """
+    sub_frame = wellbeing_scores[['area_name', 'life_satisfaction_score', 'happiness_score', 'anxiety_score',
+                                  'worthwhileness_score']]
     boroughs = sub_frame['area_name']
     num_boroughs = len(boroughs)
     fig, axs = plt.subplots(figsize=(10, 10), subplot_kw=dict(polar=True))
     color = sns.color_palette(palette='Pastel1')
-    plot_radar(num_boroughs, axs, sub_frame['life_satisfaction_score'], 'Life Satisfaction [#]', 0.5, color[0])
-    plot_radar(num_boroughs, axs, sub_frame['happiness_score'], 'Happiness [#]', 0.5, color[1])
-    plot_radar(num_boroughs, axs, sub_frame['worthwhileness_score'], 'Worthwhileness [#]', 0.5, color[2])
+    for score, label, color_index in scores:
+        plot_radar(num_boroughs, axs, sub_frame[score], label, 0.5, color[color_index])
     axs.set_xticks(np.linspace(0, 2 * np.pi, num_boroughs, endpoint=False))
     axs.set_xticklabels(boroughs)
-    axs.set_ylim(6.8, 7.9)
+    axs.set_ylim(*ylim)
     axs.set_rlabel_position(90)
     axs.legend(loc='upper right', bbox_to_anchor=(1, 1.1))
-    title = 'Wellbeing Scores per Borough'
     plt.title(title)
     plt.tight_layout()
-    plt.savefig(os.path.join('../data/plots/', plt.gca().get_title().replace(' ', '_') + '.png'))
+    plt.savefig(plot_path(title))
+    return plot_path(title)
+
+
+@plot_job('wellbeing_scores')
+def plot_wellbeing_scores(wellbeing_scores):
+    # Plotting the wellbeing scores per borough
+    scores = [('life_satisfaction_score', 'Life Satisfaction [#]', 0), ('happiness_score', 'Happiness [#]', 1),
+              ('worthwhileness_score', 'Worthwhileness [#]', 2)]
+    return plot_wellbeing(wellbeing_scores, scores, (6.8, 7.9), 'Wellbeing Scores per Borough')
+
 
+@plot_job('wellbeing_scores')
+def plot_wellbeing_anxiety(wellbeing_scores):
     # Plotting the wellbeing scores including anxiety per borough
-    fig, axs = plt.subplots(figsize=(10, 10), subplot_kw=dict(polar=True))
-    plot_radar(num_boroughs, axs, sub_frame['anxiety_score'], 'Anxiety [#]', 0.5, color[3])
-    axs.set_xticks(np.linspace(0, 2 * np.pi, num_boroughs, endpoint=False))
-    axs.set_xticklabels(boroughs)
-    axs.set_ylim(2.5, 3.8)
-    axs.set_rlabel_position(90)
-    axs.legend(loc='upper right', bbox_to_anchor=(1, 1.1))
-    title = 'Wellbeing Scores including Anxiety per Borough'
-    plt.title(title)
-    plt.tight_layout()
-    plt.savefig(os.path.join('../data/plots/', plt.gca().get_title().replace(' ', '_') + '.png'))
+    scores = [('anxiety_score', 'Anxiety [#]', 3)]
+    return plot_wellbeing(wellbeing_scores, scores, (2.5, 3.8), 'Wellbeing Scores including Anxiety per Borough')
+
+
+def init_plot_worker():
+    """
+    Every worker process renders on the non-interactive Agg backend with its own pyplot state.
+    """
+    plt.switch_backend('Agg')
+
+
+def render_plot_job(name, data_frames):
+    """
+    :param name: Name of the plot job.
+    :param data_frames: Dictionary of the data frames needed by the plot job.
+    :return: The path under which the plot is saved.
+    """
+    render, data_frame_names = PLOT_JOBS[name]
+    sns.set_style('whitegrid')
+    try:
+        return render(*[data_frames[data_frame_name].copy() for data_frame_name in data_frame_names])
+    finally:
+        # Figures must not leak into the next job rendered by the same process
+        plt.close('all')
+
+
+def render_plot_jobs(names, data_frames, max_workers=None):
+    """
+    Renders the plot jobs in a process pool.
+    :param names: Names of the plot jobs which are rendered.
+    :param data_frames: Dictionary of the data frames, containing at least the ones needed by the plot jobs.
+    :param max_workers: Number of worker processes. Defaults to the number of CPUs.
+    :return: The paths under which the plots are saved.
+    """
+    if not names:
+        return []
+    job_data_frames = [
+        {data_frame_name: data_frames[data_frame_name] for data_frame_name in PLOT_JOBS[name][1]} for name in names
+    ]
+    max_workers = min(max_workers or os.cpu_count(), len(names))
+    with ProcessPoolExecutor(max_workers, initializer=init_plot_worker) as executor:
+        return list(executor.map(render_plot_job, names, job_data_frames))
+
+
+def render_changed_plot_jobs(names, data_frames, max_workers=None, force=False):
+    """
+    Renders only the plot jobs whose input data frames or plotting parameters changed since their plot was saved. The
+    fingerprint of every plot is recorded in the plot manifest next to the plots. Plots which are no longer produced
+    by any plot job are removed.
+    :param names: Names of the plot jobs which are to be rendered.
+    :param data_frames: Dictionary of the data frames, containing at least the ones needed by the plot jobs.
+    :param max_workers: Number of worker processes. Defaults to the number of CPUs.
+    :param force: Whether all plot jobs are rendered, regardless of their fingerprints.
+    :return: The names of the rendered plot jobs.
+    """
+    previous_manifest = read_plot_manifest(PLOTS_DIRECTORY)
+    fingerprints = {
+        name: plot_fingerprint(name, PLOT_JOBS[name][0], [data_frames[data_frame_name]
+                                                          for data_frame_name in PLOT_JOBS[name][1]])
+        for name in names
+    }
+    changed_names = [
+        name for name in names if force or not is_plot_current(previous_manifest, name, fingerprints[name],
+                                                                PLOTS_DIRECTORY)
+    ]
+    paths = render_plot_jobs(changed_names, data_frames, max_workers)
+
+    # The entries are merged into the manifest as it is now, as the analysis server may have written it meanwhile
+    with locked_plot_manifest(PLOTS_DIRECTORY) as manifest:
+        current_manifest = dict(manifest)
+        for name in current_manifest:
+            if name not in PLOT_JOBS:
+                del manifest[name]
+        for name, path in zip(changed_names, paths):
+            manifest[name] = {'fingerprint': fingerprints[name], 'file_name': os.path.relpath(path, PLOTS_DIRECTORY)}
+        remove_stale_plots(manifest, current_manifest, PLOTS_DIRECTORY)
+    return changed_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse the data in the SQLite database and plot the results.')
+    parser.add_argument('plots', nargs='*', metavar='plot',
+                        help=f"Plot jobs to render, all by default. Choose from: {', '.join(PLOT_JOBS)}")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of processes rendering the plots. Defaults to the number of CPUs.')
+    parser.add_argument('--force', action='store_true',
+                        help='Render all plots, even the ones whose data and plotting code did not change.')
+    args = parser.parse_args()
+    unknown_plots = [name for name in args.plots if name not in PLOT_JOBS]
+    if unknown_plots:
+        parser.error(f"unknown plot jobs: {', '.join(unknown_plots)}")
+    names = args.plots or list(PLOT_JOBS)
+
+    # Specify the SQLite database engine, pooling read-only connections for the concurrent queries.
+    engine = create_read_only_engine()
+    if not os.path.exists(PLOTS_DIRECTORY):
+        os.makedirs(PLOTS_DIRECTORY)
+
+    # Warn about tables which changed since their ingest, checked on the statistics recorded at ingest time
+    for problem in find_stale_tables(engine).values():
+        print(f'Warning: {problem}')
+
+    # Read the data needed by the plot jobs from the SQLite database into Pandas DataFrames
+    needed_data_frames = {data_frame_name for name in names for data_frame_name in PLOT_JOBS[name][1]}
+    data_frames = read_named_data_frames(engine, needed_data_frames)
+
+    # Plotting the data, only the plots whose data or plotting code changed are rendered again
+    rendered_names = render_changed_plot_jobs(names, data_frames, args.workers, args.force)
+    print(f'Rendered {len(rendered_names)} of {len(names)} plots, {len(names) - len(rendered_names)} were unchanged.')
 
 
 if __name__ == "__main__":
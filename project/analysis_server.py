@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import re
+import threading
+
+from analyse_data import (
+    PLOT_JOBS, PLOTS_DIRECTORY, QUERY_DICT, create_read_only_engine, init_plot_worker, read_named_data_frames,
+    render_plot_job
+)
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from plot_cache import is_plot_current, locked_plot_manifest, plot_fingerprint, read_plot_manifest
+from query_cache import database_fingerprint
+from table_statistics import find_stale_tables
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8050
+
+# Data frames and rendered plots of the current state of the database, kept in memory between requests
+server_cache = {'database_fingerprint': None, 'data_frames': {}, 'plots': {}}
+# pyplot keeps global state, so plots are rendered one at a time
+server_lock = threading.Lock()
+
+
+def served_data_frame_names():
+    """
+    :return: Names of the data frames which are served, as keys of QUERY_DICT without '_query'.
+    """
+    return [re.sub(r'_query$', '', key) for key in QUERY_DICT]
+
+
+def refresh_server_cache(engine):
+    """
+    Empties the server cache once the database changed, e.g. by a new ingest. Must be called holding the server lock.
+    :param engine: SQLite database engine.
+    """
+    fingerprint = database_fingerprint(engine)
+    if fingerprint == server_cache['database_fingerprint']:
+        return
+    if server_cache['database_fingerprint'] is not None:
+        print('The database changed, the cached data frames and plots are dropped.')
+        # The pooled connections may still point to the replaced tables
+        engine.dispose()
+    server_cache.update({'database_fingerprint': fingerprint, 'data_frames': {}, 'plots': {}})
+    for problem in find_stale_tables(engine).values():
+        print(f'Warning: {problem}')
+
+
+def get_data_frames(engine, data_frame_names):
+    """
+    Reads only the data frames which are not cached yet. Must be called holding the server lock.
+    :param engine: SQLite database engine.
+    :param data_frame_names: Names of the data frames, as keys of QUERY_DICT without '_query'.
+    :return: Dictionary of the data frames by name.
+    """
+    data_frames = server_cache['data_frames']
+    missing_names = [name for name in data_frame_names if name not in data_frames]
+    if missing_names:
+        data_frames.update(read_named_data_frames(engine, missing_names))
+    return {name: data_frames[name] for name in data_frame_names}
+
+
+def get_plot(engine, name):
+    """
+    Renders the plot job in the server process, unless the plot saved for its current fingerprint can be reused. The
+    plot manifest is updated like by analyse_data.py, merged into its current entries. Must be called holding the
+    server lock.
+    :param engine: SQLite database engine.
+    :param name: Name of the plot job.
+    :return: The plot as PNG.
+    """
+    if name not in server_cache['plots']:
+        render, data_frame_names = PLOT_JOBS[name]
+        data_frames = get_data_frames(engine, data_frame_names)
+        fingerprint = plot_fingerprint(name, render, list(data_frames.values()))
+        manifest = read_plot_manifest(PLOTS_DIRECTORY)
+        if is_plot_current(manifest, name, fingerprint, PLOTS_DIRECTORY):
+            path = os.path.join(PLOTS_DIRECTORY, manifest[name]['file_name'])
+        else:
+            path = render_plot_job(name, data_frames)
+            with locked_plot_manifest(PLOTS_DIRECTORY) as manifest:
+                manifest[name] = {'fingerprint': fingerprint, 'file_name': os.path.relpath(path, PLOTS_DIRECTORY)}
+        with open(path, 'rb') as file:
+            server_cache['plots'][name] = file.read()
+    return server_cache['plots'][name]
+
+
+def data_frame_body(df, output_format):
+    """
+    :param df: Data frame which is returned.
+    :param output_format: 'json' for a list of records or 'csv'.
+    :return: Tuple of the content type and the encoded data frame.
+    """
+    if output_format == 'csv':
+        return 'text/csv; charset=utf-8', df.to_csv(index=False).encode('utf-8')
+    return 'application/json', df.to_json(orient='records').encode('utf-8')
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the data frames of QUERY_DICT and the plots of PLOT_JOBS:
+    GET /datasets, GET /datasets/<name>?format=json|csv, GET /plots and GET /plots/<name>.
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        output_format = parse_qs(url.query).get('format', ['json'])[0]
+        engine = self.server.engine
+        self.response_started = False
+        try:
+            if parts == ['datasets']:
+                self.send_body('application/json', json.dumps(served_data_frame_names()).encode('utf-8'))
+            elif parts == ['plots']:
+                self.send_body('application/json', json.dumps(list(PLOT_JOBS)).encode('utf-8'))
+            elif len(parts) == 2 and parts[0] == 'datasets' and parts[1] in served_data_frame_names():
+                with server_lock:
+                    refresh_server_cache(engine)
+                    df = get_data_frames(engine, [parts[1]])[parts[1]]
+                self.send_body(*data_frame_body(df, output_format))
+            elif len(parts) == 2 and parts[0] == 'plots' and parts[1] in PLOT_JOBS:
+                with server_lock:
+                    refresh_server_cache(engine)
+                    plot = get_plot(engine, parts[1])
+                self.send_body('image/png', plot)
+            else:
+                self.send_error(HTTPStatus.NOT_FOUND, f'Unknown path {url.path}')
+        except Exception as e:
+            # Once the response started, the error can not be sent anymore
+            if not self.response_started:
+                self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            raise
+
+    def send_body(self, content_type, body):
+        """
+        :param content_type: Content type of the response.
+        :param body: Body of the response as bytes.
+        """
+        self.response_started = True
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(engine, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    :param engine: SQLite database engine.
+    :param host: Host the server is bound to, only the local machine by default.
+    :param port: Port the server listens on, 0 for any free port.
+    :return: The HTTP server, which is started with serve_forever.
+    """
+    init_plot_worker()
+    server = ThreadingHTTPServer((host, port), AnalysisRequestHandler)
+    server.engine = engine
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the analysis data frames and plots over local HTTP, with the '
+                                                 'database connections, data frames and plots kept warm in memory.')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Host the server is bound to.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port the server listens on.')
+    args = parser.parse_args()
+
+    os.makedirs(PLOTS_DIRECTORY, exist_ok=True)
+    server = create_server(create_read_only_engine(), args.host, args.port)
+    print(f'Serving the analysis on http://{args.host}:{server.server_port}/, e.g. /datasets and /plots')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import json
+import numpy as np
+import os
+import pandas as pd
+import sqlalchemy as sql
+import subprocess
+import tempfile
+import time
+
+from retrieve_data import (
+    clean_dataset, create_sqlite_table, declared_column_types, derived_table_statements, ingest_journal_mode,
+    is_numeric_type, parsed_compact_types
+)
+
+BENCHMARK_RESULTS_PATH = '../data/benchmarks/benchmark_results.jsonl'
+BENCHMARK_SUITES = ('clean', 'load', 'queries')
+DEFAULT_ROW_COUNTS = (10000, 100000, 1000000)
+# Dimension tables hold one row per borough, regardless of the size of the fact tables joined against them
+DIMENSION_TABLES = ('london_borough_profiles',)
+
+BOROUGHS = [
+    'City of London', 'Barking and Dagenham', 'Barnet', 'Bexley', 'Brent', 'Bromley', 'Camden', 'Croydon', 'Ealing',
+    'Enfield', 'Greenwich', 'Hackney', 'Hammersmith and Fulham', 'Haringey', 'Harrow', 'Havering', 'Hillingdon',
+    'Hounslow', 'Islington', 'Kensington and Chelsea', 'Kingston upon Thames', 'Lambeth', 'Lewisham', 'Merton',
+    'Newham', 'Redbridge', 'Richmond upon Thames', 'Southwark', 'Sutton', 'Tower Hamlets', 'Waltham Forest',
+    'Wandsworth', 'Westminster'
+]
+MAJOR_CATEGORIES = [
+    'Burglary', 'Criminal Damage', 'Drugs', 'Fraud or Forgery', 'Other Notifiable Offences', 'Robbery',
+    'Sexual Offences', 'Theft and Handling', 'Violence Against the Person'
+]
+
+# Pay columns hold pound-formatted values in the csv-files, e.g. '£23,440'
+PAY_COLUMNS = ('gross_annual_pay', 'mean_salary')
+
+# Wrong entries handled by clean_dataset, inserted into the numeric and the text columns of the generated data
+DIRTY_VALUES = ['#', '.', 'nan', '£12,345', '12,345']
+DIRTY_TEXT_VALUES = ['#', '.', 'nan', '-']
+
+
+def generate_dirty_data(file_info, num_rows, seed=0, dirty_fraction=0.05):
+    """
+    Generates a dataframe in the shape of a renamed csv-file, containing the wrong entries handled by clean_dataset.
+    Area names are drawn from the London boroughs, so the generated tables can be joined like the real ones. Columns
+    with 'compact_types' hold clean values, parsed into these types as far as read_dataset does. Numeric values are
+    drawn from the range declared in the 'constraints' of their column, pay values are formatted like '£23,440'.
+    :param file_info: Information about the file which is to be generated. Retrievable from the csv_files_info.json.
+    :param num_rows: Number of rows of the generated dataframe.
+    :param seed: Seed of the random number generator.
+    :param dirty_fraction: Fraction of the values of every column without a compact type which are replaced by wrong
+    entries.
+    :return: The generated dataframe.
+    """
+    rng = np.random.default_rng(seed)
+    compact_types = file_info.get('compact_types', {})
+    columns = {}
+    for col, col_type in file_info['column_types'].items():
+        if col == 'year':
+            columns[col] = rng.integers(2008, 2017, num_rows)
+        elif col == 'month':
+            columns[col] = rng.integers(1, 13, num_rows)
+        elif col == 'date':
+            columns[col] = pd.to_datetime({
+                'year': rng.integers(2008, 2017, num_rows), 'month': rng.integers(1, 13, num_rows), 'day': 1
+            }).dt.strftime('%Y-%m-%d')
+        elif col in ('borough', 'area_name'):
+            columns[col] = rng.choice(BOROUGHS, num_rows)
+        elif col == 'area':
+            columns[col] = rng.choice([borough.lower() for borough in BOROUGHS], num_rows)
+        elif col == 'major_category':
+            columns[col] = rng.choice(MAJOR_CATEGORIES, num_rows)
+        elif col_type == 'object':
+            columns[col] = rng.choice([f'{col}_{i}' for i in range(32)], num_rows)
+        elif col in compact_types:
+            columns[col] = rng.integers(0, 100, num_rows)
+        elif col in PAY_COLUMNS:
+            columns[col] = [f'£{value:,}' for value in rng.integers(20000, 50001, num_rows)]
+        else:
+            lower_bound, upper_bound = file_info.get('constraints', {}).get(col, {}).get('range', [0, None])
+            columns[col] = rng.integers(lower_bound or 0, (upper_bound or 99999) + 1, num_rows)
+        if col not in compact_types:
+            values = np.array(columns[col], dtype=object)
+            dirty = rng.random(num_rows) < dirty_fraction
+            values[dirty] = rng.choice(DIRTY_VALUES if is_numeric_type(col_type) else DIRTY_TEXT_VALUES, dirty.sum())
+            columns[col] = values
+    return pd.DataFrame(columns).astype(parsed_compact_types(file_info))
+
+
+def generate_table_data(file_info, num_rows, seed=0):
+    """
+    :param file_info: Information about the file which is to be generated. Retrievable from the csv_files_info.json.
+    :param num_rows: Number of rows of the generated fact tables. Dimension tables get one clean row per borough.
+    :param seed: Seed of the random number generator.
+    :return: The generated dataframe, see generate_dirty_data.
+    """
+    if file_info['table_name'] in DIMENSION_TABLES:
+        return generate_dirty_data(file_info, len(BOROUGHS), seed, dirty_fraction=0).assign(area_name=BOROUGHS)
+    return generate_dirty_data(file_info, num_rows, seed)
+
+
+def time_best_of(function, repeat):
+    """
+    :param function: The function which is timed, called without arguments.
+    :param repeat: Number of timed runs.
+    :return: The seconds of the fastest run.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_clean_dataset(file_info, num_rows, repeat=3):
+    """
+    :param file_info: Information about the file which is to be benchmarked. Retrievable from the csv_files_info.json.
+    :param num_rows: Number of rows of the benchmarked dataframe.
+    :param repeat: Number of timed runs. The fastest one is reported.
+    :return: Seconds needed to clean the dataframe.
+    """
+    df = generate_dirty_data(file_info, num_rows)
+    return time_best_of(lambda: clean_dataset(df.copy(), file_info), repeat)
+
+
+def benchmark_create_sqlite_table(file_info, num_rows, repeat=3):
+    """
+    :param file_info: Information about the file which is to be benchmarked. Retrievable from the csv_files_info.json.
+    :param num_rows: Number of rows of the generated dataframe, before cleaning.
+    :param repeat: Number of timed runs. The fastest one is reported.
+    :return: Seconds needed to load the cleaned dataframe into a new SQLite database.
+    """
+    tidy_df = clean_dataset(generate_dirty_data(file_info, num_rows), file_info)
+    with tempfile.TemporaryDirectory() as directory:
+        def load():
+            database_path = os.path.join(directory, f'{time.perf_counter_ns()}.sqlite')
+            engine = sql.create_engine(f'sqlite:///{database_path}')
+            with ingest_journal_mode(engine):
+                create_sqlite_table(tidy_df, file_info['table_name'], engine, declared_column_types(file_info))
+            engine.dispose()
+        return time_best_of(load, repeat)
+
+
+def create_benchmark_database(csv_files_info, num_rows, database_path):
+    """
+    Creates a SQLite database with all tables of the csv_files_info.json, filled with cleaned generated data.
+    :param csv_files_info: Information about all files. Retrievable from the csv_files_info.json.
+    :param num_rows: Number of rows of every generated fact table, before cleaning, see generate_table_data.
+    :param database_path: The path of the created database.
+    :return: SQLite database engine.
+    """
+    engine = sql.create_engine(f'sqlite:///{database_path}')
+    with ingest_journal_mode(engine):
+        for seed, file_info in enumerate(csv_files_info):
+            tidy_df = clean_dataset(generate_table_data(file_info, num_rows, seed), file_info)
+            create_sqlite_table(tidy_df, file_info['table_name'], engine, declared_column_types(file_info))
+            with engine.begin() as connection:
+                for statement in derived_table_statements(file_info):
+                    connection.exec_driver_sql(statement)
+    return engine
+
+
+def benchmark_queries(csv_files_info, num_rows, repeat=3):
+    """
+    Times every query of the analysis, without the query cache, on a database of generated data.
+    :param csv_files_info: Information about all files. Retrievable from the csv_files_info.json.
+    :param num_rows: Number of rows of every generated fact table, before cleaning.
+    :param repeat: Number of timed runs. The fastest one is reported.
+    :return: Dictionary mapping every query to the seconds needed to run it.
+    """
+    from analyse_data import QUERY_DICT
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_benchmark_database(csv_files_info, num_rows, os.path.join(directory, 'data.sqlite'))
+        timings = {key: time_best_of(lambda: pd.read_sql_query(query, engine), repeat)
+                   for key, query in QUERY_DICT.items()}
+        engine.dispose()
+    return timings
+
+
+def git_revision():
+    """
+    :return: The current git commit or None outside a git repository.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_previous_results(results_path):
+    """
+    :param results_path: The path of the file in which the benchmark results are stored.
+    :return: Dictionary mapping suite, name and row count to the latest stored result.
+    """
+    previous_results = {}
+    if os.path.exists(results_path):
+        with open(results_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                result = json.loads(line)
+                previous_results[(result['suite'], result['name'], result['rows'])] = result
+    return previous_results
+
+
+def record_result(results, previous_results, suite, name, num_rows, seconds):
+    """
+    Adds the result to the results of this run and prints it, compared to the previous result of the same benchmark.
+    :param results: List of the results of this run.
+    :param previous_results: The latest stored results, as returned by read_previous_results.
+    :param suite: The benchmark suite, one of BENCHMARK_SUITES.
+    :param name: The benchmarked table or query.
+    :param num_rows: Number of generated rows.
+    :param seconds: The measured seconds.
+    """
+    result = {'suite': suite, 'name': name, 'rows': num_rows, 'seconds': seconds, 'rows_per_second': num_rows / seconds}
+    results.append(result)
+    comparison = ''
+    previous_result = previous_results.get((suite, name, num_rows))
+    if previous_result:
+        comparison = f" ({previous_result['seconds'] / seconds:.2f}x vs. {previous_result['revision']})"
+    print(f"{suite} {name} with {num_rows:,} rows: {seconds:.4f} s, {result['rows_per_second']:,.0f} rows/s"
+          f"{comparison}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data pipeline and the analysis on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS,
+                        help='Numbers of generated rows per table, e.g. 10000 1000000 20000000.')
+    parser.add_argument('--suites', nargs='+', choices=BENCHMARK_SUITES, default=BENCHMARK_SUITES,
+                        help='Benchmark suites to run.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs per benchmark.')
+    parser.add_argument('--results', default=BENCHMARK_RESULTS_PATH,
+                        help='Path of the file in which the results are stored and compared.')
+    args = parser.parse_args()
+
+    with open('csv_files_info.json', 'r', encoding='utf-8', errors='replace') as file:
+        csv_files_info = json.load(file)
+
+    previous_results = read_previous_results(args.results)
+    results = []
+    for num_rows in args.rows:
+        if 'clean' in args.suites:
+            for file_info in csv_files_info:
+                seconds = benchmark_clean_dataset(file_info, num_rows, args.repeat)
+                record_result(results, previous_results, 'clean', file_info['table_name'], num_rows, seconds)
+        if 'load' in args.suites:
+            for file_info in csv_files_info:
+                seconds = benchmark_create_sqlite_table(file_info, num_rows, args.repeat)
+                record_result(results, previous_results, 'load', file_info['table_name'], num_rows, seconds)
+        if 'queries' in args.suites:
+            for key, seconds in benchmark_queries(csv_files_info, num_rows, args.repeat).items():
+                record_result(results, previous_results, 'queries', key, num_rows, seconds)
+
+    # Store the results, so later runs can be compared against them
+    os.makedirs(os.path.dirname(args.results), exist_ok=True)
+    run = {'revision': git_revision(), 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+    with open(args.results, 'a', encoding='utf-8') as file:
+        for result in results:
+            file.write(json.dumps(dict(run, **result)) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import pandas as pd
+
+# Inferred types of the object columns mixing numbers and text
+MIXED_TYPES = ('mixed', 'mixed-integer')
+
+
+def normalize_mixed_types(df):
+    """
+    Columns mixing several types, e.g. numbers and text parsed from a csv-file or read from a SQLite column without
+    type affinity, can not be stored in the columnar formats Parquet and Feather. The values of these columns are
+    converted to text, missing values are kept.
+    :param df: The dataframe which is to be stored.
+    :return: The dataframe with text instead of mixed values. The dataframe itself is returned if no column mixes types.
+    """
+    mixed_columns = [
+        col for col, dtype in df.dtypes.items()
+        if dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) in MIXED_TYPES
+    ]
+    if not mixed_columns:
+        return df
+    return df.assign(**{col: df[col].where(df[col].isna(), df[col].astype(str)) for col in mixed_columns})
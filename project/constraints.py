@@ -0,0 +1,98 @@
+import functools
+import json
+import numpy as np
+import pandas as pd
+import re
+
+
+def text_values(values):
+    """
+    :param values: The values of a column.
+    :return: The values as text. Text and categorical columns are returned as they are, as the string methods of
+    categorical columns only run on their categories.
+    """
+    if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    return values.astype(str)
+
+
+def compile_constraint(column, kind, argument):
+    """
+    :param column: The column which is constrained.
+    :param kind: The kind of the constraint, one of 'not_null', 'range', 'allowed_values' and 'pattern'.
+    :param argument: The argument of the constraint, e.g. [lower_bound, upper_bound] of a range. Open bounds are null.
+    :return: Function returning the mask of the values satisfying the constraint. Missing values only violate
+    the 'not_null' constraint.
+    """
+    if kind == 'not_null':
+        return lambda values: values.notna()
+    if kind == 'range':
+        lower_bound, upper_bound = argument
+        lower_bound = -np.inf if lower_bound is None else lower_bound
+        upper_bound = np.inf if upper_bound is None else upper_bound
+        return lambda values: pd.to_numeric(values, errors='coerce').between(lower_bound, upper_bound) | values.isna()
+    if kind == 'allowed_values':
+        return lambda values: values.isin(argument) | values.isna()
+    if kind == 'pattern':
+        pattern = re.compile(argument)
+        return lambda values: text_values(values).str.match(pattern, na=False) | values.isna()
+    raise ValueError(f"Unknown constraint '{kind}' of column '{column}'")
+
+
+@functools.lru_cache(maxsize=None)
+def compile_constraints(constraints):
+    """
+    :param constraints: The constraints of a file info as JSON string, mapping every column to its constraints.
+    :return: Tuple of the rules, each a tuple of its name '<column>.<kind>', its column and its compiled constraint.
+    """
+    return tuple(
+        (f'{column}.{kind}', column, compile_constraint(column, kind, argument))
+        for column, column_constraints in json.loads(constraints).items()
+        for kind, argument in column_constraints.items()
+        if argument is not False
+    )
+
+
+def apply_constraints(df, file_info):
+    """
+    Applies the 'constraints' of the file info to the dataframe. They are compiled once per file info, every chunk is
+    then checked in a single pass of vectorized column masks.
+    :param df: The dataframe which is to be checked.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: Tuple of the rows satisfying all constraints and a dictionary of the number of rows rejected by every rule.
+    """
+    rules = compile_constraints(json.dumps(file_info.get('constraints', {}), sort_keys=True))
+    valid_rows = np.ones(len(df), dtype=bool)
+    rejections = {}
+    for rule, column, satisfies in rules:
+        mask = satisfies(df[column]).to_numpy(dtype=bool)
+        rejections[rule] = int(len(mask) - np.count_nonzero(mask))
+        valid_rows &= mask
+    if not rules or valid_rows.all():
+        return df, rejections
+    return df[valid_rows], rejections
+
+
+def apply_type_bounds(df, column_types):
+    """
+    Checks the values of the columns converted into integer types, e.g. into 'int16' of the 'compact_types', against
+    the bounds of these types. Values outside of the bounds would otherwise wrap around silently on the conversion.
+    :param df: The dataframe which is to be checked.
+    :param column_types: Dictionary of the types the columns are converted into.
+    :return: Tuple of the rows within the bounds of all types and a dictionary of the number of rows rejected by every
+    rule '<column>.type_range'.
+    """
+    valid_rows = np.ones(len(df), dtype=bool)
+    rejections = {}
+    for column, col_type in column_types.items():
+        dtype = pd.api.types.pandas_dtype(col_type)
+        if column not in df.columns or dtype.kind not in 'iu':
+            continue
+        bounds = np.iinfo(dtype)
+        mask = pd.to_numeric(df[column], errors='coerce').between(bounds.min, bounds.max) | df[column].isna()
+        mask = mask.to_numpy(dtype=bool)
+        rejections[f'{column}.type_range'] = int(len(mask) - np.count_nonzero(mask))
+        valid_rows &= mask
+    if valid_rows.all():
+        return df, rejections
+    return df[valid_rows], rejections
@@ -0,0 +1,160 @@
+import contextlib
+import cProfile
+import json
+import os
+import time
+
+# Measurements of the current run, mapping every table to its stages and their accumulated measurements
+run_report = {}
+
+# Directory into which a cProfile dump of every stage is written, profiling is disabled if None
+profile_directory = None
+profiles = {}
+
+
+def enable_profiling(directory):
+    """
+    :param directory: Directory into which a cProfile dump of every stage is written. None disables profiling.
+    """
+    global profile_directory
+    profile_directory = directory
+    profiles.clear()
+
+
+def new_measurement():
+    """
+    :return: Empty measurement of a stage.
+    """
+    return {'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'peak_rss': None, 'rows_in': 0, 'rows_out': 0}
+
+
+def reset_peak_rss():
+    """
+    Resets the peak resident set size of the process, so the peak of the following stage can be measured on its own.
+    This is only supported on Linux, elsewhere the peak since the start of the process is measured.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """
+    :return: The peak resident set size of the process in bytes or None if it can not be determined.
+    """
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextlib.contextmanager
+def measure_stage(table_name, stage):
+    """
+    Measures wall time, CPU time and peak RSS of the stage and adds them to the run report. Stages run several times,
+    e.g. once per chunk, are accumulated. The rows going into and coming out of the stage can be set on the yielded
+    dictionary.
+    :param table_name: The table which is processed in the stage.
+    :param stage: Name of the stage, e.g. 'read' or 'clean'.
+    :return: Context manager yielding the dictionary of the row counts.
+    """
+    rows = {'rows_in': 0, 'rows_out': 0}
+    profile = None
+    if profile_directory:
+        profile = profiles.setdefault((table_name, stage), cProfile.Profile())
+    reset_peak_rss()
+    start_wall_time, start_cpu_time = time.perf_counter(), time.process_time()
+    if profile:
+        profile.enable()
+    try:
+        yield rows
+    finally:
+        if profile:
+            profile.disable()
+        measurement = run_report.setdefault(table_name, {}).setdefault(stage, new_measurement())
+        measurement['calls'] += 1
+        measurement['wall_time'] += time.perf_counter() - start_wall_time
+        measurement['cpu_time'] += time.process_time() - start_cpu_time
+        measurement['peak_rss'] = max(filter(None, (measurement['peak_rss'], peak_rss())), default=None)
+        measurement['rows_in'] += rows['rows_in']
+        measurement['rows_out'] += rows['rows_out']
+
+
+def measure_iterator(table_name, stage, iterator):
+    """
+    Measures every step of the iterator as one call of the stage. The rows of every yielded dataframe are counted
+    as rows coming out of the stage.
+    :param table_name: The table which is processed in the stage.
+    :param stage: Name of the stage, e.g. 'read'.
+    :param iterator: Iterator of dataframes.
+    :return: Generator of the dataframes of the iterator.
+    """
+    iterator = iter(iterator)
+    while True:
+        with measure_stage(table_name, stage) as rows:
+            df = next(iterator, None)
+            rows['rows_out'] = 0 if df is None else len(df)
+        if df is None:
+            return
+        yield df
+
+
+def record_rejections(table_name, stage, rejections):
+    """
+    Adds the number of rows rejected by every rule in the stage, e.g. by the constraints checked while cleaning, to
+    the run report.
+    :param table_name: The table which is processed in the stage.
+    :param stage: Name of the stage, e.g. 'clean'.
+    :param rejections: Dictionary of the number of rows rejected by every rule.
+    """
+    measurement = run_report.setdefault(table_name, {}).setdefault(stage, new_measurement())
+    rule_rejections = measurement.setdefault('rejections', {})
+    for rule, count in rejections.items():
+        rule_rejections[rule] = rule_rejections.get(rule, 0) + count
+
+
+def merge_run_report(report):
+    """
+    Adds the measurements of another process, e.g. of a worker of the parallel import, to the run report.
+    :param report: The run report of the other process.
+    """
+    for table_name, stages in report.items():
+        for stage, other in stages.items():
+            measurement = run_report.setdefault(table_name, {}).setdefault(stage, new_measurement())
+            for key in ('calls', 'wall_time', 'cpu_time', 'rows_in', 'rows_out'):
+                measurement[key] += other[key]
+            measurement['peak_rss'] = max(filter(None, (measurement['peak_rss'], other['peak_rss'])), default=None)
+            if 'rejections' in other:
+                record_rejections(table_name, stage, other['rejections'])
+
+
+def dump_profiles():
+    """
+    Writes the cProfile dump of every profiled stage as '<table_name>.<stage>.<pid>.prof' into the profile directory.
+    """
+    if not profile_directory:
+        return
+    os.makedirs(profile_directory, exist_ok=True)
+    for (table_name, stage), profile in profiles.items():
+        profile.dump_stats(os.path.join(profile_directory, f'{table_name}.{stage}.{os.getpid()}.prof'))
+    profiles.clear()
+
+
+def write_run_report(report_path):
+    """
+    Writes the run report as JSON file.
+    :param report_path: The path of the JSON file.
+    """
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as file:
+        json.dump({'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'tables': run_report}, file, indent=4)
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+
+from partitions import list_partitions
+
+MANIFEST_TABLE = 'ingest_manifest'
+STAGING_SUFFIX = '__staging'
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_info_hash(file_info):
+    """
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: SHA-256 hash of the file info, independent of the order of its keys.
+    """
+    return hashlib.sha256(json.dumps(file_info, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def content_hash(file_path):
+    """
+    :param file_path: The path of the file which is to be hashed.
+    :return: SHA-256 hash of the file content. The file is read in blocks, so it is never held in memory as a whole.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def create_manifest_table(cursor):
+    """
+    :param cursor: Cursor of a raw SQLite connection.
+    """
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{MANIFEST_TABLE}" (table_name TEXT PRIMARY KEY, file_path TEXT, '
+        f'content_hash TEXT, size INTEGER, mtime_ns INTEGER, info_hash TEXT)'
+    )
+
+
+def read_manifest_entry(engine, table_name):
+    """
+    :param engine: SQLite database engine.
+    :param table_name: The table of which the manifest entry is read.
+    :return: The manifest entry as dictionary or None if the table was never ingested.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        create_manifest_table(cursor)
+        cursor.execute(f'SELECT * FROM "{MANIFEST_TABLE}" WHERE table_name = ?', (table_name,))
+        row = cursor.fetchone()
+        return dict(zip([column[0] for column in cursor.description], row)) if row else None
+    finally:
+        connection.close()
+
+
+def write_manifest_entry(cursor, entry):
+    """
+    :param cursor: Cursor of a raw SQLite connection.
+    :param entry: The manifest entry which is to be written. An existing entry of the same table is replaced.
+    """
+    create_manifest_table(cursor)
+    cursor.execute(
+        f'INSERT OR REPLACE INTO "{MANIFEST_TABLE}" (table_name, file_path, content_hash, size, mtime_ns, info_hash) '
+        f'VALUES (:table_name, :file_path, :content_hash, :size, :mtime_ns, :info_hash)', entry
+    )
+
+
+def check_source(engine, file_path, file_info):
+    """
+    Compares the source file with its manifest entry. If size, modification time and file info did not change, the
+    file is considered unchanged without reading it. Otherwise, the content hash decides.
+    :param engine: SQLite database engine.
+    :param file_path: The path specifying where the file is located.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: Tuple of a flag whether the file is unchanged and its current manifest entry.
+    """
+    stat = os.stat(file_path)
+    entry = {
+        'table_name': file_info['table_name'], 'file_path': file_path, 'content_hash': None, 'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns, 'info_hash': file_info_hash(file_info)
+    }
+    previous_entry = read_manifest_entry(engine, file_info['table_name'])
+    if previous_entry and all(previous_entry[key] == entry[key] for key in ('size', 'mtime_ns', 'info_hash')):
+        return True, previous_entry
+
+    entry['content_hash'] = content_hash(file_path)
+    if previous_entry and all(previous_entry[key] == entry[key] for key in ('content_hash', 'info_hash')):
+        # Only the modification time changed, remember it to take the fast path next time
+        connection = engine.raw_connection()
+        try:
+            write_manifest_entry(connection.cursor(), entry)
+            connection.commit()
+        finally:
+            connection.close()
+        return True, entry
+    return False, entry
+
+
+def drop_table_or_view(cursor, table_name):
+    """
+    :param cursor: Cursor of a raw SQLite connection.
+    :param table_name: The table which is to be dropped, if it exists. Partitioned tables are dropped as view.
+    """
+    cursor.execute("SELECT type FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table_name,))
+    row = cursor.fetchone()
+    if row:
+        cursor.execute(f'DROP {row[0].upper()} "{table_name}"')
+
+
+def drop_staging_tables(engine, table_name):
+    """
+    :param engine: SQLite database engine.
+    :param table_name: The table whose staging table and staged partitions are dropped, if they exist.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f'DROP TABLE IF EXISTS "{table_name}{STAGING_SUFFIX}"')
+        for staging_table in list_partitions(cursor, table_name, STAGING_SUFFIX).values():
+            cursor.execute(f'DROP TABLE "{staging_table}"')
+        connection.commit()
+    finally:
+        connection.close()
@@ -0,0 +1,49 @@
+import re
+
+PARTITION_SEPARATOR = '__'
+
+
+def partition_table_name(table_name, value):
+    """
+    :param table_name: The partitioned table.
+    :param value: The value of the partition column, e.g. the year, which all rows of the partition share.
+    :return: The name of the table storing the partition.
+    """
+    return f'{table_name}{PARTITION_SEPARATOR}{int(value)}'
+
+
+def list_partitions(cursor, table_name, suffix=''):
+    """
+    :param cursor: Cursor of a raw SQLite connection.
+    :param table_name: The partitioned table.
+    :param suffix: Suffix of the partition tables, e.g. the staging suffix.
+    :return: Dictionary mapping the value of every partition to the table storing it, sorted by the values.
+    """
+    pattern = re.compile(rf'{re.escape(table_name + PARTITION_SEPARATOR)}(\d+){re.escape(suffix)}')
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+                   (f'{table_name}{PARTITION_SEPARATOR}[0-9]*',))
+    matches = (pattern.fullmatch(row[0]) for row in cursor.fetchall())
+    partitions = {int(match[1]): match[0] for match in matches if match}
+    return dict(sorted(partitions.items()))
+
+
+def create_union_view_statement(table_name, partition_column, columns, partitions):
+    """
+    The partition column is not stored in the partitions, every partition selects its value as constant instead.
+    SQLite pushes the predicates of a query on the view down into every partition, where a predicate on the partition
+    column becomes constant. Partitions for which it is false are skipped without reading them.
+    :param table_name: The partitioned table, which becomes the name of the view.
+    :param partition_column: The column by which the table is partitioned.
+    :param columns: All columns of the table, in their order.
+    :param partitions: Dictionary mapping the value of every partition to the table storing it.
+    :return: SQL statement creating the view.
+    """
+    selects = [
+        'SELECT ' + ', '.join(f'{value} AS "{col}"' if col == partition_column else f'"{col}"' for col in columns)
+        + f' FROM "{partition_table}"'
+        for value, partition_table in partitions.items()
+    ]
+    if not selects:
+        # An empty view still has the columns of the table
+        selects = ['SELECT ' + ', '.join(f'NULL AS "{col}"' for col in columns) + ' WHERE 0']
+    return f'CREATE VIEW "{table_name}" AS ' + ' UNION ALL '.join(selects)
@@ -32,4 +32,4 @@ pip3 install --upgrade $required_packages
 ## For own data security, ensure that other users on your computer do not have access to those credentials.
 
 # Run Python data_pipeline
-python retrieve_data.py
+python retrieve_data.py --parallel
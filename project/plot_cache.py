@@ -0,0 +1,147 @@
+import contextlib
+import fcntl
+import hashlib
+import inspect
+import json
+import matplotlib
+import os
+import pandas as pd
+import seaborn as sns
+import tempfile
+import types
+
+PLOT_MANIFEST_NAME = 'plot_manifest.json'
+
+
+def data_frame_fingerprint(df):
+    """
+    :param df: Data frame which is plotted.
+    :return: SHA-256 hash of the column names, data types, index and values of the data frame.
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(json.dumps([[str(column), str(dtype)] for column, dtype in df.dtypes.items()]).encode('utf-8'))
+    sha256.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return sha256.hexdigest()
+
+
+def code_names(code):
+    """
+    :param code: Code object of a function.
+    :return: The global names used by the code, including the ones of nested functions and comprehensions.
+    """
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names |= code_names(constant)
+    return names
+
+
+def render_parameters(render):
+    """
+    Collects the source of the render function and of the functions of its module it calls, directly or indirectly,
+    and the values of the constants it uses. Modules like pyplot are covered by their versions instead.
+    :param render: Render function of a plot job.
+    :return: List of the plotting parameters as strings.
+    """
+    parameters = [f'matplotlib {matplotlib.__version__}', f'seaborn {sns.__version__}']
+    functions, pending = {}, [render]
+    while pending:
+        function = pending.pop()
+        if function.__name__ in functions:
+            continue
+        functions[function.__name__] = inspect.getsource(function)
+        for name in sorted(code_names(function.__code__)):
+            value = function.__globals__.get(name)
+            if isinstance(value, types.FunctionType) and value.__module__ == render.__module__:
+                pending.append(value)
+            elif isinstance(value, (str, int, float, tuple)):
+                parameters.append(f'{name} = {value!r}')
+    return parameters + [functions[name] for name in sorted(functions)]
+
+
+def plot_fingerprint(name, render, data_frames):
+    """
+    :param name: Name of the plot job.
+    :param render: Render function of the plot job.
+    :param data_frames: List of the data frames passed to the render function.
+    :return: SHA-256 hash of the input data frames and the plotting parameters of the plot job.
+    """
+    sha256 = hashlib.sha256(name.encode('utf-8'))
+    for parameter in sorted(set(render_parameters(render))):
+        sha256.update(parameter.encode('utf-8'))
+    for df in data_frames:
+        sha256.update(data_frame_fingerprint(df).encode('utf-8'))
+    return sha256.hexdigest()
+
+
+def read_plot_manifest(plots_directory):
+    """
+    :param plots_directory: Directory in which the plots are saved.
+    :return: Dictionary mapping every rendered plot job to the fingerprint it was rendered with and the file name of
+    its plot. Empty if no manifest was written yet or it can not be read.
+    """
+    try:
+        with open(os.path.join(plots_directory, PLOT_MANIFEST_NAME), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_plot_manifest(plots_directory, manifest):
+    """
+    The manifest is replaced atomically, so an interrupted run never leaves a partially written manifest behind.
+    Every writer writes its own temporary file.
+    :param plots_directory: Directory in which the plots are saved.
+    :param manifest: Dictionary as returned by read_plot_manifest.
+    """
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=plots_directory, suffix='.tmp', delete=False) as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+    os.replace(file.name, os.path.join(plots_directory, PLOT_MANIFEST_NAME))
+
+
+@contextlib.contextmanager
+def locked_plot_manifest(plots_directory):
+    """
+    Holds an exclusive lock on the plot manifest while it is read, modified and written, so concurrent writers like
+    analyse_data.py and the analysis server do not lose the entries of each other.
+    :param plots_directory: Directory in which the plots are saved.
+    :return: Context manager yielding the current manifest, which is written once the context is left without error.
+    """
+    with open(os.path.join(plots_directory, PLOT_MANIFEST_NAME + '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            manifest = read_plot_manifest(plots_directory)
+            yield manifest
+            write_plot_manifest(plots_directory, manifest)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def is_plot_current(manifest, name, fingerprint, plots_directory):
+    """
+    :param manifest: Dictionary as returned by read_plot_manifest.
+    :param name: Name of the plot job.
+    :param fingerprint: Current fingerprint of the plot job, see plot_fingerprint.
+    :param plots_directory: Directory in which the plots are saved.
+    :return: Whether the plot was rendered with the same fingerprint and its file still exists.
+    """
+    entry = manifest.get(name)
+    return (entry is not None and entry['fingerprint'] == fingerprint
+            and os.path.exists(os.path.join(plots_directory, entry['file_name'])))
+
+
+def remove_stale_plots(manifest, previous_manifest, plots_directory):
+    """
+    Removes the plots which were recorded in the previous manifest, but are no longer part of the manifest, e.g. the
+    plots of removed plot jobs or of plot jobs whose title changed.
+    :param manifest: Dictionary as returned by read_plot_manifest, after the plots were rendered.
+    :param previous_manifest: Dictionary as returned by read_plot_manifest, before the plots were rendered.
+    :param plots_directory: Directory in which the plots are saved.
+    :return: The file names of the removed plots.
+    """
+    current_file_names = {entry['file_name'] for entry in manifest.values()}
+    stale_file_names = sorted({entry['file_name'] for entry in previous_manifest.values()} - current_file_names)
+    for file_name in stale_file_names:
+        if os.path.exists(os.path.join(plots_directory, file_name)):
+            os.remove(os.path.join(plots_directory, file_name))
+    return stale_file_names
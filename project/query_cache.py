@@ -0,0 +1,127 @@
+import hashlib
+import os
+import pandas as pd
+import re
+import tempfile
+import time
+
+from columnar import normalize_mixed_types
+
+QUERY_CACHE_DIRECTORY = '../data/query_cache/'
+QUERY_CACHE_MAX_BYTES = 512 * 1024 * 1024
+QUERY_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+QUERY_CACHE_EXTENSION = '.feather'
+
+
+def normalize_query(query):
+    """
+    :param query: SQL query.
+    :return: The query with collapsed whitespace and without a trailing semicolon.
+    """
+    return re.sub(r'\s+', ' ', query).strip().rstrip(';').strip()
+
+
+def database_fingerprint(engine):
+    """
+    SQLite writes to the write-ahead log first, so its size and modification time are part of the fingerprint.
+    :param engine: SQLite database engine.
+    :return: Fingerprint of the database file, which changes with every write to the database. None for databases
+    which are not stored in a file.
+    """
+    database_path = engine.url.database
+    if not database_path or database_path == ':memory:':
+        return None
+    fingerprint = []
+    for path in (database_path, database_path + '-wal'):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            if path.endswith('-wal') and stat.st_size == 0:
+                # Read-only connections leave an empty write-ahead log behind, which holds no changes
+                continue
+            fingerprint.append(f'{path}:{stat.st_size}:{stat.st_mtime_ns}')
+    return '|'.join(fingerprint)
+
+
+def query_cache_path(engine, query, cache_directory=QUERY_CACHE_DIRECTORY):
+    """
+    :param engine: SQLite database engine.
+    :param query: SQL query.
+    :param cache_directory: Directory in which the query results are cached.
+    :return: The path of the cached result of the query on the current state of the database or None if the
+    database can not be fingerprinted.
+    """
+    fingerprint = database_fingerprint(engine)
+    if fingerprint is None:
+        return None
+    key = hashlib.sha256(f'{normalize_query(query)}\n{fingerprint}'.encode('utf-8')).hexdigest()
+    return os.path.join(cache_directory, key + QUERY_CACHE_EXTENSION)
+
+
+def evict_query_cache(cache_directory=QUERY_CACHE_DIRECTORY, max_bytes=QUERY_CACHE_MAX_BYTES,
+                      max_age=QUERY_CACHE_MAX_AGE):
+    """
+    Removes all cached results which were not used within max_age seconds. If the remaining results exceed max_bytes,
+    the least recently used ones are removed as well. Results removed concurrently by another reader are skipped.
+    :param cache_directory: Directory in which the query results are cached.
+    :param max_bytes: Maximum total size of the cached results.
+    :param max_age: Maximum number of seconds since the last use of a cached result.
+    """
+    entries = []
+    for file in os.listdir(cache_directory):
+        if file.endswith(QUERY_CACHE_EXTENSION):
+            try:
+                stat = os.stat(os.path.join(cache_directory, file))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(cache_directory, file)))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for last_used, size, path in sorted(entries):
+        if last_used >= time.time() - max_age and total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+
+
+def read_sql_cached(engine, query, cache_directory=QUERY_CACHE_DIRECTORY):
+    """
+    Returns the cached result of the query if the database did not change since it was cached. Otherwise, the query
+    is executed and its result is cached in the Arrow IPC (Feather) format. Every writer writes its own temporary file
+    which atomically replaces the cached result, so concurrent readers in other processes, e.g. the analysis server,
+    never see a partially written result. A result evicted concurrently is treated as not cached.
+    :param engine: SQLite database engine.
+    :param query: SQL query.
+    :param cache_directory: Directory in which the query results are cached.
+    :return: Pandas DataFrame.
+    """
+    cache_path = query_cache_path(engine, query, cache_directory)
+    if cache_path is None:
+        return pd.read_sql_query(query, engine)
+    try:
+        # Mark the result as recently used for the eviction
+        os.utime(cache_path)
+        return pd.read_feather(cache_path)
+    except FileNotFoundError:
+        pass
+
+    # The result is returned as it is cached, so cached and queried results match
+    df = normalize_mixed_types(pd.read_sql_query(query, engine))
+    os.makedirs(cache_directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_directory, suffix='.tmp', delete=False) as file:
+        temporary_path = file.name
+    try:
+        df.to_feather(temporary_path)
+        os.replace(temporary_path, cache_path)
+    except (TypeError, ValueError) as e:
+        print(f"Result of query could not be cached: {e}")
+    except FileNotFoundError:
+        # The cache directory was removed concurrently, the result is cached by the next query
+        pass
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    evict_query_cache(cache_directory)
+    return df
@@ -1,10 +1,68 @@
+import argparse
+import contextlib
+import csv
+import itertools
 import json
+import multiprocessing
 import os
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import re
 import sqlalchemy as sql
+import urllib.parse
 import zipfile
 
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from constraints import apply_constraints, apply_type_bounds
+import instrumentation
+from instrumentation import (
+    dump_profiles, enable_profiling, measure_iterator, measure_stage, merge_run_report, record_rejections, run_report,
+    write_run_report
+)
+from manifest import STAGING_SUFFIX, check_source, drop_staging_tables
+from partitions import partition_table_name
+from queue import Empty
+from staging import read_staged_dataset, stage_dataset, staged_dataset_directory
+from table_replacement import replace_partitions, replace_table
+from table_statistics import new_table_statistics, update_table_statistics
+
+WRONG_ENTRY_PATTERN = re.compile(r'\-|nan|\#')
+CURRENCY_PATTERN = re.compile(r'£|,')
+FIXED_DATE_PATTERN = re.compile(r'\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])')
+# Arrow names the column which can not be converted by its position in the csv-file
+ARROW_COLUMN_PATTERN = re.compile(r'In CSV column #(\d+)')
+
+# Only data of these years is analysed, unless another 'year_window' is given in the file info
+DEFAULT_YEAR_WINDOW = (2014, 2016)
+
+# Parser options of a csv-file, unless others are given in the 'parser' of its file info. Files are parsed strictly
+# first, bytes which can not be decoded are only replaced when parsing the file again
+DEFAULT_PARSER_OPTIONS = {'engine': 'c', 'encoding': 'utf-8', 'encoding_errors': 'replace', 'dtype': {}}
+PARSER_ENGINES = ('c', 'pyarrow', 'python')
+
+INSERT_BATCH_SIZE = 100000
+# Settings of every connection loading a table. The journal mode is stored in the database file instead, it is only
+# switched once per load, see ingest_journal_mode
+INGEST_PRAGMAS = {'synchronous': 'OFF', 'cache_size': -262144}
+INGEST_JOURNAL_MODE = 'WAL'
+WRITER_POLL_INTERVAL = 1
+# Sent to the writer instead of a chunk, once a worker parses its file again with the 'encoding_errors' of the file info
+RESTART_IMPORT = b'restart'
+RUN_REPORT_PATH = '../data/reports/ingest_report.json'
+
+# File indexes of the searched directories, built once per run
+file_indexes = {}
+
+# Queue to the SQLite writer, set in every worker process of the parallel import
+writer_queue = None
+
+INFERRED_SQLITE_TYPES = {
+    'string': 'TEXT', 'integer': 'INTEGER', 'boolean': 'INTEGER', 'floating': 'REAL', 'mixed-integer-float': 'REAL'
+}
+
 
 def connect_to_kaggle():
     """
@@ -17,17 +75,57 @@ def connect_to_kaggle():
     return kaggle_api
 
 
-def check_file_exists(directory, file_substring):
+def build_file_index(directory):
+    """
+    :param directory: The directory which is to be indexed, including all sub-folders.
+    :return: Dictionary mapping every file extension to the names of the files with that extension and their paths.
+    """
+    file_index = {}
+    for root, _, files in os.walk(directory):
+        for file in files:
+            extension = os.path.splitext(file)[1].lower()
+            file_index.setdefault(extension, {}).setdefault(file, []).append(os.path.join(root, file))
+    return file_index
+
+
+def get_file_index(directory):
+    """
+    The index of a directory is built once and shared by all lookups, until it is invalidated.
+    :param directory: The directory of which the index is requested.
+    :return: The file index of the directory.
+    """
+    directory = os.path.abspath(directory)
+    if directory not in file_indexes:
+        file_indexes[directory] = build_file_index(directory)
+    return file_indexes[directory]
+
+
+def invalidate_file_index(directory):
+    """
+    Has to be called whenever files are added to or removed from the directory, e.g. by a download or an extraction.
+    :param directory: The directory whose index, as well as the indexes of its parent directories, is invalidated.
+    """
+    directory = os.path.abspath(directory)
+    for indexed_directory in list(file_indexes):
+        if directory == indexed_directory or directory.startswith(indexed_directory + os.sep):
+            del file_indexes[indexed_directory]
+
+
+def check_file_exists(directory, file_substring, extension=None):
     """
     :param directory: The directory in which the search is executed.
     :param file_substring: The file to check on. Can be a substring.
+    :param extension: Only files with this extension, e.g. '.csv', are considered.
     :return: The file path if a file with the substring was found.
     """
+    file_index = get_file_index(directory)
+    extensions = [extension.lower()] if extension else list(file_index)
     file_list_exists = [
-        os.path.join(root, file)
-        for root, _, files in os.walk(directory)
-        for file in files
+        file_path
+        for file_extension in extensions
+        for file, file_paths in file_index.get(file_extension, {}).items()
         if file_substring in file
+        for file_path in file_paths
     ]
     return file_list_exists
 
@@ -43,6 +141,24 @@ def download_files_from_kaggle(kaggle_api, dataset_name, author, file_name, dire
     kaggle_api.dataset_download_file(dataset=f"{author}/{dataset_name}", file_name=file_name, path=directory)
 
 
+def download_non_existing_file(kaggle_api, data_directory, file_info):
+    """
+    :param kaggle_api: Kaggle API object.
+    :param data_directory: Directory in which data file should be located.
+    :param file_info: Information about the file which is to be downloaded. Retrievable from the csv_files_info.json.
+    :return: The file paths of the downloaded file.
+    """
+    print(f"{file_info['file_name']} not found. Downloading from Kaggle...")
+    with measure_stage(file_info['table_name'], 'download'):
+        download_files_from_kaggle(
+            kaggle_api, file_info['dataset_name'], file_info['author'], file_info['file_name'],
+            data_directory + '/' + file_info['dataset_name']
+        )
+    # Zip archives are not extracted, the csv-file is streamed directly out of the archive when it is read
+    invalidate_file_index(data_directory + '/' + file_info['dataset_name'])
+    return check_file_exists(data_directory, file_info['file_name'])
+
+
 def process_non_existing_file(kaggle_api, engine, data_directory, file_info):
     """
     :param kaggle_api: Kaggle API object.
@@ -50,85 +166,811 @@ def process_non_existing_file(kaggle_api, engine, data_directory, file_info):
     :param data_directory: Directory in which data file should be located.
     :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
     """
-    print(f"{file_info['file_name']} not found. Downloading from Kaggle...")
-    download_files_from_kaggle(
-        kaggle_api, file_info['dataset_name'], file_info['author'], file_info['file_name'],
-        data_directory + '/' + file_info['dataset_name']
-    )
-    file_path = check_file_exists(data_directory, file_info['file_name']).pop()
-    if zipfile.is_zipfile(file_path):
-        with zipfile.ZipFile(file_path, "r") as zip_ref:
-            zip_ref.extractall(data_directory + '/' + file_info['dataset_name'])
-    existing_file = check_file_exists(data_directory, file_info['file_name'])
+    existing_file = download_non_existing_file(kaggle_api, data_directory, file_info)
     process_existing_file(existing_file, engine, file_info)
 
 
-def process_existing_file(existing_file, engine, file_info):
+def prepare_import(existing_file, engine, file_info):
     """
-    All files will at any point be treated in this function.
+    Checks the file against the ingest manifest and prepares an empty staging table for its import.
     :param existing_file: The path specifying where the file is located.
     :param engine: SQLite database engine.
     :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: Tuple of the csv-file path and its manifest entry or None if the file did not change since the last import
+    or can not be read.
+    """
+    try:
+        file_path = select_source_file(existing_file, file_info)
+    except FileNotFoundError as e:
+        print(f"Error reading file: {e}")
+        return None
+    with measure_stage(file_info['table_name'], 'check'):
+        is_unchanged, manifest_entry = check_source(engine, file_path, file_info)
+    if is_unchanged:
+        print(f"{file_info['file_name']} is unchanged since the last import. Skipping...")
+        return None
+
+    # The data is loaded into a staging table first, which replaces the existing table once the import succeeded
+    drop_staging_tables(engine, file_info['table_name'])
+    return file_path, manifest_entry
+
+
+def select_source_file(existing_file, file_info):
+    """
+    :param existing_file: The paths specifying where the file is located.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: The path of the csv-file or, if it was not extracted, of the zip archive containing it.
+    """
+    csv_files = [file for file in existing_file if file.lower().endswith('.csv')]
+    if csv_files:
+        return csv_files[0]
+    zip_files = [file for file in existing_file if zipfile.is_zipfile(file)]
+    if not zip_files:
+        raise FileNotFoundError(f"Neither {file_info['file_name']} nor a zip archive containing it was found among "
+                                f"{existing_file}")
+    return zip_files[0]
+
+
+def find_zip_member(zip_ref, file_name):
+    """
+    :param zip_ref: The opened zip archive.
+    :param file_name: The name of the csv-file as given in the csv_files_info.json.
+    :return: The name of the archive member holding the csv-file.
+    """
+    members = [member for member in zip_ref.namelist() if member.lower().endswith('.csv')]
+    for candidate in (file_name, urllib.parse.unquote(file_name)):
+        for member in members:
+            if os.path.basename(member) == candidate:
+                return member
+    if len(members) == 1:
+        return members[0]
+    raise FileNotFoundError(f"{file_name} not found in {zip_ref.filename}")
+
+
+@contextlib.contextmanager
+def open_source_file(file_path, file_info):
+    """
+    Opens the csv-file for reading in binary mode, so it is decoded by the parser itself. Csv-files inside zip archives
+    are streamed out of the archive, without extracting them to the disk first.
+    :param file_path: The path of the csv-file or of the zip archive containing it.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: Context manager yielding the opened binary stream of the csv-file.
+    """
+    if not zipfile.is_zipfile(file_path):
+        with open(file_path, 'rb') as file:
+            yield file
+        return
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        with zip_ref.open(find_zip_member(zip_ref, file_info['file_name'])) as member:
+            yield member
+
+
+def parser_options(file_info):
+    """
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: The DEFAULT_PARSER_OPTIONS, updated by the 'parser' of the file info.
+    """
+    options = {**DEFAULT_PARSER_OPTIONS, **file_info.get('parser', {})}
+    if options['engine'] not in PARSER_ENGINES:
+        raise ValueError(f"Unknown parser engine '{options['engine']}' of {file_info['file_name']}")
+    return options
+
+
+def retry_encoding_errors(file_info, error):
+    """
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param error: The UnicodeDecodeError raised while parsing the csv-file strictly.
+    :return: The handling of decode errors with which the csv-file is parsed again, as given by the file info. The error
+    is raised again if the file info asks for 'strict'.
+    """
+    options = parser_options(file_info)
+    if options['encoding_errors'] == 'strict':
+        raise error
+    print(f"{file_info['file_name']} contains bytes which are not {options['encoding']}, they are replaced")
+    return options['encoding_errors']
+
+
+def read_raw_dataset(file_path, file_info, content_hash=None, encoding_errors='strict'):
+    """
+    Reads the file from its staged columnar copy, if the file was already staged with the same content. Otherwise,
+    the csv-file is parsed and staged along the way, if its content hash is given.
+    :param file_path: The path of the csv-file or of the zip archive containing it.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param content_hash: Hash of the content of the csv-file.
+    :param encoding_errors: The handling of decode errors when parsing the csv-file, see retry_encoding_errors.
+    :return: Generator of dataframes, one per chunk of the file.
+    """
+    staged_directory = staged_dataset_directory(file_path, file_info, content_hash) if content_hash else None
+    if staged_directory and os.path.isdir(staged_directory):
+        print(f"Reading {file_info['file_name']} from its staged copy")
+        yield from read_staged_dataset(staged_directory, file_info)
+        return
+    with open_source_file(file_path, file_info) as file:
+        chunks = read_dataset(file, file_info, encoding_errors)
+        yield from stage_dataset(chunks, staged_directory) if staged_directory else chunks
+
+
+def read_clean_dataset(file_path, file_info, content_hash=None, encoding_errors='strict'):
+    """
+    :param file_path: The path of the csv-file or of the zip archive containing it.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param content_hash: Hash of the content of the csv-file, used to stage the file.
+    :param encoding_errors: The handling of decode errors when parsing the csv-file, see retry_encoding_errors.
+    :return: Generator of the cleaned dataframes, one per chunk of the file.
     """
-    file_path = [file for file in existing_file if file.lower().endswith('.csv')][0]
     print(f"Importing {file_info['file_name']} from file system")
+    raw_chunks = read_raw_dataset(file_path, file_info, content_hash, encoding_errors)
+    for df in measure_iterator(file_info['table_name'], 'read', raw_chunks):
+        df = df.rename(columns=file_info['new_column_names'], copy=False)
+        print(f"Clean the {file_info['file_name']} dataset...")
+        with measure_stage(file_info['table_name'], 'clean') as rows:
+            # The year window was pushed down into the read, also of the staged copy
+            tidy_df = clean_dataset(df, file_info, in_year_window=True)
+            rows['rows_in'], rows['rows_out'] = len(df), len(tidy_df)
+        yield tidy_df
+
+
+def process_existing_file(existing_file, engine, file_info):
+    """
+    All files will at any point be treated in this function. Files which did not change since their last import, as
+    recorded in the ingest manifest, are skipped. Otherwise, the table of the file is replaced as a whole.
+    :param existing_file: The path specifying where the file is located.
+    :param engine: SQLite database engine.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    """
+    prepared_import = prepare_import(existing_file, engine, file_info)
+    if prepared_import is None:
+        return
+    file_path, manifest_entry = prepared_import
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
-            df = pd.read_csv(file, usecols=file_info['important_columns'], thousands=',')
-            df.rename(columns=file_info['new_column_names'], inplace=True)
-            print(f"Clean the {file_info['file_name']} dataset...")
-            tidy_df = clean_dataset(df, file_info)
-            print(f"Creating table for {file_info['file_name']} in SQLite database...")
-            create_sqlite_table(tidy_df, file_info['table_name'], engine)
+        with ingest_journal_mode(engine):
+            try:
+                statistics = load_clean_dataset(file_path, engine, file_info, manifest_entry['content_hash'])
+            except UnicodeDecodeError as e:
+                encoding_errors = retry_encoding_errors(file_info, e)
+                drop_staging_tables(engine, file_info['table_name'])
+                statistics = load_clean_dataset(file_path, engine, file_info, manifest_entry['content_hash'],
+                                                encoding_errors)
+            with measure_stage(file_info['table_name'], 'replace'):
+                replace_staged_table(engine, file_info, manifest_entry, statistics)
     except UnicodeDecodeError as e:
         print(f"Error reading file: {e}")
 
 
-def clean_dataset(df, file_info):
+def load_clean_dataset(file_path, engine, file_info, content_hash=None, encoding_errors='strict'):
+    """
+    Loads all cleaned chunks of the file into the staging table of the file.
+    :param file_path: The path of the csv-file or of the zip archive containing it.
+    :param engine: SQLite database engine.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param content_hash: Hash of the content of the csv-file, used to stage the file.
+    :param encoding_errors: The handling of decode errors when parsing the csv-file, see retry_encoding_errors.
+    :return: The statistics of the loaded staging table.
+    """
+    staging_table = file_info['table_name'] + STAGING_SUFFIX
+    statistics = new_table_statistics()
+    for tidy_df in read_clean_dataset(file_path, file_info, content_hash, encoding_errors):
+        print(f"Creating table for {file_info['file_name']} in SQLite database...")
+        load_dataset(tidy_df, staging_table, engine, file_info, statistics)
+    return statistics
+
+
+def load_dataset(tidy_df, staging_table, engine, file_info, statistics=None):
+    """
+    :param tidy_df: The cleaned dataframe which is to be loaded.
+    :param staging_table: The staging table into which the dataframe is loaded.
+    :param engine: SQLite database engine.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param statistics: Statistics of the staging table, which are updated by the loaded rows. Tables partitioned by the
+    'partition_by' column of the file info are loaded into one staging table per partition instead, the statistics of
+    every partition are kept under 'partitions'.
+    """
+    partition_column = file_info.get('partition_by')
+    partition_dfs = {} if partition_column is None else {
+        int(value): partition_df for value, partition_df in tidy_df.groupby(partition_column, sort=True, observed=True)
+    }
+    with measure_stage(file_info['table_name'], 'load') as rows:
+        if partition_column is None:
+            create_sqlite_table(tidy_df, staging_table, engine, declared_column_types(file_info))
+        # The partition column is not stored, the view over the partitions selects it as constant
+        for value, partition_df in partition_dfs.items():
+            create_sqlite_table(partition_df.drop(columns=partition_column),
+                                partition_table_name(file_info['table_name'], value) + STAGING_SUFFIX, engine,
+                                declared_column_types(file_info))
+        rows['rows_in'] = rows['rows_out'] = len(tidy_df)
+    if statistics is not None:
+        with measure_stage(file_info['table_name'], 'statistics') as rows:
+            if partition_column is None:
+                update_table_statistics(statistics, tidy_df)
+            for value, partition_df in partition_dfs.items():
+                partition_statistics = statistics.setdefault('partitions', {})
+                update_table_statistics(partition_statistics.setdefault(value, new_table_statistics()), partition_df)
+            rows['rows_in'] = rows['rows_out'] = len(tidy_df)
+
+
+def replace_staged_table(engine, file_info, manifest_entry, statistics):
+    """
+    Replaces the table of the file by its staging table or, if the table is partitioned, by its staged partitions.
+    :param engine: SQLite database engine.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param manifest_entry: The manifest entry of the ingested file.
+    :param statistics: Statistics of the staging table, see load_dataset.
+    """
+    table_name, partition_column = file_info['table_name'], file_info.get('partition_by')
+    if partition_column is None:
+        replace_table(engine, table_name + STAGING_SUFFIX, manifest_entry, derived_table_statements(file_info),
+                      statistics)
+        return
+    partitions = sorted(statistics.get('partitions', {}))
+    swapped_partitions = replace_partitions(
+        engine, manifest_entry, partition_column, list(file_info['new_column_names'].values()), statistics,
+        derived_table_statements(file_info, partitions)
+    )
+    print(f"Swapped {len(swapped_partitions)} of {len(partitions)} partitions of {table_name}, the others are "
+          f"unchanged.")
+
+
+def derived_table_statements(file_info, partitions=None):
+    """
+    The indexes and the summary table declared for a table in the csv_files_info.json are built at ingest time, so
+    the analysis does not need to scan the whole table. The summary table sums up the declared columns per group.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param partitions: The values of the partitions of a partitioned table, on each of which the indexes are built.
+    :return: List of SQL statements building the indexes and the summary table.
+    """
+    table_name = file_info['table_name']
+    indexed_tables = [table_name] if partitions is None else \
+        [partition_table_name(table_name, value) for value in partitions]
+    statements = [
+        create_index_statement(indexed_table, columns)
+        for indexed_table in indexed_tables for columns in file_info.get('indexes', [])
+    ]
+    summary_table = file_info.get('summary_table')
+    if summary_table:
+        summary_name = summary_table['table_name']
+        group_by = ', '.join(f'"{col}"' for col in summary_table['group_by'])
+        sums = ', '.join(f'SUM("{col}") AS "{col}"' for col in summary_table['sum'])
+        statements += [
+            f'DROP TABLE IF EXISTS "{summary_name}"',
+            f'CREATE TABLE "{summary_name}" AS SELECT {group_by}, {sums} FROM "{table_name}" GROUP BY {group_by}',
+            create_index_statement(summary_name, summary_table['group_by'])
+        ]
+    return statements
+
+
+def create_index_statement(table_name, columns):
+    """
+    :param table_name: The table on which the index is created.
+    :param columns: The indexed columns.
+    :return: SQL statement creating the index.
+    """
+    column_names = ', '.join(f'"{col}"' for col in columns)
+    return f'CREATE INDEX IF NOT EXISTS "idx_{table_name}_{"_".join(columns)}" ON "{table_name}" ({column_names})'
+
+
+def init_clean_worker(queue, profile_directory=None):
+    """
+    Makes the queue to the writer available in a worker process of the pool.
+    :param queue: The queue on which the cleaned dataframes are passed to the writer.
+    :param profile_directory: Directory into which the worker writes the cProfile dumps of its stages.
+    """
+    global writer_queue
+    writer_queue = queue
+    enable_profiling(profile_directory)
+
+
+def clean_file_worker(file_path, file_info, content_hash=None):
+    """
+    Reads and cleans the file in a worker process and passes every cleaned chunk on to the writer. The end of the file
+    is signalled with None, a failed import with the error message. If the file can not be parsed strictly, the writer
+    is told to start over with RESTART_IMPORT, before the file is parsed again.
+    :param file_path: The path of the csv-file or of the zip archive containing it.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param content_hash: Hash of the content of the csv-file, used to stage the file.
+    :return: The run report of the stages run by the worker.
+    """
+    run_report.clear()
+    try:
+        try:
+            for tidy_df in read_clean_dataset(file_path, file_info, content_hash):
+                writer_queue.put((file_info['table_name'], tidy_df))
+        except UnicodeDecodeError as e:
+            encoding_errors = retry_encoding_errors(file_info, e)
+            writer_queue.put((file_info['table_name'], RESTART_IMPORT))
+            for tidy_df in read_clean_dataset(file_path, file_info, content_hash, encoding_errors):
+                writer_queue.put((file_info['table_name'], tidy_df))
+    except Exception as e:
+        writer_queue.put((file_info['table_name'], f"Error reading file: {e}"))
+        raise
+    finally:
+        dump_profiles()
+    writer_queue.put((file_info['table_name'], None))
+    return dict(run_report)
+
+
+def process_existing_files_parallel(existing_files, engine, max_workers=None):
+    """
+    Reads and cleans the files in a process pool, while the calling process is the only one writing to the SQLite
+    database. The number of cleaned dataframes waiting for the writer is bounded, so memory stays bounded as well.
+    :param existing_files: List of tuples of the file paths and the file info of every file which is to be processed.
+    :param engine: SQLite database engine.
+    :param max_workers: Number of worker processes. Defaults to the number of CPUs.
+    """
+    prepared_imports = {}
+    for existing_file, file_info in existing_files:
+        prepared_import = prepare_import(existing_file, engine, file_info)
+        if prepared_import is not None:
+            prepared_imports[file_info['table_name']] = (*prepared_import, file_info, new_table_statistics())
+    if not prepared_imports:
+        return
+
+    max_workers = min(max_workers or os.cpu_count(), len(prepared_imports))
+    chunk_queue = multiprocessing.Queue(maxsize=2 * max_workers)
+    with ingest_journal_mode(engine), ProcessPoolExecutor(
+            max_workers, initializer=init_clean_worker, initargs=(chunk_queue, instrumentation.profile_directory)
+    ) as executor:
+        futures = [
+            executor.submit(clean_file_worker, file_path, file_info, manifest_entry['content_hash'])
+            for file_path, manifest_entry, file_info, _ in prepared_imports.values()
+        ]
+
+        remaining_imports = len(prepared_imports)
+        while remaining_imports:
+            try:
+                table_name, message = chunk_queue.get(timeout=WRITER_POLL_INTERVAL)
+            except Empty:
+                # A crashed worker process can not signal the end of its file anymore
+                for future in futures:
+                    if future.done() and isinstance(future.exception(), BrokenProcessPool):
+                        raise future.exception()
+                continue
+            _, manifest_entry, file_info, statistics = prepared_imports[table_name]
+            staging_table = table_name + STAGING_SUFFIX
+            if isinstance(message, pd.DataFrame):
+                print(f"Creating table for {file_info['file_name']} in SQLite database...")
+                load_dataset(message, staging_table, engine, file_info, statistics)
+            elif message == RESTART_IMPORT:
+                drop_staging_tables(engine, table_name)
+                statistics.clear()
+                statistics.update(new_table_statistics())
+            elif message is None:
+                with measure_stage(table_name, 'replace'):
+                    replace_staged_table(engine, file_info, manifest_entry, statistics)
+                remaining_imports -= 1
+            else:
+                print(message)
+                drop_staging_tables(engine, table_name)
+                remaining_imports -= 1
+
+        # Collect the measurements of the stages run by the workers
+        for future in futures:
+            if future.exception() is None:
+                merge_run_report(future.result())
+
+
+def declared_column_types(file_info):
+    """
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: The column types of the table, with the 'compact_types' of the file info taking precedence.
+    """
+    return {**file_info['column_types'], **file_info.get('compact_types', {})}
+
+
+def is_numeric_type(col_type):
+    """
+    :param col_type: Name of a pandas data type, e.g. 'int64' or 'category'.
+    :return: Whether the values of the type are numbers.
+    """
+    return pd.api.types.is_numeric_dtype(pd.api.types.pandas_dtype(col_type))
+
+
+def parsed_compact_types(file_info):
+    """
+    Numeric compact types are not parsed directly, as a single wrong entry like '#' or an empty cell can not be parsed
+    into an integer. These columns are narrowed by clean_dataset once the rows with wrong entries are dropped.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: The 'compact_types' of the file info into which the columns are parsed directly, e.g. 'category'.
+    """
+    return {col: col_type for col, col_type in file_info.get('compact_types', {}).items()
+            if not is_numeric_type(col_type)}
+
+
+def read_dataset(file, file_info, encoding_errors='strict'):
+    """
+    Reads the file either as a whole or, if a 'chunk_size' is given in the file info, in chunks of that many rows.
+    Every chunk is cleaned and written on its own, so the memory usage does not grow with the size of the file.
+    The file is parsed by the engine given in the 'parser' of the file info. The C and the Python engine parse
+    thousands separators, the Arrow engine parses on all cores, but keeps values with thousands separators as text.
+    Columns with 'dtype' hints of the parser or with non-numeric 'compact_types' in the file info, e.g. 'category',
+    are parsed directly into these types, see parsed_compact_types.
+    :param file: The opened csv-file.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param encoding_errors: The handling of decode errors, see retry_encoding_errors.
+    :return: Iterable of dataframes.
+    """
+    options = parser_options(file_info)
+    parse_types = {**options['dtype'], **parsed_compact_types(file_info)}
+    dtype = {col: parse_types[new_col] for col, new_col in file_info['new_column_names'].items()
+             if new_col in parse_types} or None
+    # Like the staged copy, the columns are deduplicated, as only the C and the Python engine ignore duplicates
+    columns = list(dict.fromkeys(file_info['important_columns']))
+    engine = options['engine']
+    if engine == 'pyarrow' and encoding_errors != 'strict':
+        # The Arrow engine can not replace bytes which can not be decoded
+        engine = 'c'
+    chunk_size = file_info.get('chunk_size')
+    if engine == 'pyarrow' and chunk_size:
+        chunks = read_csv_batches(file, columns, dtype or {}, chunk_size, options['encoding'])
+    elif engine == 'pyarrow':
+        with raise_decode_errors(options['encoding']):
+            chunks = [pd.read_csv(file, usecols=columns, dtype=dtype, engine=engine, encoding=options['encoding'])]
+    else:
+        read_options = dict(usecols=columns, thousands=',', dtype=dtype, engine=engine,
+                            encoding=options['encoding'], encoding_errors=encoding_errors)
+        chunks = pd.read_csv(file, chunksize=chunk_size, **read_options) if chunk_size else [
+            pd.read_csv(file, **read_options)
+        ]
+    return push_down_year_window(chunks, file_info)
+
+
+def arrow_type(dtype):
+    """
+    :param dtype: Name of a pandas data type.
+    :return: The Arrow data type into which the csv-reader of Arrow parses the values of this type.
+    """
+    if dtype == 'category':
+        return pa.dictionary(pa.int32(), pa.string())
+    if dtype in ('object', 'str'):
+        return pa.string()
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+
+def read_csv_batches(file, columns, dtype, chunk_size, encoding='utf-8'):
+    """
+    Streams the csv-file through the multithreaded csv-reader of Arrow. The record batches are converted into
+    dataframes of chunk_size rows. Columns without a data type are inferred from the first block of the file, so they
+    must not change their type further down.
+    :param file: The opened csv-file.
+    :param columns: The columns which are read.
+    :param dtype: Dictionary of the data types of the columns.
+    :param chunk_size: Number of rows of every dataframe.
+    :param encoding: The encoding of the csv-file.
+    :return: Generator of dataframes.
+    """
+    # The header is read here, so the columns named by the errors of Arrow are known
+    column_names = next(csv.reader([file.readline().decode(encoding).lstrip('\ufeff')]))
+    with raise_conversion_errors(column_names, dtype), raise_decode_errors(encoding):
+        reader = pa_csv.open_csv(file, read_options=pa_csv.ReadOptions(encoding=encoding, use_threads=True,
+                                                                       column_names=column_names),
+                                 convert_options=pa_csv.ConvertOptions(
+                                     include_columns=columns,
+                                     column_types={col: arrow_type(col_type) for col, col_type in dtype.items()}
+                                 ))
+        batches, num_rows = [], 0
+        for batch in reader:
+            batches.append(batch)
+            num_rows += batch.num_rows
+            while num_rows >= chunk_size:
+                table = pa.Table.from_batches(batches, schema=reader.schema)
+                yield arrow_chunk_to_pandas(table.slice(0, chunk_size), dtype)
+                batches, num_rows = table.slice(chunk_size).to_batches(), num_rows - chunk_size
+    if num_rows:
+        yield arrow_chunk_to_pandas(pa.Table.from_batches(batches, schema=reader.schema), dtype)
+
+
+@contextlib.contextmanager
+def raise_conversion_errors(column_names, dtype):
+    """
+    Explains the values which Arrow can not convert into the type of their column. Columns with a data type hold a
+    wrong entry, the types of all other columns are inferred from the first block of the csv-file.
+    :param column_names: The columns of the csv-file, in the order of the file.
+    :param dtype: Dictionary of the data types of the columns.
+    :return: Context manager translating the errors of Arrow.
+    """
+    try:
+        yield
+    except pa.ArrowInvalid as e:
+        match = ARROW_COLUMN_PATTERN.search(str(e))
+        col = column_names[int(match.group(1))] if match else None
+        if col in dtype:
+            raise ValueError(f"Csv-file contains an entry which is not of the type {dtype[col]} declared for the "
+                             f"column '{col}': {e}") from e
+        raise ValueError(f"Csv-file can not be streamed by the Arrow engine, a column changed its type after the first "
+                         f"block. Add a 'dtype' hint for it to the 'parser' of the file info: {e}") from e
+
+
+@contextlib.contextmanager
+def raise_decode_errors(encoding):
+    """
+    Arrow reports bytes which can not be decoded as invalid data, they are raised as UnicodeDecodeError like by the
+    other engines instead.
+    :param encoding: The encoding of the csv-file.
+    :return: Context manager translating the errors of Arrow.
+    """
+    try:
+        yield
+    except pa.ArrowInvalid as e:
+        if 'invalid UTF8' in str(e):
+            raise UnicodeDecodeError(encoding, b'', 0, 0, str(e)) from e
+        raise
+
+
+def arrow_chunk_to_pandas(table, dtype):
+    """
+    :param table: Arrow table of a chunk of the csv-file.
+    :param dtype: Dictionary of the data types of the columns.
+    :return: The chunk as dataframe. Like pandas does, the categories of categorical columns are sorted instead of
+    keeping the order of their first appearance.
+    """
+    df = table.to_pandas()
+    for col, col_type in dtype.items():
+        if col_type == 'category':
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+    return df
+
+
+def push_down_year_window(chunks, file_info):
+    """
+    Drops the rows outside of the year window right after every chunk is parsed, so they are neither staged nor
+    cleaned. The window is applied to the source columns which are renamed to 'year' and 'date'.
+    :param chunks: Iterable of the dataframes parsed from the csv-file.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: Generator of the dataframes, containing only rows within the year window.
+    """
+    first_year, last_year = file_info.get('year_window', DEFAULT_YEAR_WINDOW)
+    source_columns = {new_col: col for col, new_col in file_info['new_column_names'].items()}
+    for df in chunks:
+        if 'year' in source_columns:
+            # Wrong entries keep the column as text, their rows are dropped and the others are converted to numbers
+            years = pd.to_numeric(df[source_columns['year']], errors='coerce')
+            in_window = (years >= first_year) & (years <= last_year)
+            df = df[in_window].assign(**{source_columns['year']: years[in_window]})
+        if 'date' in source_columns:
+            years, _ = parse_fixed_format_dates(df[source_columns['date']])
+            record_invalid_dates(file_info, 'read', df[source_columns['date']], years)
+            df = df[(years >= first_year) & (years <= last_year)]
+        yield df
+
+
+def clean_dataset(df, file_info, in_year_window=False):
     """
     :param df: The dataframe which is to be cleaned.
     :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param in_year_window: Whether the rows outside of the year window were already dropped by push_down_year_window.
     :return: The cleaned dataframe containing only the wanted data.
     """
     important_cols = file_info['new_column_names'].values()
 
     # Check if the column 'year' or 'date' exists
-    # If yes, convert the column to datetime and filter out all data before 2013 and past 2016
-    if 'year' in df.columns:
-        df = df[df['year'] > 2013]
-        df = df[df['year'] < 2017]
+    # If yes, filter out all data outside of the year window, by default before 2014 and past 2016
+    first_year, last_year = file_info.get('year_window', DEFAULT_YEAR_WINDOW)
+    if 'year' in df.columns and not in_year_window:
+        df = df[(df['year'] >= first_year) & (df['year'] <= last_year)]
     if 'date' in df.columns:
-        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
-        df = df.loc[(df.date.dt.year > 2013) & (df.date.dt.year < 2017)]
-        df['date'] = df['date'].dt.strftime('%Y/%m/%d')
-
-    # Replace empty strings and wrong entries with NaN
-    df.replace('\\-|nan|\\#', np.nan, regex=True, inplace=True)
-    df.replace('.', np.nan, regex=False, inplace=True)
-    df.replace(',', '', inplace=True)
-    # Convert columns that contain pound signs to numeric values
-    columns_with_pound = [col for col in df.columns if any(isinstance(val, str) and '£' in val for val in df[col])]
-    df[columns_with_pound] = df[columns_with_pound].replace({'£': '', ',': ''}, regex=True)
-    df[columns_with_pound] = df[columns_with_pound].apply(pd.to_numeric, errors='coerce')
-
-    # Drop all rows with NaN values
-    cleaned_df = df[important_cols].dropna()
-    cleaned_df = cleaned_df.astype(file_info['column_types'], errors='ignore')
+        years, dates = parse_fixed_format_dates(df['date'])
+        record_invalid_dates(file_info, 'clean', df['date'], years)
+        if in_year_window:
+            df = df.assign(date=dates)
+        else:
+            in_window = (years >= first_year) & (years <= last_year)
+            df = df.loc[in_window].assign(date=dates[in_window])
+
+    # Replace empty strings and wrong entries with NaN and convert the text of numeric columns to numeric values.
+    # Only text columns can hold these entries, so numeric columns are passed through untouched.
+    column_types = declared_column_types(file_info)
+    cleaned_df = pd.DataFrame({
+        col: clean_text_column(df[col], is_numeric_type(column_types.get(col, 'object'))) for col in important_cols
+    })
+
+    # Drop all rows violating the constraints declared in the file info and count the rejections of every rule
+    if file_info.get('constraints'):
+        cleaned_df, rejections = apply_constraints(cleaned_df, file_info)
+        record_rejections(file_info['table_name'], 'clean', rejections)
+
+    # Drop all rows with NaN values and the rows whose values do not fit into the integer types they are converted into
+    cleaned_df = cleaned_df.dropna()
+    cleaned_df, rejections = apply_type_bounds(cleaned_df, column_types)
+    if any(rejections.values()):
+        record_rejections(file_info['table_name'], 'clean', rejections)
+    cleaned_df = cleaned_df.astype(column_types, errors='ignore')
 
     return cleaned_df
 
 
-def create_sqlite_table(df, table_name, engine):
+def parse_fixed_format_dates(column):
+    """
+    Parses dates in the 'YYYY-MM-DD' format. Every distinct date is only parsed once. Dates in this fixed format are
+    parsed by slicing the string, all others are parsed with pd.to_datetime. Invalid dates of both, e.g. '2015-02-31'
+    or '2015-2-31', are treated like missing dates.
+    :param column: The column of the dates.
+    :return: Tuple of the years, NaN for missing dates, and the dates in the 'YYYY/MM/DD' format.
+    """
+    codes, uniques = pd.factorize(column)
+    uniques = np.asarray(uniques, dtype=object)
+
+    # The additional last entries belong to the code -1 of missing dates
+    years = np.full(len(uniques) + 1, np.nan)
+    dates = np.full(len(uniques) + 1, np.nan, dtype=object)
+    is_fixed = np.array([isinstance(val, str) and FIXED_DATE_PATTERN.fullmatch(val) is not None for val in uniques],
+                        dtype=bool)
+    # Only days past the 28th do not exist in every month
+    is_late = is_fixed.copy()
+    is_late[is_fixed] = [val[8:] > '28' for val in uniques[is_fixed]]
+    exists = is_fixed.copy()
+    exists[is_late] = pd.to_datetime(pd.Series(uniques[is_late]), format='%Y-%m-%d', errors='coerce').notna()
+    years[:-1][exists] = [int(val[:4]) for val in uniques[exists]]
+    dates[:-1][exists] = [val.replace('-', '/') for val in uniques[exists]]
+    if not is_fixed.all():
+        parsed_dates = pd.to_datetime(pd.Series(uniques[~is_fixed]), format='%Y-%m-%d', errors='coerce')
+        years[:-1][~is_fixed] = parsed_dates.dt.year
+        dates[:-1][~is_fixed] = parsed_dates.dt.strftime('%Y/%m/%d')
+    return years[codes], dates[codes]
+
+
+def record_invalid_dates(file_info, stage, column, years):
+    """
+    Counts the rows whose dates are given, but could not be parsed, as 'date.invalid' rejections in the run report.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param stage: Name of the stage, e.g. 'clean'.
+    :param column: The column of the dates.
+    :param years: The years parsed from the dates by parse_fixed_format_dates.
+    """
+    invalid_dates = int(np.count_nonzero(np.isnan(years) & column.notna().to_numpy(dtype=bool)))
+    if invalid_dates:
+        record_rejections(file_info['table_name'], stage, {'date.invalid': invalid_dates})
+
+
+def clean_text_column(column, is_numeric=False):
+    """
+    Replaces the wrong entries of a text column with NaN in a single pass. Entries containing '-', 'nan' or '#' and
+    entries equal to '.' become NaN, entries equal to ',' become empty strings. Columns declared with a numeric type
+    are stripped of pound signs and thousands separators and converted to numeric values, entries which are no numbers
+    become NaN. As this only depends on the declared type, every chunk of a file is cleaned alike.
+    Every distinct string is only cleaned once, the results are mapped back onto the rows via the factorized codes.
+    :param column: The column which is to be cleaned.
+    :param is_numeric: Whether the column is declared with a numeric type, see is_numeric_type.
+    :return: The cleaned column.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return clean_categorical_column(column, is_numeric)
+    if column.dtype != object:
+        return column
+    values = column.to_numpy()
+    codes, uniques = pd.factorize(values)
+
+    # The additional last entry belongs to the code -1 of missing values, which are kept as they are
+    is_string = np.array([isinstance(val, str) for val in uniques] + [False])
+    cleaned_uniques = np.empty(len(uniques) + 1, dtype=object)
+    cleaned_uniques[:-1] = [
+        (np.nan if val == '.' or WRONG_ENTRY_PATTERN.search(val) else '' if val == ',' else val)
+        if isinstance(val, str) else val
+        for val in uniques
+    ]
+    if is_numeric:
+        cleaned_uniques[:-1] = [
+            CURRENCY_PATTERN.sub('', val) if isinstance(val, str) else val for val in cleaned_uniques[:-1]
+        ]
+
+    column = pd.Series(np.where(is_string[codes], cleaned_uniques[codes], values), index=column.index, name=column.name)
+    if is_numeric:
+        return pd.to_numeric(column, errors='coerce')
+    return column.infer_objects()
+
+
+def clean_categorical_column(column, is_numeric=False):
+    """
+    Cleans the categories of a categorical column like a text column, the codes of the rows are only remapped.
+    Categories which become NaN or equal to another category are merged accordingly.
+    :param column: The categorical column which is to be cleaned.
+    :param is_numeric: Whether the column is declared with a numeric type, see is_numeric_type.
+    :return: The cleaned categorical column.
+    """
+    categories = clean_text_column(pd.Series(column.cat.categories, dtype=object))
+    if is_numeric or categories.dtype != object:
+        # The values become numbers, e.g. prices with pound signs, the column is cleaned row by row instead
+        return clean_text_column(column.astype(object), is_numeric)
+
+    # The additional last entry belongs to the code -1 of missing values
+    category_codes, cleaned_categories = pd.factorize(categories)
+    codes = np.append(category_codes, -1)[column.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, cleaned_categories), index=column.index, name=column.name)
+
+
+def sqlite_column_type(column, declared_type=None):
+    """
+    :param column: The column for which the SQLite type is determined.
+    :param declared_type: The type declared for the column in the csv_files_info.json.
+    :return: The SQLite type of the column. Text columns are inspected, as they may hold numbers after the cleaning.
+    """
+    dtype = pd.api.types.pandas_dtype(declared_type) if declared_type else column.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        # The rows hold the values of the categories
+        dtype, column = column.cat.categories.dtype, column.cat.categories
+    if dtype.kind in 'iub':
+        return 'INTEGER'
+    if dtype.kind == 'f':
+        return 'REAL'
+    return INFERRED_SQLITE_TYPES.get(pd.api.types.infer_dtype(column, skipna=True), '')
+
+
+@contextlib.contextmanager
+def ingest_journal_mode(engine):
+    """
+    Switches the database into the INGEST_JOURNAL_MODE for a whole load and back into its previous journal mode once
+    the load is done. Every switch checkpoints the database, so the journal mode is not switched per loaded chunk. A
+    connection is kept open meanwhile, as SQLite checkpoints the write-ahead log whenever its last connection closes.
+    :param engine: SQLite database engine.
+    :return: Context manager holding the journal mode for the load.
     """
+    connection = engine.raw_connection()
+    try:
+        # The statements are run to their end, an unfinished statement would keep the database locked
+        previous_journal_mode = connection.execute('PRAGMA journal_mode').fetchall()[0][0]
+        connection.execute(f'PRAGMA journal_mode={INGEST_JOURNAL_MODE}').fetchall()
+        # The connection only keeps the write-ahead log open once it read the database
+        connection.execute('SELECT count(*) FROM sqlite_master').fetchall()
+        try:
+            yield
+        finally:
+            connection.execute(f'PRAGMA journal_mode={previous_journal_mode}').fetchall()
+    finally:
+        connection.close()
+
+
+def create_sqlite_table(df, table_name, engine, column_types=None):
+    """
+    Bulk loads the dataframe into the SQLite database. The table is created from the declared column types and all
+    rows are inserted with prepared executemany calls in batches of INSERT_BATCH_SIZE rows inside one transaction.
+    During the load the INGEST_PRAGMAS are applied, afterwards the previous settings are restored. The journal mode is
+    left to ingest_journal_mode around the whole load.
     :param df: The dataframe for which a table will be created in the SQLite database. Existing ones will be updated.
     :param table_name: Specifies the table_name in the SQLite database.
     :param engine: SQLite database engine.
+    :param column_types: The column types declared in the csv_files_info.json.
     :return:
     """
-    df.to_sql(name=table_name, con=engine, index=False, if_exists='append')
+    column_types = column_types or {}
+    column_definitions = ', '.join(
+        f'"{col}" {sqlite_column_type(df[col], column_types.get(col))}'.rstrip() for col in df.columns
+    )
+    column_names = ', '.join(f'"{col}"' for col in df.columns)
+    placeholders = ', '.join('?' for _ in df.columns)
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        previous_pragmas = {pragma: cursor.execute(f'PRAGMA {pragma}').fetchone()[0] for pragma in INGEST_PRAGMAS}
+        for pragma, value in INGEST_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma}={value}')
+        try:
+            cursor.execute('BEGIN')
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({column_definitions})')
+            rows = df.itertuples(index=False, name=None)
+            insert = f'INSERT INTO "{table_name}" ({column_names}) VALUES ({placeholders})'
+            while batch := list(itertools.islice(rows, INSERT_BATCH_SIZE)):
+                cursor.executemany(insert, batch)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            for pragma, value in previous_pragmas.items():
+                cursor.execute(f'PRAGMA {pragma}={value}')
+    finally:
+        connection.close()
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Retrieve, clean and load the datasets into the SQLite database.')
+    parser.add_argument('--parallel', action='store_true',
+                        help='Read and clean the files in a process pool with a single SQLite writer.')
+    parser.add_argument('--report', default=RUN_REPORT_PATH,
+                        help='Path of the JSON report of the time, memory and rows of every stage of every file.')
+    parser.add_argument('--profile', metavar='DIRECTORY', default=None,
+                        help='Write a cProfile dump of every stage of every file into this directory.')
+    args = parser.parse_args()
+    enable_profiling(args.profile)
+
     kaggle_api = connect_to_kaggle()
 
     # Specify the data directory and the SQLite database engine.
@@ -139,14 +981,28 @@ def main():
     with open('csv_files_info.json', 'r', encoding='utf-8', errors='replace') as file:
         csv_files_info = json.load(file)
 
-    for file_info in csv_files_info:
-        # Process every file specified in the csv_files_info.json.
-        # If the data does not exist locally, it is downloaded from Kaggle first.
-        existing_file = check_file_exists(data_directory, file_info['file_name'])
-        if not existing_file:
-            process_non_existing_file(kaggle_api, engine, data_directory, file_info)
-        if existing_file:
-            process_existing_file(existing_file, engine, file_info)
+    if args.parallel:
+        # Download all missing files first, the import of all files is then run in parallel
+        existing_files = []
+        for file_info in csv_files_info:
+            existing_file = check_file_exists(data_directory, file_info['file_name'])
+            if not existing_file:
+                existing_file = download_non_existing_file(kaggle_api, data_directory, file_info)
+            existing_files.append((existing_file, file_info))
+        process_existing_files_parallel(existing_files, engine)
+    else:
+        for file_info in csv_files_info:
+            # Process every file specified in the csv_files_info.json.
+            # If the data does not exist locally, it is downloaded from Kaggle first.
+            existing_file = check_file_exists(data_directory, file_info['file_name'])
+            if not existing_file:
+                process_non_existing_file(kaggle_api, engine, data_directory, file_info)
+            if existing_file:
+                process_existing_file(existing_file, engine, file_info)
+
+    write_run_report(args.report)
+    dump_profiles()
+    print(f"Run report written to {args.report}")
 
 
 if __name__ == "__main__":
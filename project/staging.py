@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import pandas as pd
+import shutil
+
+from columnar import normalize_mixed_types
+
+STAGING_DIRECTORY_NAME = 'staging'
+STAGING_OPTIONS = ('important_columns', 'chunk_size', 'compact_types', 'year_window', 'parser')
+
+
+def staged_dataset_directory(file_path, file_info, content_hash):
+    """
+    The staged dataset is stored next to the source file. Its name depends on the content of the source file and on
+    the file info entries affecting the parsing, so a changed source file or projection is staged again.
+    :param file_path: The path of the source csv-file.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :param content_hash: Hash of the content of the source file.
+    :return: The directory of the staged dataset.
+    """
+    options = json.dumps({option: file_info.get(option) for option in STAGING_OPTIONS}, sort_keys=True)
+    options_hash = hashlib.sha256(options.encode('utf-8')).hexdigest()
+    return os.path.join(os.path.dirname(file_path), STAGING_DIRECTORY_NAME,
+                        f"{file_info['table_name']}-{content_hash[:16]}-{options_hash[:16]}")
+
+
+def read_staged_dataset(directory, file_info):
+    """
+    Every part of the staged dataset holds one chunk of the source file, with the types inferred when parsing it.
+    The parts are read memory-mapped and projected to the important columns.
+    :param directory: The directory of the staged dataset.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: Generator of dataframes, one per chunk of the source file.
+    """
+    columns = list(dict.fromkeys(file_info['important_columns']))
+    for part in sorted(os.listdir(directory)):
+        yield pd.read_parquet(os.path.join(directory, part), columns=columns, memory_map=True)
+
+
+def stage_dataset(chunks, directory):
+    """
+    Writes every parsed chunk as a Parquet part of the staged dataset, while passing it on. The staged dataset only
+    becomes visible once all chunks were written. Older staged datasets of the same table are removed then.
+    :param chunks: Iterable of the dataframes parsed from the source file.
+    :param directory: The directory of the staged dataset.
+    :return: Generator of the parsed dataframes.
+    """
+    temporary_directory = directory + '.tmp'
+    shutil.rmtree(temporary_directory, ignore_errors=True)
+    os.makedirs(temporary_directory)
+    is_staging = True
+    try:
+        for part, df in enumerate(chunks):
+            # The chunk is passed on as it is staged, so the staged copy matches the parsed file
+            df = normalize_mixed_types(df)
+            if is_staging:
+                try:
+                    df.to_parquet(os.path.join(temporary_directory, f'part-{part:05d}.parquet'), index=False)
+                except (TypeError, ValueError) as e:
+                    print(f"Dataset could not be staged: {e}")
+                    is_staging = False
+            yield df
+        if not is_staging:
+            return
+        os.replace(temporary_directory, directory)
+    finally:
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+
+    staging_directory, dataset_name = os.path.split(directory)
+    table_name = dataset_name.rsplit('-', 2)[0]
+    for stale_dataset in os.listdir(staging_directory):
+        if stale_dataset != dataset_name and stale_dataset.rsplit('-', 2)[0] == table_name:
+            shutil.rmtree(os.path.join(staging_directory, stale_dataset), ignore_errors=True)
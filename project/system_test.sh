@@ -6,23 +6,34 @@ set -e
 # Expected .csv files
 mapfile -t expected_csv_files < <(jq -r '.[].file_name' csv_files_info.json)
 
-# Check if CSV files exist in any sub-folder of data
+# Index the names of all files in any sub-folder of data once, instead of searching the folders for every file
 data_dir="../data"
-all_files_exist=true
+declare -A file_index
+while IFS= read -r -d '' file_name; do
+    file_index["$file_name"]=1
+done < <(find "$data_dir" -type f -printf '%f\0')
 
+all_files_exist=true
 for csv_file in "${expected_csv_files[@]}"; do
-    found_file=$(find "$data_dir" -type f -name "$csv_file")
-    if [ -z "$found_file" ]; then
+    # CSV files downloaded as zip archive are read directly out of the archive
+    if [ -z "${file_index["$csv_file"]}" ] && [ -z "${file_index["$csv_file.zip"]}" ]; then
         echo "Expected CSV file '$csv_file' not found in sub-folders of $data_dir"
         all_files_exist=false
+    else
+        echo "Expected CSV file '$csv_file' found."
     fi
-    echo "Expected CSV file '$csv_file' found."
 done
 
-if [ "$all_files_exist" = true ]; then
-    echo "All expected CSV files exist. System test passed!"
-    exit 0  # Exit with success code
-else
+if [ "$all_files_exist" = false ]; then
     echo "Not all expected CSV files found in sub-folders of $data_dir. System test failed!"
     exit 1  # Exit with failure code
 fi
+
+# Validate the loaded tables on the statistics recorded at ingest time, without scanning the tables
+if ! python table_statistics.py --database "$data_dir/data.sqlite"; then
+    echo "The loaded tables are stale or invalid. System test failed!"
+    exit 1  # Exit with failure code
+fi
+
+echo "All expected CSV files exist and their tables are valid. System test passed!"
+exit 0  # Exit with success code
@@ -0,0 +1,106 @@
+from manifest import STAGING_SUFFIX, drop_table_or_view, write_manifest_entry
+from partitions import create_union_view_statement, list_partitions, partition_table_name
+from table_statistics import (
+    MODIFIED_TABLES_TABLE, STATISTICS_TABLE, create_modification_triggers, create_statistics_tables,
+    delete_table_statistics, merge_table_statistics, write_table_statistics
+)
+
+
+def replace_table(engine, staging_table, entry, statements=(), statistics=None):
+    """
+    Atomically replaces the table of the manifest entry by the staging table and records the entry in one transaction.
+    :param engine: SQLite database engine.
+    :param staging_table: The table holding the freshly ingested data.
+    :param entry: The manifest entry of the ingested file.
+    :param statements: Further SQL statements executed on the replaced table within the same transaction.
+    :param statistics: Statistics of the staging table collected while loading it, which are recorded within the same
+    transaction.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('BEGIN')
+            drop_table_or_view(cursor, entry['table_name'])
+            # The table may have been partitioned before
+            for partition_table in list_partitions(cursor, entry['table_name']).values():
+                cursor.execute(f'DROP TABLE "{partition_table}"')
+                delete_table_statistics(cursor, partition_table)
+            cursor.execute(f'ALTER TABLE "{staging_table}" RENAME TO "{entry["table_name"]}"')
+            for statement in statements:
+                cursor.execute(statement)
+            write_manifest_entry(cursor, entry)
+            if statistics is not None:
+                write_table_statistics(cursor, entry, statistics)
+                create_modification_triggers(cursor, entry['table_name'])
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    finally:
+        connection.close()
+
+
+def replace_partitions(engine, entry, partition_column, columns, statistics, statements=()):
+    """
+    Atomically replaces the partitions of the table of the manifest entry by the staged partitions and records the
+    entry in one transaction. A staged partition with the same row count and checksum as the existing partition is
+    dropped and the existing one is kept, so reloading a file in which a single year changed only swaps the partition
+    of that year. The table itself becomes a view over all partitions.
+    :param engine: SQLite database engine.
+    :param entry: The manifest entry of the ingested file.
+    :param partition_column: The column by which the table is partitioned.
+    :param columns: All columns of the table, in their order.
+    :param statistics: Statistics of the staged partitions collected while loading them, see load_dataset. The
+    statistics of every partition and of the whole table are recorded within the same transaction.
+    :param statements: Further SQL statements executed on the replaced partitions within the same transaction.
+    :return: The values of the swapped partitions.
+    """
+    table_name = entry['table_name']
+    partition_statistics = statistics.get('partitions', {})
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('BEGIN')
+            create_statistics_tables(cursor)
+            drop_table_or_view(cursor, table_name)
+            existing_partitions = list_partitions(cursor, table_name)
+            # Partitions written to after their ingest no longer match their statistics, so none of them is kept
+            cursor.execute(f'SELECT 1 FROM "{MODIFIED_TABLES_TABLE}" WHERE table_name = ?', (table_name,))
+            is_modified = cursor.fetchone() is not None
+            for value, partition_table in existing_partitions.items():
+                if value not in partition_statistics:
+                    cursor.execute(f'DROP TABLE "{partition_table}"')
+                    delete_table_statistics(cursor, partition_table)
+
+            swapped_partitions = []
+            for value, staged_statistics in sorted(partition_statistics.items()):
+                partition_table = partition_table_name(table_name, value)
+                cursor.execute(f'SELECT row_count, checksum FROM "{STATISTICS_TABLE}" WHERE table_name = ?',
+                               (partition_table,))
+                recorded_statistics = cursor.fetchone()
+                staged_checksum = f"{staged_statistics['checksum']:016x}"
+                if value in existing_partitions and not is_modified and \
+                        recorded_statistics == (staged_statistics['row_count'], staged_checksum):
+                    cursor.execute(f'DROP TABLE "{partition_table}{STAGING_SUFFIX}"')
+                else:
+                    cursor.execute(f'DROP TABLE IF EXISTS "{partition_table}"')
+                    cursor.execute(f'ALTER TABLE "{partition_table}{STAGING_SUFFIX}" RENAME TO "{partition_table}"')
+                    swapped_partitions.append(value)
+                write_table_statistics(cursor, {**entry, 'table_name': partition_table}, staged_statistics)
+                create_modification_triggers(cursor, partition_table, table_name)
+
+            cursor.execute(create_union_view_statement(table_name, partition_column, columns,
+                                                       list_partitions(cursor, table_name)))
+            for statement in statements:
+                cursor.execute(statement)
+            write_manifest_entry(cursor, entry)
+            write_table_statistics(cursor, entry, merge_table_statistics(partition_statistics.values()))
+            connection.commit()
+            return swapped_partitions
+        except Exception:
+            connection.rollback()
+            raise
+    finally:
+        connection.close()
@@ -0,0 +1,365 @@
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import sqlalchemy as sql
+import sys
+
+from manifest import MANIFEST_TABLE, file_info_hash
+from partitions import list_partitions
+
+STATISTICS_TABLE = 'table_statistics'
+COLUMN_STATISTICS_TABLE = 'column_statistics'
+# Tables written to after their ingest, recorded by triggers
+MODIFIED_TABLES_TABLE = 'modified_tables'
+
+# Number of the smallest value hashes kept per column to estimate the number of distinct values (k minimum values)
+DISTINCT_SKETCH_SIZE = 1024
+HASH_RANGE = 2 ** 64
+
+
+def new_table_statistics():
+    """
+    :return: Empty statistics of a table, which are updated with every chunk loaded into the table.
+    """
+    return {'row_count': 0, 'checksum': 0, 'columns': {}}
+
+
+def python_value(value):
+    """
+    :param value: Scalar value of a dataframe.
+    :return: The value as Python object, which can be stored in SQLite.
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def value_range(values):
+    """
+    :param values: The values of a column, without missing values.
+    :return: Tuple of the minimum and maximum value. None if the column is empty or its values can not be compared.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Unordered categories have no minimum, the categories present in the column are compared instead
+        values = pd.Series(values.cat.categories[np.unique(values.cat.codes)])
+    if values.empty:
+        return None, None
+    try:
+        return python_value(values.min()), python_value(values.max())
+    except TypeError:
+        return None, None
+
+
+def merge_values(first, second, select):
+    """
+    :param first: A value or None.
+    :param second: A value or None.
+    :param select: Function selecting one of both values, e.g. min.
+    :return: The selected value, or the value which is not None.
+    """
+    if first is None or second is None:
+        return second if first is None else first
+    try:
+        return select(first, second)
+    except TypeError:
+        return None
+
+
+def update_table_statistics(statistics, df):
+    """
+    Updates the statistics by the rows of the dataframe. The checksum is the sum of the hashes of all rows, so it does
+    not depend on how the table is chunked. Distinct values are estimated from the DISTINCT_SKETCH_SIZE smallest
+    hashes of the values of every column, which are exact for columns with less distinct values.
+    :param statistics: The statistics of the table, see new_table_statistics.
+    :param df: Dataframe of rows loaded into the table.
+    """
+    statistics['row_count'] += len(df)
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    statistics['checksum'] = (statistics['checksum'] + int(row_hashes.sum(dtype=np.uint64))) % HASH_RANGE
+    for column in df.columns:
+        column_statistics = statistics['columns'].setdefault(column, {
+            'null_count': 0, 'min_value': None, 'max_value': None, 'hashes': np.empty(0, dtype=np.uint64)
+        })
+        values = df[column].dropna()
+        column_statistics['null_count'] += len(df) - len(values)
+        min_value, max_value = value_range(values)
+        column_statistics['min_value'] = merge_values(column_statistics['min_value'], min_value, min)
+        column_statistics['max_value'] = merge_values(column_statistics['max_value'], max_value, max)
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        if len(column_statistics['hashes']) == DISTINCT_SKETCH_SIZE:
+            # Only hashes smaller than the largest one kept can enter the sketch
+            hashes = hashes[hashes < column_statistics['hashes'][-1]]
+        column_statistics['hashes'] = np.union1d(column_statistics['hashes'], hashes)[:DISTINCT_SKETCH_SIZE]
+
+
+def merge_table_statistics(statistics_list):
+    """
+    :param statistics_list: List of the statistics of several tables with the same columns, e.g. of the partitions of
+    a table, see new_table_statistics.
+    :return: The statistics of the union of the tables.
+    """
+    merged = new_table_statistics()
+    for statistics in statistics_list:
+        merged['row_count'] += statistics['row_count']
+        merged['checksum'] = (merged['checksum'] + statistics['checksum']) % HASH_RANGE
+        for column, column_statistics in statistics['columns'].items():
+            merged_column = merged['columns'].setdefault(column, {
+                'null_count': 0, 'min_value': None, 'max_value': None, 'hashes': np.empty(0, dtype=np.uint64)
+            })
+            merged_column['null_count'] += column_statistics['null_count']
+            merged_column['min_value'] = merge_values(merged_column['min_value'], column_statistics['min_value'], min)
+            merged_column['max_value'] = merge_values(merged_column['max_value'], column_statistics['max_value'], max)
+            merged_column['hashes'] = np.union1d(merged_column['hashes'],
+                                                 column_statistics['hashes'])[:DISTINCT_SKETCH_SIZE]
+    return merged
+
+
+def distinct_estimate(hashes):
+    """
+    :param hashes: The smallest distinct hashes of the values of a column, sorted.
+    :return: The estimated number of distinct values of the column.
+    """
+    if len(hashes) < DISTINCT_SKETCH_SIZE:
+        return len(hashes)
+    return round((DISTINCT_SKETCH_SIZE - 1) * HASH_RANGE / (int(hashes[-1]) + 1))
+
+
+def create_statistics_tables(cursor):
+    """
+    :param cursor: Cursor of a raw SQLite connection.
+    """
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{STATISTICS_TABLE}" (table_name TEXT PRIMARY KEY, row_count INTEGER, '
+        f'checksum TEXT, content_hash TEXT, info_hash TEXT)'
+    )
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{COLUMN_STATISTICS_TABLE}" (table_name TEXT, column_name TEXT, '
+        f'null_count INTEGER, min_value, max_value, distinct_estimate INTEGER, PRIMARY KEY (table_name, column_name))'
+    )
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{MODIFIED_TABLES_TABLE}" (table_name TEXT PRIMARY KEY)')
+
+
+def create_modification_triggers(cursor, table_name, recorded_table_name=None):
+    """
+    Creates triggers recording every insert, update and delete on the table after its ingest, so changed tables are
+    detected without scanning them. Must be called once the table is loaded.
+    :param cursor: Cursor of a raw SQLite connection.
+    :param table_name: The ingested table, e.g. a partition.
+    :param recorded_table_name: The table which is recorded as modified, e.g. the partitioned table. Defaults to the
+    ingested table.
+    """
+    create_statistics_tables(cursor)
+    recorded_table_name = (recorded_table_name or table_name).replace("'", "''")
+    for operation in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS "{table_name}__modified_{operation.lower()}" AFTER {operation} ON '
+            f'"{table_name}" BEGIN INSERT OR IGNORE INTO "{MODIFIED_TABLES_TABLE}" (table_name) '
+            f"VALUES ('{recorded_table_name}'); END"
+        )
+
+
+def write_table_statistics(cursor, entry, statistics):
+    """
+    :param cursor: Cursor of a raw SQLite connection.
+    :param entry: The manifest entry of the ingested file, whose content hash and file info hash are recorded with the
+    statistics. Existing statistics of the same table are replaced.
+    :param statistics: The statistics of the table, see new_table_statistics.
+    """
+    create_statistics_tables(cursor)
+    cursor.execute(
+        f'INSERT OR REPLACE INTO "{STATISTICS_TABLE}" (table_name, row_count, checksum, content_hash, info_hash) '
+        f'VALUES (?, ?, ?, ?, ?)', (entry['table_name'], statistics['row_count'], f"{statistics['checksum']:016x}",
+                                    entry['content_hash'], entry['info_hash'])
+    )
+    cursor.execute(f'DELETE FROM "{COLUMN_STATISTICS_TABLE}" WHERE table_name = ?', (entry['table_name'],))
+    cursor.execute(f'DELETE FROM "{MODIFIED_TABLES_TABLE}" WHERE table_name = ?', (entry['table_name'],))
+    cursor.executemany(
+        f'INSERT INTO "{COLUMN_STATISTICS_TABLE}" (table_name, column_name, null_count, min_value, max_value, '
+        f'distinct_estimate) VALUES (?, ?, ?, ?, ?, ?)',
+        [(entry['table_name'], column, column_statistics['null_count'], column_statistics['min_value'],
+          column_statistics['max_value'], distinct_estimate(column_statistics['hashes']))
+         for column, column_statistics in statistics['columns'].items()]
+    )
+
+
+def delete_table_statistics(cursor, table_name):
+    """
+    :param cursor: Cursor of a raw SQLite connection.
+    :param table_name: The table whose statistics are deleted, e.g. a dropped partition.
+    """
+    cursor.execute(f'DELETE FROM "{STATISTICS_TABLE}" WHERE table_name = ?', (table_name,))
+    cursor.execute(f'DELETE FROM "{COLUMN_STATISTICS_TABLE}" WHERE table_name = ?', (table_name,))
+    cursor.execute(f'DELETE FROM "{MODIFIED_TABLES_TABLE}" WHERE table_name = ?', (table_name,))
+
+
+def fetch_dict(cursor, query, parameters=()):
+    """
+    :param cursor: Cursor of a raw SQLite connection.
+    :param query: SQL query returning at most one row.
+    :param parameters: Parameters of the query.
+    :return: The row as dictionary or None.
+    """
+    cursor.execute(query, parameters)
+    row = cursor.fetchone()
+    return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+
+def table_exists(cursor, table_name):
+    """
+    :param cursor: Cursor of a raw SQLite connection.
+    :param table_name: Name of the table.
+    :return: Whether the table exists, partitioned tables exist as view.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table_name,))
+    return cursor.fetchone() is not None
+
+
+def max_rowid(cursor, table_name):
+    """
+    The rows are inserted into a fresh table at ingest time, so their rowids count up to the row count of the table.
+    Looking up the largest rowid does not scan the table. Partitioned tables sum up the largest rowids of their
+    partitions.
+    :param cursor: Cursor of a raw SQLite connection.
+    :param table_name: Name of the table.
+    :return: The largest rowid of the table, 0 if it is empty.
+    """
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = ?", (table_name,))
+    if cursor.fetchone()[0] == 'view':
+        partition_tables = list_partitions(cursor, table_name).values()
+        return sum(max_rowid(cursor, partition_table) for partition_table in partition_tables)
+    return cursor.execute(f'SELECT MAX(rowid) FROM "{table_name}"').fetchone()[0] or 0
+
+
+def read_table_statistics(engine, table_name):
+    """
+    :param engine: SQLite database engine.
+    :param table_name: The table of which the statistics are read.
+    :return: The statistics recorded at ingest time as dictionary, with the statistics of every column under
+    'columns'. None if no statistics were recorded for the table.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if not table_exists(cursor, STATISTICS_TABLE):
+            return None
+        statistics = fetch_dict(cursor, f'SELECT * FROM "{STATISTICS_TABLE}" WHERE table_name = ?', (table_name,))
+        if statistics is None:
+            return None
+        cursor.execute(f'SELECT * FROM "{COLUMN_STATISTICS_TABLE}" WHERE table_name = ?', (table_name,))
+        names = [column[0] for column in cursor.description]
+        statistics['columns'] = {row[1]: dict(zip(names[2:], row[2:])) for row in cursor.fetchall()}
+        return statistics
+    finally:
+        connection.close()
+
+
+def find_stale_tables(engine, table_names=None):
+    """
+    Checks the ingested tables against their manifest entries and statistics without scanning them. A table is stale
+    if it has no statistics, if its statistics were recorded for another ingest or if rows were inserted, updated or
+    deleted after the ingest, which is recorded by the triggers of create_modification_triggers. Tables ingested
+    before the triggers existed are only checked on their largest rowid, which detects appends and deletes at the
+    end of the table.
+    :param engine: SQLite database engine.
+    :param table_names: The tables which are checked. Defaults to all tables in the ingest manifest.
+    :return: Dictionary mapping every stale table to its problem.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        has_manifest, has_statistics = table_exists(cursor, MANIFEST_TABLE), table_exists(cursor, STATISTICS_TABLE)
+        modified_tables = {row[0] for row in cursor.execute(f'SELECT table_name FROM "{MODIFIED_TABLES_TABLE}"')} \
+            if table_exists(cursor, MODIFIED_TABLES_TABLE) else set()
+        if table_names is None:
+            table_names = [row[0] for row in cursor.execute(f'SELECT table_name FROM "{MANIFEST_TABLE}"')] \
+                if has_manifest else []
+        stale_tables = {}
+        for table_name in table_names:
+            entry = has_manifest and fetch_dict(
+                cursor, f'SELECT * FROM "{MANIFEST_TABLE}" WHERE table_name = ?', (table_name,)
+            )
+            statistics = has_statistics and fetch_dict(
+                cursor, f'SELECT * FROM "{STATISTICS_TABLE}" WHERE table_name = ?', (table_name,)
+            )
+            if not entry or not table_exists(cursor, table_name):
+                stale_tables[table_name] = f"Table '{table_name}' was not ingested"
+            elif not statistics:
+                stale_tables[table_name] = f"Table '{table_name}' has no statistics, it was ingested before they " \
+                                           f"were recorded"
+            elif (statistics['content_hash'], statistics['info_hash']) != (entry['content_hash'], entry['info_hash']):
+                stale_tables[table_name] = f"Statistics of table '{table_name}' were recorded for another ingest"
+            elif table_name in modified_tables or max_rowid(cursor, table_name) != statistics['row_count']:
+                stale_tables[table_name] = f"Table '{table_name}' changed after its ingest"
+        return stale_tables
+    finally:
+        connection.close()
+
+
+def validate_table_statistics(statistics, file_info):
+    """
+    Validates the loaded data against the file info on the statistics recorded at ingest time, without scanning it.
+    :param statistics: The statistics of the table, see read_table_statistics.
+    :param file_info: Information about the file which is to be processed. Retrievable from the csv_files_info.json.
+    :return: List of the problems found.
+    """
+    table_name = file_info['table_name']
+    problems = []
+    if statistics['row_count'] == 0:
+        problems.append(f"Table '{table_name}' is empty")
+    for column in file_info['column_types']:
+        if column not in statistics['columns']:
+            problems.append(f"Column '{column}' of table '{table_name}' was not loaded")
+    for column, column_constraints in file_info.get('constraints', {}).items():
+        column_statistics = statistics['columns'].get(column)
+        if column_statistics is None:
+            continue
+        if column_constraints.get('not_null') and column_statistics['null_count']:
+            problems.append(f"Column '{column}' of table '{table_name}' has {column_statistics['null_count']} nulls")
+        lower_bound, upper_bound = column_constraints.get('range', (None, None))
+        min_value, max_value = column_statistics['min_value'], column_statistics['max_value']
+        if (lower_bound is not None and min_value is not None and min_value < lower_bound) or \
+                (upper_bound is not None and max_value is not None and max_value > upper_bound):
+            problems.append(f"Column '{column}' of table '{table_name}' exceeds the range [{lower_bound}, "
+                            f"{upper_bound}] with [{min_value}, {max_value}]")
+    return problems
+
+
+def check_tables(engine, files_info):
+    """
+    :param engine: SQLite database engine.
+    :param files_info: List of the information about all files. Retrievable from the csv_files_info.json.
+    :return: List of the problems of all tables, see find_stale_tables and validate_table_statistics. Tables ingested
+    with another file info than the current one are reported as well.
+    """
+    stale_tables = find_stale_tables(engine, [file_info['table_name'] for file_info in files_info])
+    problems = list(stale_tables.values())
+    for file_info in files_info:
+        if file_info['table_name'] in stale_tables:
+            continue
+        statistics = read_table_statistics(engine, file_info['table_name'])
+        if statistics['info_hash'] != file_info_hash(file_info):
+            problems.append(f"Table '{file_info['table_name']}' was ingested with another file info")
+        problems += validate_table_statistics(statistics, file_info)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the ingested tables against the statistics recorded at ingest.')
+    parser.add_argument('--database', default='../data/data.sqlite', help='Path of the SQLite database.')
+    args = parser.parse_args()
+    with open('csv_files_info.json', 'r') as file:
+        files_info = json.load(file)
+
+    engine = sql.create_engine(f'sqlite:///{args.database}')
+    problems = check_tables(engine, files_info)
+    for file_info in files_info:
+        statistics = read_table_statistics(engine, file_info['table_name'])
+        if statistics:
+            print(f"Table '{file_info['table_name']}': {statistics['row_count']} rows, "
+                  f"checksum {statistics['checksum']}")
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
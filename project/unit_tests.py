@@ -1,7 +1,27 @@
+import io
+import json
+import os
 import pandas as pd
+import sqlalchemy as sql
+import tempfile
+import threading
 import unittest
+import urllib.request
+import zipfile
 
-from retrieve_data import clean_dataset
+from analysis_server import create_server, server_cache
+from analyse_data import (
+    PLOT_JOBS, QUERY_DICT, create_read_only_engine, plot_path, read_data_frames, render_changed_plot_jobs,
+    shorten_area_names
+)
+from instrumentation import enable_profiling, run_report, write_run_report
+from query_cache import evict_query_cache, read_sql_cached
+from retrieve_data import (
+    check_file_exists, clean_dataset, create_sqlite_table, ingest_journal_mode, invalidate_file_index, load_dataset,
+    process_existing_file, process_existing_files_parallel, read_dataset
+)
+from table_statistics import check_tables, find_stale_tables, read_table_statistics
+from unittest import mock
 
 
 class TestDataTransformation(unittest.TestCase):
@@ -61,5 +81,850 @@ class TestDataTransformation(unittest.TestCase):
         self.assertEqual(True, result.equals(expected_result))
 
 
+class TestFileIndex(unittest.TestCase):
+    def test_lookups_share_one_index_until_invalidated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, 'london-crime'))
+            open(os.path.join(directory, 'london-crime', 'london_crime_by_lsoa.csv.zip'), 'w').close()
+            self.assertEqual(1, len(check_file_exists(directory, 'london_crime_by_lsoa.csv')))
+
+            # Assert that files added afterwards are only found once the index is invalidated
+            open(os.path.join(directory, 'london-crime', 'london_crime_by_lsoa.csv'), 'w').close()
+            self.assertEqual(1, len(check_file_exists(directory, 'london_crime_by_lsoa.csv')))
+            invalidate_file_index(os.path.join(directory, 'london-crime'))
+            self.assertEqual(2, len(check_file_exists(directory, 'london_crime_by_lsoa.csv')))
+            self.assertEqual(1, len(check_file_exists(directory, 'london_crime_by_lsoa.csv', extension='.csv')))
+            invalidate_file_index(directory)
+
+
+class TestChunkedIngest(unittest.TestCase):
+    def test_chunked_ingest_matches_whole_file(self):
+        # Mock file info in the shape of the london_crime_by_lsoa entry
+        mock_file_info = {
+            "file_name": "mock_crime.csv",
+            "table_name": "mock_crime",
+            "important_columns": ["borough", "major_category", "year", "month", "value"],
+            "new_column_names": {
+                "borough": "borough", "major_category": "major_category", "year": "year", "month": "month",
+                "value": "value"
+            },
+            "column_types": {
+                "borough": "object", "major_category": "object", "year": "int64", "month": "int64", "value": "int64"
+            }
+        }
+
+        mock_data = pd.DataFrame({
+            'lsoa_code': ['E01001116'] * 10,
+            'borough': ['Croydon', 'Greenwich', 'Bromley', 'Redbridge', 'Wandsworth', 'Ealing', 'Hounslow',
+                        'Barnet', 'Camden', 'Sutton'],
+            'major_category': ['Burglary', 'Violence Against the Person', 'Robbery', 'Theft and Handling',
+                               'Drugs', 'Burglary', 'Robbery', 'Drugs', 'Theft and Handling', 'Burglary'],
+            'value': [0, 1, 2, 3, '#', 5, 6, 7, 8, 9],
+            'year': [2016, 2012, 2015, 2014, 2014, 2013, 2016, 2015, 2014, 2011],
+            'month': [11, 5, 3, 1, 2, 7, 8, 12, 10, 4]
+        })
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            mock_data.to_csv(csv_path, index=False)
+
+            results = []
+            for chunk_size in (None, 3):
+                engine = sql.create_engine(f"sqlite:///{os.path.join(directory, f'{chunk_size}.sqlite')}")
+                process_existing_file([csv_path], engine, dict(mock_file_info, chunk_size=chunk_size))
+                results.append(pd.read_sql_table(mock_file_info['table_name'], engine))
+                engine.dispose()
+
+        # Assert that the chunked import writes exactly the same table as the whole-file import
+        self.assertEqual(6, len(results[0]))
+        self.assertEqual(True, results[0].equals(results[1]))
+
+    def test_numeric_columns_are_converted_alike_in_every_chunk(self):
+        mock_file_info = {
+            "file_name": "mock_salaries.csv",
+            "table_name": "mock_salaries",
+            "important_columns": ["area", "mean_salary"],
+            "new_column_names": {"area": "area", "mean_salary": "mean_salary"},
+            "column_types": {"area": "object", "mean_salary": "float64"}
+        }
+        mock_data = pd.DataFrame({
+            'area': ['barnet', 'bexley', 'brent', 'camden'], 'mean_salary': ['£23,440', '100', 'abc', '1,500']
+        })
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            mock_data.to_csv(csv_path, index=False)
+
+            results, column_types = [], []
+            for chunk_size in (None, 1):
+                engine = sql.create_engine(f"sqlite:///{os.path.join(directory, f'{chunk_size}.sqlite')}")
+                process_existing_file([csv_path], engine, dict(mock_file_info, chunk_size=chunk_size))
+                results.append(pd.read_sql_table(mock_file_info['table_name'], engine))
+                with engine.connect() as connection:
+                    column_types.append(connection.exec_driver_sql(
+                        'SELECT DISTINCT typeof(mean_salary) FROM mock_salaries'
+                    ).fetchall())
+                engine.dispose()
+
+        # Assert that the chunk holding the pound sign and the chunk holding the text are cleaned alike
+        self.assertEqual([23440.0, 100.0, 1500.0], results[0]['mean_salary'].tolist())
+        self.assertEqual(True, results[0].equals(results[1]))
+        self.assertEqual([[('real',)], [('real',)]], column_types)
+
+
+class TestYearWindow(unittest.TestCase):
+    def test_declared_year_window_is_pushed_down_into_the_read(self):
+        mock_file_info = {
+            "table_name": "mock_dates",
+            "chunk_size": 2,
+            "year_window": [2015, 2016],
+            "important_columns": ["Date", "area"],
+            "new_column_names": {"Date": "date", "area": "area"},
+            "column_types": {"date": "object", "area": "object"}
+        }
+        csv_file = io.StringIO(
+            'Date,area\n2014-12-01,barnet\n2015-01-01,bexley\n2016-1-1,brent\n2017-01-01,camden\n,croydon\n'
+            '2015-02-31,ealing\n2016-02-29,enfield\n2016-2-30,hackney\nsoon,harrow\n'
+        )
+
+        # Assert that rows outside of the window or with dates which do not exist, in the fixed format or not, never
+        # leave the reader and are counted as rejections, while the dates are converted once cleaned, without filtering
+        # the rows again
+        run_report.clear()
+        df = pd.concat(read_dataset(csv_file, mock_file_info)).rename(columns=mock_file_info['new_column_names'])
+        self.assertEqual(['bexley', 'brent', 'enfield'], list(df['area']))
+        self.assertEqual(['2015/01/01', '2016/01/01', '2016/02/29'],
+                         list(clean_dataset(df, mock_file_info, in_year_window=True)['date']))
+        self.assertEqual({'date.invalid': 3}, run_report['mock_dates']['read']['rejections'])
+
+        # Assert that data which was not read through the window is still filtered and counted while cleaning
+        df = pd.DataFrame({'date': ['2015-02-31', '2014-12-01', '2015-03-31', '2016-2-30', 'soon'],
+                           'area': ['ealing', 'barnet', 'bexley', 'hackney', 'harrow']})
+        self.assertEqual(['bexley'], list(clean_dataset(df, mock_file_info)['area']))
+        self.assertEqual({'date.invalid': 3}, run_report['mock_dates']['clean']['rejections'])
+
+
+class TestParserEngines(unittest.TestCase):
+    def test_engines_parse_the_same_and_replace_undecodable_bytes_only_if_allowed(self):
+        mock_file_info = {
+            "file_name": "mock_crime.csv",
+            "table_name": "mock_crime",
+            "year_window": [2014, 2016],
+            "chunk_size": 2,
+            "important_columns": ["borough", "year", "value"],
+            "new_column_names": {"borough": "borough", "year": "year", "value": "value"},
+            "column_types": {"borough": "object", "year": "int64", "value": "int64"},
+            "compact_types": {"borough": "category", "year": "int16"}
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            with open(csv_path, 'wb') as file:
+                file.write(b'borough,year,value\nbarnet,2014,1\nbr\xfcnt,2015,2\nbexley,2013,3\nbarnet,2016,4\n')
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+
+            # Assert that all engines load the same table, in which the undecodable byte is replaced
+            tables = []
+            for parser_engine in ('c', 'pyarrow', 'python'):
+                process_existing_file([csv_path], engine, dict(mock_file_info, parser={'engine': parser_engine}))
+                tables.append(pd.read_sql_table('mock_crime', engine))
+            self.assertEqual(['barnet', 'br\ufffdnt', 'barnet'], list(tables[0]['borough']))
+            self.assertEqual(True, tables[0].equals(tables[1]) and tables[0].equals(tables[2]))
+
+            # Assert that the file is not loaded if undecodable bytes must not be replaced
+            strict_file_info = dict(mock_file_info, parser={'engine': 'pyarrow', 'encoding_errors': 'strict'})
+            process_existing_file([csv_path], engine, strict_file_info)
+            self.assertEqual(3, len(pd.read_sql_table('mock_crime', engine)))
+            engine.dispose()
+
+    def test_arrow_stream_errors_name_wrong_entries_of_typed_columns(self):
+        mock_file_info = {
+            "file_name": "mock_crime.csv",
+            "chunk_size": 100000,
+            "parser": {"engine": "pyarrow", "dtype": {"value": "int64"}},
+            "important_columns": ["borough", "value"],
+            "new_column_names": {"borough": "borough", "value": "value"},
+            "column_types": {"borough": "object", "value": "int64"}
+        }
+
+        # Assert that a wrong entry of a typed column is reported as such, even inside the first block
+        csv_file = io.BytesIO(b'borough,value\nbarnet,1\nbrent,#\n')
+        with self.assertRaisesRegex(ValueError, "not of the type int64 declared for the column 'value'"):
+            list(read_dataset(csv_file, mock_file_info))
+
+        # Assert that only a column without a type is reported to change its type after the first block
+        csv_file = io.BytesIO(b'borough,value\n' + b'1,1\n' * 300000 + b'brent,2\n')
+        with self.assertRaisesRegex(ValueError, 'changed its type after the first block'):
+            list(read_dataset(csv_file, mock_file_info))
+
+    def test_chunks_loaded_before_an_undecodable_byte_are_loaded_once(self):
+        mock_file_info = {
+            "file_name": "mock_crime.csv",
+            "table_name": "mock_crime",
+            "chunk_size": 1000,
+            "important_columns": ["borough", "value"],
+            "new_column_names": {"borough": "borough", "value": "value"},
+            "column_types": {"borough": "object", "value": "int64"}
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            with open(csv_path, 'wb') as file:
+                file.write(b'borough,value\n' + b'barnet,1\n' * 100000 + b'br\xfcnt,2\n')
+
+            # Assert that the strict attempt loaded chunks before failing, which are dropped before parsing again
+            sequential_engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'sequential.sqlite')}")
+            with mock.patch('retrieve_data.load_dataset', wraps=load_dataset) as mock_load_dataset:
+                process_existing_file([csv_path], sequential_engine, mock_file_info)
+            self.assertLess(101, mock_load_dataset.call_count)
+            parallel_engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'parallel.sqlite')}")
+            process_existing_files_parallel([([csv_path], mock_file_info)], parallel_engine, max_workers=1)
+
+            # Assert that every row is loaded exactly once and the undecodable byte is replaced
+            for engine in (sequential_engine, parallel_engine):
+                result = pd.read_sql_table('mock_crime', engine)
+                self.assertEqual(100001, len(result))
+                self.assertEqual('br\ufffdnt', result['borough'].iloc[-1])
+                self.assertEqual(100001, read_table_statistics(engine, 'mock_crime')['row_count'])
+                engine.dispose()
+
+
+class TestZipIngest(unittest.TestCase):
+    def test_csv_is_streamed_out_of_the_zip_archive(self):
+        mock_file_info = {
+            "file_name": "mock%20prices.csv",
+            "table_name": "mock_prices",
+            "chunk_size": 2,
+            "important_columns": ["area", "average_price"],
+            "new_column_names": {"area": "area", "average_price": "mean_house_price"},
+            "column_types": {"area": "object", "mean_house_price": "int64"}
+        }
+        mock_data = pd.DataFrame({'area': ['barnet', 'bexley', 'brent'], 'average_price': [250000, '#', 180000]})
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'mock prices.csv')
+            mock_data.to_csv(csv_path, index=False)
+            zip_path = os.path.join(directory, 'archive', 'mock%20prices.csv.zip')
+            os.makedirs(os.path.dirname(zip_path))
+            with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+                zip_ref.write(csv_path, 'mock prices.csv')
+
+            csv_engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'csv.sqlite')}")
+            process_existing_file([csv_path], csv_engine, mock_file_info)
+            zip_engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'zip.sqlite')}")
+            process_existing_file([zip_path], zip_engine, mock_file_info)
+
+            # Assert that the archive was not extracted and yields the same table as the csv-file
+            self.assertEqual(['mock%20prices.csv.zip', 'staging'], sorted(os.listdir(os.path.dirname(zip_path))))
+            expected_result = pd.read_sql_table('mock_prices', csv_engine)
+            result = pd.read_sql_table('mock_prices', zip_engine)
+            self.assertEqual(True, result.equals(expected_result))
+            csv_engine.dispose()
+            zip_engine.dispose()
+
+    def test_broken_download_is_reported_instead_of_raising(self):
+        mock_file_info = {"file_name": "mock_prices.csv", "table_name": "mock_prices"}
+
+        with tempfile.TemporaryDirectory() as directory:
+            # A download which was interrupted leaves an archive behind which is not a zip archive
+            zip_path = os.path.join(directory, 'mock_prices.csv.zip')
+            open(zip_path, 'w').close()
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+
+            # Assert that the import names the missing file and loads nothing
+            with mock.patch('builtins.print') as mock_print:
+                process_existing_file([zip_path], engine, mock_file_info)
+            self.assertIn('Neither mock_prices.csv nor a zip archive', mock_print.call_args.args[0])
+            self.assertEqual(False, sql.inspect(engine).has_table('mock_prices'))
+            engine.dispose()
+
+
+class TestParallelIngest(unittest.TestCase):
+    def test_parallel_ingest_matches_sequential_ingest(self):
+        mock_files = {
+            'mock_prices': pd.DataFrame({'area': ['barnet', 'bexley', 'brent'], 'average_price': [250000, '#', 1]}),
+            'mock_jobs': pd.DataFrame({'area': ['camden', 'croydon'], 'average_price': ['£1,200', 300]})
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            existing_files = []
+            for table_name, mock_data in mock_files.items():
+                csv_path = os.path.join(directory, f'{table_name}.csv')
+                mock_data.to_csv(csv_path, index=False)
+                existing_files.append(([csv_path], {
+                    "file_name": f'{table_name}.csv',
+                    "table_name": table_name,
+                    "chunk_size": 1,
+                    "important_columns": ["area", "average_price"],
+                    "new_column_names": {"area": "area", "average_price": "mean_house_price"},
+                    "column_types": {"area": "object", "mean_house_price": "int64"}
+                }))
+
+            sequential_engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'sequential.sqlite')}")
+            for existing_file, file_info in existing_files:
+                process_existing_file(existing_file, sequential_engine, file_info)
+            parallel_engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'parallel.sqlite')}")
+            process_existing_files_parallel(existing_files, parallel_engine, max_workers=2)
+
+            # Assert that the parallel import writes the same tables as the sequential import
+            for table_name in mock_files:
+                expected_result = pd.read_sql_table(table_name, sequential_engine)
+                result = pd.read_sql_table(table_name, parallel_engine)
+                self.assertEqual(True, result.equals(expected_result))
+            sequential_engine.dispose()
+            parallel_engine.dispose()
+
+
+class TestStagedIngest(unittest.TestCase):
+    def test_staged_copy_replaces_csv_parsing_and_matches_it(self):
+        mock_file_info = {
+            "file_name": "mock_salaries.csv",
+            "table_name": "mock_salaries",
+            "chunk_size": 2,
+            "important_columns": ["area", "mean_salary", "population_size"],
+            "new_column_names": {"area": "area", "mean_salary": "mean_salary", "population_size": "population_size"},
+            "column_types": {"area": "object", "mean_salary": "float64", "population_size": "int64"}
+        }
+        mock_data = pd.DataFrame({
+            'area': ['barnet', 'bexley', 'brent', 'bromley', 'camden'],
+            'mean_salary': [25755, 22580, 23726, 'nan', '£23,440'],
+            'population_size': [313469, '#', 217458, 294902, 190003]
+        })
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            mock_data.to_csv(csv_path, index=False)
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            process_existing_file([csv_path], engine, mock_file_info)
+            expected_result = pd.read_sql_table('mock_salaries', engine)
+            self.assertEqual(1, len(os.listdir(os.path.join(directory, 'staging'))))
+
+            # Assert that a changed file info re-imports the unchanged file from its staged copy
+            with mock.patch('retrieve_data.read_dataset', side_effect=AssertionError('csv-file parsed again')):
+                process_existing_file([csv_path], engine, dict(mock_file_info, indexes=[['area']]))
+            result = pd.read_sql_table('mock_salaries', engine)
+            engine.dispose()
+
+        self.assertEqual(3, len(result))
+        self.assertEqual(True, result.equals(expected_result))
+
+
+class TestCompactIngest(unittest.TestCase):
+    def test_compact_types_are_kept_and_load_the_same_table(self):
+        mock_file_info = {
+            "file_name": "mock_crime.csv",
+            "table_name": "mock_crime",
+            "chunk_size": 3,
+            "important_columns": ["borough", "major_category", "year", "value"],
+            "new_column_names": {
+                "borough": "borough", "major_category": "major_category", "year": "year", "value": "value"
+            },
+            "column_types": {"borough": "object", "major_category": "object", "year": "int64", "value": "int64"}
+        }
+        compact_types = {"borough": "category", "major_category": "category", "year": "int16", "value": "int32"}
+        mock_data = pd.DataFrame({
+            'borough': ['Croydon', '#', 'Bromley', 'Croydon', 'Ealing', 'Barnet', 'Camden'],
+            'major_category': ['Burglary', 'Drugs', 'Robbery', '-', 'Drugs', 'Burglary', 'Robbery'],
+            'year': [2016, 2015, 2015, 2014, 2014, 2013, 2016],
+            'value': [0, 1, 2, 3, 4, 5, 6]
+        })
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            mock_data.to_csv(csv_path, index=False)
+            results = []
+            for file_info in (mock_file_info, dict(mock_file_info, compact_types=compact_types)):
+                engine = sql.create_engine(f"sqlite:///{os.path.join(directory, f'{len(file_info)}.sqlite')}")
+                process_existing_file([csv_path], engine, file_info)
+                results.append(pd.read_sql_table('mock_crime', engine))
+                engine.dispose()
+
+        # Assert that the categories are cleaned and the compact types survive the cleaning
+        tidy_df = clean_dataset(mock_data.astype(compact_types), dict(mock_file_info, compact_types=compact_types))
+        self.assertEqual(['Croydon', 'Bromley', 'Ealing', 'Camden'], list(tidy_df['borough']))
+        self.assertEqual(compact_types, {col: str(dtype) for col, dtype in tidy_df.dtypes.items()})
+        self.assertEqual(4, len(results[0]))
+        self.assertEqual(True, results[0].equals(results[1]))
+
+    def test_wrong_entries_in_compact_integer_columns_are_dropped(self):
+        mock_file_info = {
+            "file_name": "mock_crime.csv",
+            "table_name": "mock_crime",
+            "important_columns": ["borough", "year", "month", "value"],
+            "new_column_names": {"borough": "borough", "year": "year", "month": "month", "value": "value"},
+            "column_types": {"borough": "object", "year": "int64", "month": "int64", "value": "int64"},
+            "compact_types": {"borough": "category", "year": "int16", "month": "int8", "value": "int32"}
+        }
+        csv_content = 'borough,year,month,value\nCroydon,2016,1,0\nBromley,#,2,1\nEaling,2015,,2\nBarnet,2014,3,.\n' \
+                      'Camden,2015,4,4\n'
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            with open(csv_path, 'w') as file:
+                file.write(csv_content)
+            for engine_name in ('c', 'pyarrow'):
+                engine = sql.create_engine(f"sqlite:///{os.path.join(directory, f'{engine_name}.sqlite')}")
+                file_info = dict(mock_file_info, parser={'engine': engine_name})
+                chunks = list(read_dataset(io.BytesIO(csv_content.encode('utf-8')), file_info))
+                tidy_df = clean_dataset(pd.concat(chunks), file_info)
+                process_existing_file([csv_path], engine, file_info)
+                result = pd.read_sql_table('mock_crime', engine)
+                engine.dispose()
+
+                # Assert that only the rows with wrong entries are dropped and the columns are narrowed afterwards
+                self.assertEqual(['Croydon', 'Camden'], list(result['borough']))
+                self.assertEqual([4], list(result[result['borough'] == 'Camden']['value']))
+                self.assertEqual(mock_file_info['compact_types'],
+                                 {col: str(dtype) for col, dtype in tidy_df.dtypes.items()})
+
+    def test_values_outside_of_compact_integer_types_are_rejected(self):
+        mock_file_info = {
+            "file_name": "mock_crime.csv",
+            "table_name": "mock_crime",
+            "important_columns": ["borough", "year", "month", "value"],
+            "new_column_names": {"borough": "borough", "year": "year", "month": "month", "value": "value"},
+            "column_types": {"borough": "object", "year": "int64", "month": "int64", "value": "int64"},
+            "compact_types": {"borough": "category", "year": "int16", "month": "int8", "value": "uint8"}
+        }
+        mock_data = pd.DataFrame({
+            'borough': ['Croydon', 'Bromley', 'Ealing', 'Barnet', 'Camden'],
+            'year': [2016, 2015, 2015, 2014, 2015],
+            'month': [1, 300, 2, -129, 127],
+            'value': [0, 1, 256, 3, 255]
+        })
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            mock_data.to_csv(csv_path, index=False)
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            run_report.clear()
+            process_existing_file([csv_path], engine, mock_file_info)
+            result = pd.read_sql_table('mock_crime', engine)
+            engine.dispose()
+
+        # Assert that values which would wrap around when narrowed are rejected and counted instead of stored
+        self.assertEqual(['Croydon', 'Camden'], list(result['borough']))
+        self.assertEqual([1, 127], list(result['month']))
+        self.assertEqual([0, 255], list(result['value']))
+        self.assertEqual({'year.type_range': 0, 'month.type_range': 2, 'value.type_range': 1},
+                         run_report['mock_crime']['clean']['rejections'])
+
+
+class TestDerivedTables(unittest.TestCase):
+    def test_indexes_and_summary_table_are_built_at_ingest(self):
+        mock_file_info = {
+            "file_name": "mock_crime.csv",
+            "table_name": "mock_crime",
+            "important_columns": ["borough", "major_category", "year", "value"],
+            "new_column_names": {"borough": "borough", "major_category": "major_category", "year": "year",
+                                 "value": "value"},
+            "column_types": {"borough": "object", "major_category": "object", "year": "int64", "value": "int64"},
+            "indexes": [["borough", "major_category"]],
+            "summary_table": {"table_name": "mock_crime_summary", "group_by": ["borough", "year"], "sum": ["value"]}
+        }
+        mock_data = pd.DataFrame({
+            'borough': ['Barnet', 'Barnet', 'Barnet', 'Camden'],
+            'major_category': ['Burglary', 'Robbery', 'Burglary', 'Drugs'],
+            'year': [2014, 2014, 2015, 2015],
+            'value': [1, 2, 3, 4]
+        })
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            mock_data.to_csv(csv_path, index=False)
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            process_existing_file([csv_path], engine, mock_file_info)
+            summary = pd.read_sql_query('SELECT * FROM mock_crime_summary ORDER BY borough, year', engine)
+            indexes = pd.read_sql_query("SELECT name FROM sqlite_master WHERE type = 'index'", engine)['name']
+            engine.dispose()
+
+        expected_summary = pd.DataFrame({'borough': ['Barnet', 'Barnet', 'Camden'], 'year': [2014, 2015, 2015],
+                                         'value': [3, 3, 4]})
+        self.assertEqual(True, summary.equals(expected_summary))
+        self.assertEqual(['idx_mock_crime_borough_major_category', 'idx_mock_crime_summary_borough_year'],
+                         sorted(name for name in indexes if name.startswith('idx_')))
+
+
+class TestIncrementalIngest(unittest.TestCase):
+    def test_rerun_skips_unchanged_and_replaces_changed_files(self):
+        mock_file_info = {
+            "file_name": "mock_prices.csv",
+            "table_name": "mock_prices",
+            "important_columns": ["area", "average_price"],
+            "new_column_names": {"area": "area", "average_price": "mean_house_price"},
+            "column_types": {"area": "object", "mean_house_price": "int64"}
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            mock_data = pd.DataFrame({'area': ['barnet', 'bexley'], 'average_price': [250000, 180000]})
+            mock_data.to_csv(csv_path, index=False)
+
+            # Assert that a rerun on the same file does not duplicate rows
+            process_existing_file([csv_path], engine, mock_file_info)
+            process_existing_file([csv_path], engine, mock_file_info)
+            self.assertEqual(2, len(pd.read_sql_table('mock_prices', engine)))
+
+            # Assert that a changed file replaces the table
+            pd.DataFrame({'area': ['brent'], 'average_price': [300000]}).to_csv(csv_path, index=False)
+            process_existing_file([csv_path], engine, mock_file_info)
+            self.assertEqual(['brent'], pd.read_sql_table('mock_prices', engine)['area'].tolist())
+            engine.dispose()
+
+
+class TestTableStatistics(unittest.TestCase):
+    def test_statistics_are_recorded_at_ingest_and_detect_changed_tables(self):
+        mock_file_info = {
+            "file_name": "mock_prices.csv",
+            "table_name": "mock_prices",
+            "important_columns": ["area", "average_price"],
+            "new_column_names": {"area": "area", "average_price": "mean_house_price"},
+            "column_types": {"area": "object", "mean_house_price": "int64"},
+            "constraints": {"mean_house_price": {"range": [0, 1000000]}}
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            pd.DataFrame({
+                'area': ['barnet', 'bexley', 'barnet', None], 'average_price': [250000, 180000, '#', 300000]
+            }).to_csv(csv_path, index=False)
+            process_existing_file([csv_path], engine, mock_file_info)
+
+            # Assert that the statistics describe the loaded rows
+            statistics = read_table_statistics(engine, 'mock_prices')
+            self.assertEqual(len(pd.read_sql_table('mock_prices', engine)), statistics['row_count'])
+            self.assertEqual({'null_count': 0, 'min_value': 'barnet', 'max_value': 'bexley', 'distinct_estimate': 2},
+                             statistics['columns']['area'])
+            self.assertEqual((180000, 250000), (statistics['columns']['mean_house_price']['min_value'],
+                                                statistics['columns']['mean_house_price']['max_value']))
+            self.assertEqual({}, find_stale_tables(engine))
+            self.assertEqual([], check_tables(engine, [mock_file_info]))
+
+            # Assert that another file info and rows updated after the ingest are detected
+            self.assertEqual(["Table 'mock_prices' was ingested with another file info"],
+                             check_tables(engine, [dict(mock_file_info, year_window=[2014, 2016])]))
+            with engine.begin() as connection:
+                connection.execute(sql.text('UPDATE mock_prices SET mean_house_price = 999'))
+            self.assertEqual(['mock_prices'], list(find_stale_tables(engine)))
+            engine.dispose()
+
+
+class TestPartitionedIngest(unittest.TestCase):
+    def test_reingest_only_swaps_changed_partitions(self):
+        mock_file_info = {
+            "file_name": "mock_crime.csv",
+            "table_name": "mock_crime",
+            "partition_by": "year",
+            "important_columns": ["borough", "year", "value"],
+            "new_column_names": {"borough": "borough", "year": "year", "value": "value"},
+            "column_types": {"borough": "object", "year": "int64", "value": "int64"},
+            "indexes": [["borough"]]
+        }
+        mock_data = pd.DataFrame({
+            'borough': ['Barnet', 'Camden', 'Barnet', 'Camden', 'Barnet'], 'year': [2014, 2014, 2015, 2015, 2016],
+            'value': [1, 2, 3, 4, 5]
+        })
+        query = 'SELECT * FROM mock_crime WHERE year = 2015 ORDER BY borough'
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            mock_data.to_csv(csv_path, index=False)
+            process_existing_file([csv_path], engine, mock_file_info)
+            with engine.connect() as connection:
+                tables = connection.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'mock_crime%' ORDER BY name"
+                ).scalars().all()
+
+            # Assert that the view over the partitions answers queries like the table itself
+            self.assertEqual(['mock_crime__2014', 'mock_crime__2015', 'mock_crime__2016'], tables)
+            self.assertEqual(mock_data[mock_data['year'] == 2015].values.tolist(),
+                             pd.read_sql_query(query, engine).values.tolist())
+            self.assertEqual(5, read_table_statistics(engine, 'mock_crime')['row_count'])
+            self.assertEqual({}, find_stale_tables(engine))
+
+            # Assert that only the partition of the changed year is swapped
+            mock_data.loc[mock_data['year'] == 2015, 'value'] += 10
+            mock_data.to_csv(csv_path, index=False)
+            with mock.patch('builtins.print') as mock_print:
+                process_existing_file([csv_path], engine, mock_file_info)
+            mock_print.assert_any_call('Swapped 1 of 3 partitions of mock_crime, the others are unchanged.')
+            self.assertEqual([13, 14], pd.read_sql_query(query, engine)['value'].tolist())
+            self.assertEqual({}, find_stale_tables(engine))
+
+            # Assert that rows deleted from a partition are detected
+            with engine.begin() as connection:
+                connection.execute(sql.text('DELETE FROM mock_crime__2014 WHERE rowid = 1'))
+            self.assertEqual(['mock_crime'], list(find_stale_tables(engine)))
+            engine.dispose()
+
+
+class TestBulkLoader(unittest.TestCase):
+    def test_table_is_created_from_declared_types(self):
+        mock_data = pd.DataFrame({
+            'area_name': ['Barnet', 'Bexley', 'Camden'],
+            'gross_annual_pay': [33020.0, 21480.0, 19568.0],
+            'number_of_cars': [145.0, 110.0, 60.0]
+        })
+        column_types = {'area_name': 'object', 'gross_annual_pay': 'object', 'number_of_cars': 'int64'}
+
+        with tempfile.TemporaryDirectory() as directory:
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            with ingest_journal_mode(engine):
+                create_sqlite_table(mock_data, 'mock_profiles', engine, column_types)
+                load_wal_exists = os.path.exists(os.path.join(directory, 'data.sqlite-wal'))
+                create_sqlite_table(mock_data, 'mock_profiles', engine, column_types)
+            with engine.connect() as connection:
+                table_info = connection.exec_driver_sql('PRAGMA table_info(mock_profiles)').fetchall()
+                journal_mode = connection.exec_driver_sql('PRAGMA journal_mode').scalar()
+            result = pd.read_sql_table('mock_profiles', engine)
+            engine.dispose()
+            wal_exists = os.path.exists(os.path.join(directory, 'data.sqlite-wal'))
+
+        # Assert that declared types are used and text columns holding numbers are not stored as text
+        self.assertEqual(['TEXT', 'REAL', 'INTEGER'], [column[2] for column in table_info])
+        self.assertEqual([33020.0, 21480.0, 19568.0] * 2, result['gross_annual_pay'].tolist())
+        self.assertEqual([145, 110, 60] * 2, result['number_of_cars'].tolist())
+
+        # Assert that the write-ahead log is kept between the loaded chunks, but not left behind once the load is done
+        self.assertEqual(True, load_wal_exists)
+        self.assertEqual('delete', journal_mode)
+        self.assertEqual(False, wal_exists)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_run_report_and_profiles_are_written_per_stage(self):
+        mock_file_info = {
+            "file_name": "mock_prices.csv",
+            "table_name": "mock_prices",
+            "chunk_size": 2,
+            "important_columns": ["area", "average_price"],
+            "new_column_names": {"area": "area", "average_price": "mean_house_price"},
+            "column_types": {"area": "object", "mean_house_price": "int64"}
+        }
+        mock_data = pd.DataFrame({'area': ['barnet', 'bexley', 'brent'], 'average_price': [250000, '#', 180000]})
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            mock_data.to_csv(csv_path, index=False)
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            run_report.clear()
+            enable_profiling(os.path.join(directory, 'profiles'))
+            try:
+                process_existing_files_parallel([([csv_path], mock_file_info)], engine, max_workers=1)
+            finally:
+                enable_profiling(None)
+            engine.dispose()
+            write_run_report(os.path.join(directory, 'report.json'))
+            with open(os.path.join(directory, 'report.json'), 'r', encoding='utf-8') as file:
+                stages = json.load(file)['tables']['mock_prices']
+            profiled_stages = {file.split('.')[1] for file in os.listdir(os.path.join(directory, 'profiles'))}
+
+        # Assert that the rows are counted through the stages run by the worker and by the writer
+        self.assertEqual({'check', 'read', 'clean', 'load', 'statistics', 'replace'}, set(stages))
+        self.assertEqual(3, stages['read']['rows_out'])
+        self.assertEqual((3, 2), (stages['clean']['rows_in'], stages['clean']['rows_out']))
+        self.assertEqual(2, stages['load']['rows_out'])
+        self.assertEqual({'read', 'clean'}, profiled_stages)
+
+
+class TestConstraints(unittest.TestCase):
+    def test_declared_constraints_reject_rows_and_count_them_per_rule(self):
+        mock_file_info = {
+            "file_name": "mock_prices.csv",
+            "table_name": "mock_prices",
+            "chunk_size": 2,
+            "important_columns": ["area", "kind", "average_price"],
+            "new_column_names": {"area": "area", "kind": "kind", "average_price": "mean_house_price"},
+            "column_types": {"area": "object", "kind": "object", "mean_house_price": "int64"},
+            "constraints": {
+                "area": {"not_null": True, "pattern": "^[a-z]+$"},
+                "kind": {"allowed_values": ["flat", "house"]},
+                "mean_house_price": {"range": [0, 1000000]}
+            }
+        }
+        mock_data = pd.DataFrame({
+            'area': ['barnet', 'Bexley', None, 'camden', 'croydon', 'ealing'],
+            'kind': ['flat', 'house', 'flat', 'castle', 'house', 'flat'],
+            'average_price': [250000, 180000, 310000, 2000000, -1, 420000]
+        })
+
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, mock_file_info['file_name'])
+            mock_data.to_csv(csv_path, index=False)
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            run_report.clear()
+            process_existing_files_parallel([([csv_path], mock_file_info)], engine, max_workers=1)
+            result = pd.read_sql_table('mock_prices', engine)
+            engine.dispose()
+
+        # Assert that the rejections counted by the worker reach the run report of the writer
+        self.assertEqual(['barnet', 'ealing'], list(result['area']))
+        self.assertEqual({
+            'area.not_null': 1, 'area.pattern': 1, 'kind.allowed_values': 1, 'mean_house_price.range': 2
+        }, run_report['mock_prices']['clean']['rejections'])
+
+
+class TestQueryCache(unittest.TestCase):
+    def test_results_are_cached_until_the_database_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_directory = os.path.join(directory, 'query_cache')
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            create_sqlite_table(pd.DataFrame({'area': ['barnet'], 'value': [1]}), 'mock_table', engine)
+
+            expected_result = read_sql_cached(engine, 'SELECT * FROM mock_table', cache_directory)
+            result = read_sql_cached(engine, '  SELECT *\n FROM mock_table;', cache_directory)
+            self.assertEqual(True, result.equals(expected_result))
+            self.assertEqual(1, len(os.listdir(cache_directory)))
+
+            # Assert that a write to the database invalidates the cached result
+            create_sqlite_table(pd.DataFrame({'area': ['bexley'], 'value': [2]}), 'mock_table', engine)
+            self.assertEqual(2, len(read_sql_cached(engine, 'SELECT * FROM mock_table', cache_directory)))
+
+            # Assert that results exceeding the maximum cache size are evicted
+            evict_query_cache(cache_directory, max_bytes=0)
+            self.assertEqual([], os.listdir(cache_directory))
+
+            # Assert that a result evicted by another process between lookup and read is queried again
+            read_sql_cached(engine, 'SELECT * FROM mock_table', cache_directory)
+            with mock.patch('query_cache.pd.read_feather', side_effect=FileNotFoundError):
+                self.assertEqual(2, len(read_sql_cached(engine, 'SELECT * FROM mock_table', cache_directory)))
+            self.assertEqual(1, len(os.listdir(cache_directory)))
+            engine.dispose()
+
+    def test_results_mixing_types_are_cached_as_text(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_directory = os.path.join(directory, 'query_cache')
+            engine = sql.create_engine(f"sqlite:///{os.path.join(directory, 'data.sqlite')}")
+            with engine.begin() as connection:
+                # A column without type affinity keeps the type of every inserted value
+                connection.exec_driver_sql('CREATE TABLE mock_table (area TEXT, value)')
+                connection.exec_driver_sql("INSERT INTO mock_table VALUES ('barnet', 1), ('bexley', 'x'), "
+                                           "('brent', NULL), ('bromley', 2.5)")
+
+            expected_result = read_sql_cached(engine, 'SELECT * FROM mock_table', cache_directory)
+            result = read_sql_cached(engine, 'SELECT * FROM mock_table', cache_directory)
+            cached_results = os.listdir(cache_directory)
+            engine.dispose()
+
+        # Assert that the mixed column is cached and returned as text, with its missing values kept
+        self.assertEqual(1, len(cached_results))
+        self.assertEqual(['1', 'x', None, '2.5'], list(expected_result['value']))
+        self.assertEqual(True, result.equals(expected_result))
+
+
+class TestQueryPlanner(unittest.TestCase):
+    def test_queries_over_one_table_are_answered_from_one_scan(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, 'data.sqlite')
+            create_sqlite_table(pd.DataFrame({
+                'area_name': ['Kensington and Chelsea', 'Barnet', 'Camden', 'Ealing'],
+                'score': [2.0, 1.0, None, 1.0],
+                'pay': [300, 100, 200, 400]
+            }), 'mock_profiles', sql.create_engine(f'sqlite:///{database_path}'))
+            queries = {
+                'score_query': 'SELECT area_name, score FROM mock_profiles ORDER BY score',
+                'pay_query': 'SELECT pay, area_name FROM mock_profiles ORDER BY pay DESC',
+                'count_query': 'SELECT COUNT(*) AS areas FROM mock_profiles'
+            }
+            executed_queries = []
+
+            def read_sql(engine, query):
+                executed_queries.append(query)
+                return pd.read_sql_query(query, engine)
+
+            engine = create_read_only_engine(database_path, pool_size=2)
+            with mock.patch.dict(QUERY_DICT, queries, clear=True), mock.patch('analyse_data.read_sql', read_sql):
+                data_frames = read_data_frames(engine, list(queries), max_workers=2)
+
+            # Assert that the two queries over the table share one scan and match the results of SQLite
+            self.assertEqual(['SELECT COUNT(*) AS areas FROM mock_profiles', 'SELECT area_name, score, pay FROM '
+                              'mock_profiles'], sorted(executed_queries))
+            for key, query in queries.items():
+                expected_result = pd.read_sql_query(query, engine)
+                if 'area_name' in expected_result:
+                    expected_result['area_name'] = shorten_area_names(expected_result['area_name'])
+                pd.testing.assert_frame_equal(expected_result, data_frames[key])
+            self.assertEqual(['Camden', 'Barnet', 'Ealing', 'Kensington a..'],
+                             list(data_frames['score_query']['area_name']))
+            engine.dispose()
+
+
+def render_mock_plot(mock_data):
+    path = plot_path(f"Mock Plot {mock_data['value'].sum()}")
+    with open(path, 'w') as file:
+        file.write(mock_data.to_csv())
+    return path
+
+
+class TestPlotCache(unittest.TestCase):
+    def test_only_plots_with_changed_data_are_rendered_again(self):
+        with tempfile.TemporaryDirectory() as directory:
+            mock_data = pd.DataFrame({'area_name': ['Barnet', 'Ealing'], 'value': [1, 2]})
+            plot_jobs = {'first_mock': (render_mock_plot, ('mock',)), 'second_mock': (render_mock_plot, ('other',))}
+            with mock.patch.dict(PLOT_JOBS, plot_jobs, clear=True), mock.patch('analyse_data.PLOTS_DIRECTORY',
+                                                                               directory):
+                data_frames = {'mock': mock_data, 'other': mock_data.head(1)}
+                self.assertEqual(['first_mock', 'second_mock'],
+                                 render_changed_plot_jobs(list(PLOT_JOBS), data_frames, max_workers=1))
+                self.assertEqual([], render_changed_plot_jobs(list(PLOT_JOBS), data_frames, max_workers=1))
+
+                # Assert that only the plot of the changed data frame is rendered again and its old plot is removed
+                data_frames['mock'] = data_frames['mock'].assign(value=[1, 5])
+                self.assertEqual(['first_mock'], render_changed_plot_jobs(list(PLOT_JOBS), data_frames, max_workers=1))
+                self.assertEqual(
+                    ['Mock_Plot_1.png', 'Mock_Plot_6.png', 'plot_manifest.json', 'plot_manifest.json.lock'],
+                    sorted(os.listdir(directory))
+                )
+
+
+class TestAnalysisServer(unittest.TestCase):
+    def test_results_are_served_from_memory_until_the_database_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, 'data.sqlite')
+            writer_engine = sql.create_engine(f'sqlite:///{database_path}')
+            create_sqlite_table(pd.DataFrame({'area_name': ['Barnet', 'Ealing'], 'value': [1, 2]}), 'mock_profiles',
+                                writer_engine)
+            executed_queries = []
+
+            def read_sql(engine, query):
+                executed_queries.append(query)
+                return pd.read_sql_query(query, engine)
+
+            engine = create_read_only_engine(database_path, pool_size=1)
+            with mock.patch.dict(QUERY_DICT, {'mock_query': 'SELECT * FROM mock_profiles'}, clear=True), \
+                    mock.patch.dict(PLOT_JOBS, {'mock': (render_mock_plot, ('mock',))}, clear=True), \
+                    mock.patch.dict(server_cache, {'database_fingerprint': None, 'data_frames': {}, 'plots': {}}), \
+                    mock.patch('analyse_data.read_sql', read_sql), \
+                    mock.patch('analyse_data.PLOTS_DIRECTORY', directory), \
+                    mock.patch('analysis_server.PLOTS_DIRECTORY', directory):
+                server = create_server(engine, port=0)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+
+                def get(path):
+                    with urllib.request.urlopen(f'http://127.0.0.1:{server.server_port}{path}') as response:
+                        return response.read()
+
+                try:
+                    self.assertEqual([{'area_name': 'Barnet', 'value': 1}, {'area_name': 'Ealing', 'value': 2}],
+                                     json.loads(get('/datasets/mock')))
+                    self.assertEqual(get('/plots/mock'), get('/plots/mock'))
+                    self.assertEqual(1, len(executed_queries))
+
+                    # Assert that the results are read again once the database changed
+                    with writer_engine.begin() as connection:
+                        connection.execute(sql.text("INSERT INTO mock_profiles VALUES ('Brent', 3)"))
+                    self.assertIn(b'Brent', get('/datasets/mock?format=csv'))
+                    self.assertEqual(2, len(executed_queries))
+                    self.assertIn(b'Brent', get('/plots/mock'))
+                finally:
+                    server.shutdown()
+                    server.server_close()
+            engine.dispose()
+            writer_engine.dispose()
+
+
 if __name__ == '__main__':
     unittest.main()